@@ -0,0 +1,229 @@
+# External Imports
+import json
+import os
+from typing import Dict, Optional, Set
+
+# Internal Imports
+from utils.file_hash import FileHash
+
+
+class BulkRenamer(object):
+    """
+    A collision-safe, crash-safe renamer of many files in one folder.
+    The full mapping is planned first, with colliding targets resolved deterministically, and written to a journal.
+    The files are then moved to temporary names and from there to their targets, so renames never overwrite
+    each other (even for swaps and cycles). A run interrupted at any point can be replayed or rolled back
+    from the journal
+    """
+    journal_filename: str = ".rename_journal.json"
+    temp_prefix: str = ".renaming-"
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def is_same_content(folder_path: str, filename: str, other_filename: str, sha256s: Dict[str, str]) -> bool:
+        """
+        Checks if two files of a folder have the same content, comparing their sizes before hashing them
+        :param folder_path: The folder the files are in
+        :param filename: The first filename
+        :param other_filename: The second filename
+        :param sha256s: The content hashes computed so far by filename, updated in place
+        :return: True if both are files with the same content
+        """
+        path: str = os.path.join(folder_path, filename)
+        other_path: str = os.path.join(folder_path, other_filename)
+        if not os.path.isfile(path) or not os.path.isfile(other_path) \
+                or os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+        for name in (filename, other_filename):
+            if name not in sha256s:
+                sha256s[name] = FileHash.get_sha256(os.path.join(folder_path, name))
+        return sha256s[filename] == sha256s[other_filename]
+
+    @staticmethod
+    def plan(
+            folder_path: str,
+            new_stems: Dict[str, Optional[str]],
+            extension: str = ".jpg",
+            duplicates: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, str]:
+        """
+        Plans the renames of a folder.
+        Files are assigned their targets in sorted filename order, a target that is already taken
+        (by a file that stays, or by an earlier file of the plan) gets a '_2', '_3', ... suffix
+        :param folder_path: The folder the files are in
+        :param new_stems: A dict mapping filenames to their new name without the extension (None keeps the name)
+        :param extension: The extension of the new names
+        :param duplicates: A duplicates manifest (see ContentStore.load_duplicates), updated in place (Optional).
+                           If given, a file whose target is taken by a file with the same content is not renamed,
+                           and is recorded as a duplicate of that file (under its current name) instead
+        :return: A dict mapping every filename that changes to its new filename
+        """
+        assert os.path.isdir(folder_path), f'folder_path is not a directory, got {folder_path}'
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        new_filename: str
+        i: int
+        canonical: Optional[str]
+
+        moving: Set[str] = {filename for filename, stem in new_stems.items() if stem}
+        taken: Set[str] = set(os.listdir(folder_path)) - moving
+
+        # The current name of the file every taken target belongs to, to compare contents with
+        holders: Dict[str, str] = {filename: filename for filename in taken}
+        sha256s: Dict[str, str] = {}
+
+        renames: Dict[str, str] = {}
+        for filename in sorted(moving):
+            new_filename = f"{new_stems[filename]}{extension}"
+            i = 1
+            canonical = None
+            while new_filename in taken:
+                if duplicates is not None and BulkRenamer.is_same_content(folder_path, filename,
+                                                                          holders[new_filename], sha256s):
+                    canonical = duplicates.get(holders[new_filename], holders[new_filename])
+                    break
+                i += 1
+                new_filename = f"{new_stems[filename]}_{i}{extension}"
+            if canonical is not None:
+                duplicates[filename] = canonical
+                continue
+            taken.add(new_filename)
+            holders[new_filename] = filename
+            if new_filename != filename:
+                renames[filename] = new_filename
+        return renames
+
+    @classmethod
+    def get_journal_path(cls, folder_path: str) -> str:
+        """
+        Returns the path of the rename journal of a folder
+        :param folder_path: The folder
+        :return: The journal path
+        """
+        return os.path.join(folder_path, cls.journal_filename)
+
+    @classmethod
+    def load_journal(cls, folder_path: str) -> Optional[Dict]:
+        """
+        Loads the rename journal of a folder
+        :param folder_path: The folder
+        :return: A dict with the keys 'state' and 'renames' (a list of [filename, temporary filename, new filename]),
+                 None if there is no journal. The state is the phase the renames are in: 'planned', 'staged'
+                 (all files at temporary names), 'done', and when rolling back 'unstaging', 'unstaged', 'rolled_back'
+        """
+        journal_path: str = cls.get_journal_path(folder_path)
+        if not os.path.isfile(journal_path):
+            return None
+        with open(journal_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def save_journal(cls, folder_path: str, journal: Dict) -> None:
+        """
+        Saves the rename journal of a folder atomically, flushed to disk before any file is moved
+        :param folder_path: The folder
+        :param journal: The journal, see load_journal
+        :return: None
+        """
+        journal_path: str = cls.get_journal_path(folder_path)
+        with open(f"{journal_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(journal, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{journal_path}.tmp", journal_path)
+
+    @staticmethod
+    def move(folder_path: str, filename: str, new_filename: str) -> bool:
+        """
+        Moves a file unless it was moved already, never overwriting an existing file.
+        Within a phase of a journal, a missing file whose new name exists was already moved
+        :param folder_path: The folder
+        :param filename: The current filename
+        :param new_filename: The new filename
+        :return: True if the file was moved now, False if it is already at new_filename
+        """
+        path: str = os.path.join(folder_path, filename)
+        new_path: str = os.path.join(folder_path, new_filename)
+        if not os.path.lexists(path) and os.path.lexists(new_path):
+            return False
+        if os.path.lexists(new_path):
+            raise FileExistsError(f"Cannot rename '{filename}' to '{new_filename}', the target exists")
+        os.rename(path, new_path)
+        return True
+
+    @classmethod
+    def apply(cls, folder_path: str, renames: Dict[str, str]) -> None:
+        """
+        Applies planned renames through temporary names, journaling them first
+        :param folder_path: The folder the files are in
+        :param renames: A dict mapping filenames to new filenames, see plan
+        :return: None
+        """
+        journal: Optional[Dict] = cls.load_journal(folder_path)
+        assert journal is None or journal['state'] in ('done', 'rolled_back'), \
+            f'{folder_path} has an unfinished rename journal, replay or roll it back first'
+
+        journal = {
+            'state': 'planned',
+            'renames': [[filename, f"{cls.temp_prefix}{i}-{filename}", new_filename]
+                        for i, (filename, new_filename) in enumerate(sorted(renames.items()))],
+        }
+        cls.save_journal(folder_path, journal)
+        cls.replay(folder_path)
+
+    @classmethod
+    def replay(cls, folder_path: str) -> bool:
+        """
+        Completes the renames of the folder's journal. The journal records which phase was completed,
+        and every step of a phase is skipped if it was done already, so an interrupted run is finished by replaying it
+        :param folder_path: The folder
+        :return: True if an unfinished journal was replayed
+        """
+        journal: Optional[Dict] = cls.load_journal(folder_path)
+        if journal is None or journal['state'] not in ('planned', 'staged'):
+            return False
+
+        # Phase 1 frees all targets
+        if journal['state'] == 'planned':
+            for filename, temp_filename, _ in journal['renames']:
+                cls.move(folder_path, filename, temp_filename)
+            journal['state'] = 'staged'
+            cls.save_journal(folder_path, journal)
+
+        # Phase 2 moves every file to its target
+        for _, temp_filename, new_filename in journal['renames']:
+            cls.move(folder_path, temp_filename, new_filename)
+        journal['state'] = 'done'
+        cls.save_journal(folder_path, journal)
+        return True
+
+    @classmethod
+    def rollback(cls, folder_path: str) -> bool:
+        """
+        Reverts the renames of the folder's journal, whether they were completed or interrupted
+        (a rollback can be interrupted and rolled back again as well)
+        :param folder_path: The folder
+        :return: True if a journal was rolled back
+        """
+        journal: Optional[Dict] = cls.load_journal(folder_path)
+        if journal is None or journal['state'] == 'rolled_back':
+            return False
+
+        # Move the files at their targets back to the temporary names
+        if journal['state'] in ('staged', 'done', 'unstaging'):
+            journal['state'] = 'unstaging'
+            cls.save_journal(folder_path, journal)
+            for _, temp_filename, new_filename in journal['renames']:
+                cls.move(folder_path, new_filename, temp_filename)
+
+        # Then from the temporary names back to the original names
+        journal['state'] = 'unstaged'
+        cls.save_journal(folder_path, journal)
+        for filename, temp_filename, _ in journal['renames']:
+            cls.move(folder_path, temp_filename, filename)
+
+        journal['state'] = 'rolled_back'
+        cls.save_journal(folder_path, journal)
+        return True
@@ -0,0 +1,194 @@
+# External Imports
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Set, Tuple
+
+# Internal Imports
+from utils.file_hash import FileHash
+
+
+class ContentStore(object):
+    """
+    A content-addressed store keeping every unique image body once, keyed by its SHA-256.
+    The per-index image files are hard links into the store, and images whose body was already seen under
+    another filename are recorded as duplicates in a manifest inside the images folder,
+    so later stages can process every unique image only once
+    """
+    duplicates_manifest_filename: str = ".duplicates.json"
+
+    def __init__(self, store_dir: str):
+        """
+        Initialize the ContentStore class
+        :param store_dir: The directory the unique image bodies are stored in
+        """
+        assert type(store_dir) is str, f'store_dir is not a string, got {type(store_dir)}'
+        self.store_dir: str = store_dir
+
+    def get_object_path(self, sha256: str, extension: str = "") -> str:
+        """
+        Returns the path a body is stored at
+        :param sha256: The hex SHA-256 digest of the body
+        :param extension: The file extension to give the stored body (e.g. '.jpg')
+        :return: The path of the stored body
+        """
+        return os.path.join(self.store_dir, sha256[:2], f"{sha256}{extension}")
+
+    def add(self, path: str, sha256: str) -> str:
+        """
+        Adds a file to the store and replaces it with a hard link to the stored body.
+        If the filesystem does not support hard links the file is copied into the store and left as is
+        :param path: The path of the file to add
+        :param sha256: The hex SHA-256 digest of the file
+        :return: The path of the stored body
+        """
+        object_path: str = self.get_object_path(sha256, os.path.splitext(path)[1].lower())
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+        if not os.path.isfile(object_path):
+            try:
+                os.link(path, object_path)
+            except OSError:
+                shutil.copy2(path, object_path)
+            return object_path
+
+        if os.path.samefile(path, object_path):
+            return object_path
+
+        # Point the file at the stored body, through a temporary link so the file is never missing
+        tmp_path: str = f"{path}.link.tmp"
+        try:
+            os.link(object_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return object_path
+
+    def is_stored(self, path: str, sha256: str) -> bool:
+        """
+        Checks if a file is a hard link to its stored body
+        :param path: The path of the file
+        :param sha256: The hex SHA-256 digest of the body
+        :return: True if the file is the stored body
+        """
+        object_path: str = self.get_object_path(sha256, os.path.splitext(path)[1].lower())
+        return os.path.isfile(object_path) and os.path.samefile(path, object_path)
+
+    def get_known_canonicals(self, folder_path: str, files: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        Finds the canonical copies already in a folder of the bodies of files about to be deduplicated,
+        so a re-download of known content is flagged as a duplicate of the copy that is already there
+        (e.g. the image renamed to its index number on an earlier run).
+        Files of the list count only if they are already linked to their stored body, other files of the folder
+        (except recorded duplicates) are recognized by their hard link to the store, or else by their hash
+        when their size matches
+        :param folder_path: The folder the files are in
+        :param files: A list of (path, sha256) pairs
+        :return: A dict mapping the hex SHA-256 digests of the files to the filename of their canonical copy
+        """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        path: str
+        candidates: Set[str]
+        sha256: Optional[str]
+
+        canonical_by_hash: Dict[str, str] = {}
+        for path, sha256 in files:
+            if sha256 not in canonical_by_hash and self.is_stored(path, sha256):
+                canonical_by_hash[sha256] = os.path.basename(path)
+
+        skipped: Set[str] = {os.path.basename(path) for path, _ in files} | set(self.load_duplicates(folder_path))
+        sha256s_by_size: Dict[int, Set[str]] = {}
+        for path, sha256 in files:
+            if sha256 not in canonical_by_hash:
+                sha256s_by_size.setdefault(os.path.getsize(path), set()).add(sha256)
+
+        for filename in sorted(os.listdir(folder_path)):
+            path = os.path.join(folder_path, filename)
+            if filename in skipped or filename.startswith('.') or not os.path.isfile(path):
+                continue
+            candidates = sha256s_by_size.get(os.path.getsize(path), set()) - set(canonical_by_hash)
+            if not candidates:
+                continue
+            sha256 = next((candidate for candidate in sorted(candidates) if self.is_stored(path, candidate)), None)
+            if sha256 is None:
+                sha256 = FileHash.get_sha256(path)
+            if sha256 in candidates:
+                canonical_by_hash[sha256] = filename
+        return canonical_by_hash
+
+    def deduplicate(self, folder_path: str, files: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        Adds files of one folder to the store and records which of them are duplicates.
+        A copy of a body that is already in the folder stays the canonical copy (see get_known_canonicals),
+        otherwise the first file (in the given order) with a certain body is, the rest are duplicates
+        :param folder_path: The folder the files are in
+        :param files: A list of (path, sha256) pairs
+        :return: A dict mapping the filename of every duplicate to the filename of its canonical copy
+        """
+        assert os.path.isdir(folder_path), f'folder_path is not a directory, got {folder_path}'
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        filename: str
+
+        canonical_by_hash: Dict[str, str] = self.get_known_canonicals(folder_path, files)
+        duplicates: Dict[str, str] = {}
+        for path, sha256 in files:
+            filename = os.path.basename(path)
+            self.add(path, sha256)
+            if canonical_by_hash.get(sha256, filename) != filename:
+                duplicates[filename] = canonical_by_hash[sha256]
+            else:
+                canonical_by_hash[sha256] = filename
+
+        # Files processed now replace whatever was recorded about them before
+        manifest: Dict[str, str] = self.load_duplicates(folder_path)
+        for path, _ in files:
+            manifest.pop(os.path.basename(path), None)
+        manifest.update(duplicates)
+        self.save_duplicates(folder_path, manifest)
+
+        return duplicates
+
+    @classmethod
+    def load_duplicates(cls, folder_path: str) -> Dict[str, str]:
+        """
+        Loads the duplicates manifest of a folder
+        :param folder_path: The images folder
+        :return: A dict mapping the filename of every duplicate to the filename of its canonical copy,
+                 empty if the folder has no manifest
+        """
+        manifest_path: str = os.path.join(folder_path, cls.duplicates_manifest_filename)
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def save_duplicates(cls, folder_path: str, duplicates: Dict[str, str]) -> None:
+        """
+        Saves the duplicates manifest of a folder
+        :param folder_path: The images folder
+        :param duplicates: A dict mapping the filename of every duplicate to the filename of its canonical copy
+        :return: None
+        """
+        manifest_path: str = os.path.join(folder_path, cls.duplicates_manifest_filename)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(duplicates, f, indent=1, sort_keys=True)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    @staticmethod
+    def rename_canonical(duplicates: Dict[str, str], old_filename: str, new_filename: str) -> bool:
+        """
+        Updates a duplicates dict after a canonical copy was renamed
+        :param duplicates: A dict mapping the filename of every duplicate to the filename of its canonical copy
+        :param old_filename: The previous filename of the canonical copy
+        :param new_filename: The new filename of the canonical copy
+        :return: True if any duplicate referenced the renamed file
+        """
+        is_renamed: bool = False
+        for duplicate, canonical in duplicates.items():
+            if canonical == old_filename:
+                duplicates[duplicate] = new_filename
+                is_renamed = True
+        return is_renamed
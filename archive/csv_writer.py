@@ -1,19 +1,33 @@
 # External Imports
-from openpyxl import Workbook
+from io import BytesIO
+import json
+from openpyxl import Workbook, load_workbook
 from openpyxl.drawing.image import Image
 from openpyxl.worksheet.worksheet import Worksheet
 import os
-from typing import Tuple, Optional
+import re
+from typing import Dict, Iterator, List, Tuple, Optional
+
+# Internal Imports
+from archive.content_store import ContentStore
+from archive.thumbnail_cache import ThumbnailCache
+from utils.bounded_pool import BoundedPool
+from utils.file_hash import FileHash
 
 
 class CSVWriter:
-    def __init__(self, csv_file: str, ):
+    max_sheet_rows: int = 1_048_576  # The maximal number of rows of an xlsx sheet
+
+    def __init__(self, csv_file: str, thumbnail_cache: Optional[ThumbnailCache] = None):
         """
         A class writing CSV files
         :param csv_file: The path to the output CSV file
+        :param thumbnail_cache: Makes the thumbnails embedded in the sheet (and caches them on disk if it has
+                                a cache_dir). If None, 150x150 thumbnails are made in memory
         """
         assert type(csv_file) is str, f'csv_file is not a string, got {type(csv_file)}'
         self.csv_file: str = csv_file
+        self.thumbnail_cache: ThumbnailCache = thumbnail_cache if thumbnail_cache is not None else ThumbnailCache()
         self.wb: Workbook = Workbook()
         self.ws: Worksheet = self.wb.active
 
@@ -25,10 +39,43 @@ class CSVWriter:
         """
         return 'jpg', 'jpeg', 'png', 'bmp', 'gif'
 
+    @classmethod
+    def get_image_filenames(cls, images_path: str) -> Iterator[str]:
+        """
+        Iterates over the images of a folder that go into the sheet, in the order of the rows.
+        Images flagged as duplicates in the folder's ContentStore manifest are left out
+        :param images_path: The directory where the images are located.
+        :return: An iterator over the filenames
+        """
+        # Images with the same content as another image are only added once
+        duplicates: Dict[str, str] = ContentStore.load_duplicates(images_path)
+        for filename in os.listdir(images_path):
+            if filename.lower().endswith(cls.get_allowed_image_formats()) and filename not in duplicates:
+                yield filename
+
+    def add_image_row(self, row: int, filename: str, thumbnail: bytes) -> None:
+        """
+        Writes the name of an image to column A of a row and its thumbnail to column B
+        :param row: The row number
+        :param filename: The filename of the image
+        :param thumbnail: The encoded thumbnail of the image, see ThumbnailCache
+        :return: None
+        """
+        # Set image name in Column A
+        self.ws.cell(row=row, column=1, value=filename.split('.')[0])
+
+        # Create an Image object for openpyxl from the thumbnail, which already fits in the cell
+        img_openpyxl: Image = Image(BytesIO(thumbnail))
+
+        # Insert the image into Column B
+        self.ws.add_image(img_openpyxl, f'B{row}')
+
     def create_sheet_from_images(self, images_path: str, title: Optional[str] = None):
         """
         Creates a sheet from a folder of images.
-        Where column A has the name of the file and column B has the image and each row is an image
+        Where column A has the name of the file and column B has the image and each row is an image.
+        The images are embedded as downscaled thumbnails, so the sheet size does not depend on the source resolution.
+        Images flagged as duplicates in the folder's ContentStore manifest are left out
         :param images_path: The directory where the images are located.
         :param title: The title of the sheet (Optional)
         :return: None. saves the sheet to self.csv_file
@@ -45,36 +92,315 @@ class CSVWriter:
         if title:
             self.ws.title = title
 
-        # Declare all loop-variable types once in advance (for Cythonization)
-        image_path: str
-        img_openpyxl: Image
-
         # Iterate over the images in the folder and add them to the workbook
         row: int = 1  # Start from the first row
-        for filename in os.listdir(images_path):
-            if filename.lower().endswith(self.get_allowed_image_formats()):
-                # Set image name in Column A
-                self.ws.cell(row=row, column=1, value=filename.split('.')[0])
+        for filename in self.get_image_filenames(images_path):
+            self.add_image_row(row, filename, self.thumbnail_cache.get(os.path.join(images_path, filename)))
 
-                # Get the full path to the image file
-                image_path = os.path.join(images_path, filename)
+            # Move to the next row
+            row += 1
 
-                # Create an Image object for openpyxl
-                img_openpyxl = Image(image_path)
-                img_openpyxl.width = 150  # Resize image to fit in the cell (optional)
-                img_openpyxl.height = 150
-        
-                # Insert the image into Column B
-                self.ws.add_image(img_openpyxl, f'B{row}')
+        # Save the workbook to a file
+        self.wb.save(self.csv_file)
 
-                # Move to the next row
-                row += 1
+        print(f"Excel file created: {self.csv_file}")
+
+    def create_sheet_from_images_parallel(
+            self,
+            images_path: str,
+            title: Optional[str] = None,
+            max_workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            use_processes: bool = True,
+    ) -> None:
+        """
+        Creates a sheet from a folder of images like create_sheet_from_images, decoding, resizing and encoding
+        the thumbnails on a pool of workers while the rows are appended on the main thread, in order.
+        Only max_in_flight thumbnails are pending at once, so memory stays flat for any number of images
+        :param images_path: The directory where the images are located.
+        :param title: The title of the sheet (Optional)
+        :param max_workers: The number of thumbnail workers. If None, the number of available cores
+        :param max_in_flight: The maximal number of images submitted to the pool at once.
+                              If None, twice the number of workers
+        :param use_processes: Indicates if the thumbnails are made in worker processes (True) or threads (False)
+        :return: None. saves the sheet to self.csv_file
+        """
+        assert type(images_path) is str, \
+            f'images_path is not a string, got {type(images_path)}'
+        assert os.path.isdir(images_path), \
+            f'images_path is not a directory, got {images_path}'
+        assert type(title) is str, \
+            f'title is not a string, got {type(title)}'
+
+        # Set the title if needed
+        if title:
+            self.ws.title = title
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        image_path: str
+        thumbnail: bytes
+
+        # Append the rows as the thumbnails arrive, in the order of the images
+        row: int = 1  # Start from the first row
+        pool: BoundedPool = BoundedPool(max_workers=max_workers, max_in_flight=max_in_flight,
+                                        use_processes=use_processes)
+        image_paths: Iterator[str] = (os.path.join(images_path, filename)
+                                      for filename in self.get_image_filenames(images_path))
+        for image_path, thumbnail in pool.imap(self.thumbnail_cache.get, image_paths):
+            self.add_image_row(row, os.path.basename(image_path), thumbnail)
+            row += 1
 
         # Save the workbook to a file
         self.wb.save(self.csv_file)
 
         print(f"Excel file created: {self.csv_file}")
 
+    @staticmethod
+    def get_part_path(csv_file: str, part: int) -> str:
+        """
+        Returns the path of a part of a sheet split into several files.
+        The first part is csv_file itself, the next parts get a '_2', '_3', ... suffix
+        :param csv_file: The path to the output file
+        :param part: The part number, starting from 1
+        :return: The path of the part
+        """
+        if part == 1:
+            return csv_file
+        root, extension = os.path.splitext(csv_file)
+        return f"{root}_{part}{extension}"
+
+    def create_sheets_from_images_streaming(
+            self,
+            images_path: str,
+            title: Optional[str] = None,
+            max_rows_per_sheet: Optional[int] = None,
+            max_rows_per_file: Optional[int] = None,
+            max_workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            use_processes: bool = True,
+    ) -> List[str]:
+        """
+        Creates sheets from a folder of images like create_sheet_from_images_parallel, streaming the rows into
+        write-only workbooks instead of building the workbook in memory. Rows are flushed to disk as they
+        are appended and the thumbnails of a file are only held until it is saved, so splitting the rows into
+        several files bounds the memory used for any number of images.
+        The sheets are named title, title_2, title_3, ..., the numbering continuing from one file to the next
+        :param images_path: The directory where the images are located.
+        :param title: The title of the sheet (Optional)
+        :param max_rows_per_sheet: The number of rows after which a new sheet is started.
+                                   If None, the maximal number of rows of a sheet
+        :param max_rows_per_file: The number of rows after which a new file is started, see get_part_path.
+                                  If None, all rows go into one file
+        :param max_workers: The number of thumbnail workers. If None, the number of available cores
+        :param max_in_flight: The maximal number of images submitted to the pool at once.
+                              If None, twice the number of workers
+        :param use_processes: Indicates if the thumbnails are made in worker processes (True) or threads (False)
+        :return: The paths of the files written
+        """
+        assert type(images_path) is str, \
+            f'images_path is not a string, got {type(images_path)}'
+        assert os.path.isdir(images_path), \
+            f'images_path is not a directory, got {images_path}'
+        assert title is None or type(title) is str, \
+            f'title is not a string, got {type(title)}'
+        if max_rows_per_sheet is None:
+            max_rows_per_sheet = self.max_sheet_rows
+        assert type(max_rows_per_sheet) is int and 0 < max_rows_per_sheet <= self.max_sheet_rows, \
+            f'max_rows_per_sheet must be an int in [1, {self.max_sheet_rows}], got {max_rows_per_sheet}'
+        assert max_rows_per_file is None or (type(max_rows_per_file) is int and max_rows_per_file > 0), \
+            f'max_rows_per_file must be a positive int, got {max_rows_per_file}'
+        if not title:
+            title = "Sheet"
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        image_path: str
+        thumbnail: bytes
+
+        file_paths: List[str] = []
+        wb: Optional[Workbook] = None
+        ws: Optional[Worksheet] = None  # Write-only, only append and add_image are used
+        sheet_count: int = 0
+        file_rows: int = 0
+        row: int = 0
+        pool: BoundedPool = BoundedPool(max_workers=max_workers, max_in_flight=max_in_flight,
+                                        use_processes=use_processes)
+        image_paths: Iterator[str] = (os.path.join(images_path, filename)
+                                      for filename in self.get_image_filenames(images_path))
+        for image_path, thumbnail in pool.imap(self.thumbnail_cache.get, image_paths):
+            # Start a new file when the current one is full
+            if wb is None or file_rows == max_rows_per_file:
+                if wb is not None:
+                    file_paths.append(self.get_part_path(self.csv_file, len(file_paths) + 1))
+                    wb.save(file_paths[-1])
+                wb = Workbook(write_only=True)
+                ws = None
+                file_rows = 0
+
+            # And a new sheet when the current one is full
+            if ws is None or row == max_rows_per_sheet:
+                sheet_count += 1
+                ws = wb.create_sheet(title if sheet_count == 1 else f"{title}_{sheet_count}")
+                row = 0
+
+            row += 1
+            file_rows += 1
+            ws.append([os.path.basename(image_path).split('.')[0]])
+            ws.add_image(Image(BytesIO(thumbnail)), f'B{row}')
+
+        # Save the last file, an empty folder gives one empty sheet
+        if wb is None:
+            wb = Workbook(write_only=True)
+            wb.create_sheet(title)
+        file_paths.append(self.get_part_path(self.csv_file, len(file_paths) + 1))
+        wb.save(file_paths[-1])
+
+        print(f"Excel files created: {file_paths}")
+        return file_paths
+
+    @staticmethod
+    def get_index_sort_key(filename: str) -> Tuple[int, int, int, str]:
+        """
+        Returns the sort key ordering images by their index number.
+        Images named after their index ('123.jpg', '123_2.jpg' for a repeated index) come first, by number,
+        the images that could not be named after an index come last, by filename
+        :param filename: The filename of the image
+        :return: The sort key
+        """
+        match: Optional[re.Match] = re.fullmatch(r'(\d+)(?:_(\d+))?', filename.split('.')[0])
+        if match is None:
+            return 1, 0, 0, filename
+        return 0, int(match.group(1)), int(match.group(2) or 1), filename
+
+    def get_manifest_path(self) -> str:
+        """
+        Returns the path of the manifest of what is in the sheet, kept next to it
+        :return: The manifest path
+        """
+        return f"{self.csv_file}.manifest.json"
+
+    def load_manifest(self) -> Dict:
+        """
+        Loads the manifest of the sheet
+        :return: A dict with the keys 'title' and 'rows' (a dict mapping every filename in the sheet to its row,
+                 sha256, size and mtime_ns), empty if there is no manifest
+        """
+        manifest_path: str = self.get_manifest_path()
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest: Dict) -> None:
+        """
+        Saves the manifest of the sheet
+        :param manifest: The manifest, see load_manifest
+        :return: None
+        """
+        manifest_path: str = self.get_manifest_path()
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def update_sheet_from_images(
+            self,
+            images_path: str,
+            title: str,
+            max_workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            use_processes: bool = True,
+    ) -> int:
+        """
+        Updates the sheet of a folder of images written by a previous run, instead of creating it from scratch.
+        The rows are ordered by index number (see get_index_sort_key). A manifest next to the sheet records the
+        filename, content hash and row of every image in it: images whose size and modification time did not change
+        are not read at all, and the thumbnails of known contents (e.g. renamed images) are taken from the thumbnail
+        cache by their hash, so with a cache_dir only new and modified images are thumbnailed.
+        The sheet is laid out again, other sheets of the workbook are kept
+        :param images_path: The directory where the images are located.
+        :param title: The title of the sheet
+        :param max_workers: The number of thumbnail workers. If None, the number of available cores
+        :param max_in_flight: The maximal number of images submitted to the pool at once.
+                              If None, twice the number of workers
+        :param use_processes: Indicates if the thumbnails are made in worker processes (True) or threads (False)
+        :return: The number of images thumbnailed. Nothing is saved if the sheet is up to date
+        """
+        assert type(images_path) is str, \
+            f'images_path is not a string, got {type(images_path)}'
+        assert os.path.isdir(images_path), \
+            f'images_path is not a directory, got {images_path}'
+        assert type(title) is str, \
+            f'title is not a string, got {type(title)}'
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        image_path: str
+        thumbnail: bytes
+        cached_thumbnail: Optional[bytes]
+        stat: os.stat_result
+        entry: Optional[Dict]
+
+        # The rows of the previous sheet
+        manifest: Dict = self.load_manifest()
+        old_rows: Dict[str, Dict] = {}
+        if manifest.get('title') == title and os.path.isfile(self.csv_file):
+            old_rows = manifest['rows']
+
+        # Hash only the images that were modified since the previous run
+        new_rows: Dict[str, Dict] = {}
+        for filename in self.get_image_filenames(images_path):
+            image_path = os.path.join(images_path, filename)
+            stat = os.stat(image_path)
+            entry = old_rows.get(filename)
+            if entry is None or (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+                entry = {'sha256': FileHash.get_sha256(image_path),
+                         'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            new_rows[filename] = dict(entry)
+
+        filenames: List[str] = sorted(new_rows, key=self.get_index_sort_key)
+        old_filenames: List[str] = sorted(old_rows, key=lambda old_filename: old_rows[old_filename]['row'])
+        if filenames == old_filenames and all(new_rows[filename]['sha256'] == old_rows[filename]['sha256']
+                                              for filename in filenames):
+            print(f"Excel file is up to date: {self.csv_file}")
+            return 0
+
+        # Take the thumbnails of known contents from the cache, and thumbnail the others
+        thumbnails_by_hash: Dict[str, bytes] = {}
+        image_paths_to_thumbnail: List[str] = []
+        for filename in filenames:
+            if new_rows[filename]['sha256'] in thumbnails_by_hash:
+                continue
+            cached_thumbnail = self.thumbnail_cache.get_cached(new_rows[filename]['sha256'])
+            thumbnails_by_hash[new_rows[filename]['sha256']] = cached_thumbnail if cached_thumbnail is not None else b''
+            if cached_thumbnail is None:
+                image_paths_to_thumbnail.append(os.path.join(images_path, filename))
+        pool: BoundedPool = BoundedPool(max_workers=max_workers, max_in_flight=max_in_flight,
+                                        use_processes=use_processes)
+        for image_path, thumbnail in pool.imap(self.thumbnail_cache.get, image_paths_to_thumbnail):
+            thumbnails_by_hash[new_rows[os.path.basename(image_path)]['sha256']] = thumbnail
+
+        # Replace the sheet of the previous run (or add it to an existing file), in its position,
+        # and lay the rows out in index order
+        if os.path.isfile(self.csv_file):
+            self.wb = load_workbook(self.csv_file)
+        else:
+            self.wb = Workbook()
+            self.wb.remove(self.wb.active)
+        sheet_index: Optional[int] = None
+        if title in self.wb.sheetnames:
+            sheet_index = self.wb.sheetnames.index(title)
+            self.wb.remove(self.wb[title])
+        self.ws = self.wb.create_sheet(title, sheet_index)
+        for row, filename in enumerate(filenames, start=1):
+            self.add_image_row(row, filename, thumbnails_by_hash[new_rows[filename]['sha256']])
+            new_rows[filename]['row'] = row
+
+        # Save the workbook to a file, and then the manifest of what is in it
+        self.wb.save(self.csv_file)
+        self.save_manifest({'title': title, 'rows': new_rows})
+
+        print(f"Excel file updated: {self.csv_file}, {len(image_paths_to_thumbnail)} new thumbnails, "
+              f"{len(filenames)} rows")
+        return len(image_paths_to_thumbnail)
+
 if __name__ == "__main__":
     # Folder where your images are located
     folder_path_main = "~/PycharmProjects/scrape_classify_and_archive_images/data/archive_images"
@@ -1,55 +1,617 @@
 # External Imports
+import copy
+import json
 import os
-from typing import List, Optional
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 # Internal Imports
+from archive.bulk_renamer import BulkRenamer
+from archive.content_store import ContentStore
+from archive.perceptual_hash_index import PerceptualHashIndex
+from classify.decoded_image import DecodedImage
+from classify.digit_template_recognizer import DigitTemplateRecognizer
+from classify.ocr_backend import OCRBackend
 from classify.ocr_number_extractor import OCRNumberExtractor
+from classify.ocr_result_cache import OCRResultCache
+from classify.ocr_text_extractor import OCRTextExtractor
+from utils.bounded_pool import BoundedPool
 
 
 class ImageNameOrganizer(object):
     """
     An image organizer class to extract numbers from an image using OCRNumberExtractor
-    and change the names of all images in a given folder to the numbers found in them
+    and change the names of all images in a given folder to the numbers found in them.
+    The number every image was named after, and its OCR confidence, are recorded in a manifest in the folder
     """
+    numbers_manifest_filename: str = ".numbers.json"
+
     def __init__(self):
         pass
 
     @staticmethod
-    def rename_images_in_folder(folder_path: str) -> None:
+    def extract_number_cached(file_path: Union[str, DecodedImage], ocr_cache: Optional[OCRResultCache],
+                              backend_version: Optional[str],
+                              digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+                              confidences: Optional[Dict[str, float]] = None) -> Optional[str]:
+        """
+        Extracts the number from an image, through the OCR result cache if one is given
+        :param file_path: The path to the image, or the DecodedImage shared with the text extractor
+        :param ocr_cache: The OCR result cache (Optional)
+        :param backend_version: The version of the OCR backend, part of the cache key
+        :param digit_recognizer: A template recognizer tried before tesseract, learning from it
+                                 (see OCRNumberExtractor.extract_number_from_image) (Optional)
+        :param confidences: A dict mapping image paths to the confidence of their number, updated in place
+                            when the image is OCRed (see OCRNumberExtractor.extract_number_from_image) (Optional)
+        :return: The number, None if no number was found
         """
-        Rename all images in a given folder to the numbers found in them
+        if ocr_cache is None:
+            return OCRNumberExtractor.extract_number_from_image(file_path, digit_recognizer=digit_recognizer,
+                                                                confidences=confidences)
+
+        cache_key: str = OCRNumberExtractor.get_cache_key(file_path, backend_version,
+                                                          digit_recognizer=digit_recognizer)
+        is_hit: bool
+        number: Optional[str]
+        is_hit, number = ocr_cache.get(cache_key)
+        if not is_hit:
+            number = OCRNumberExtractor.extract_number_from_image(file_path, digit_recognizer=digit_recognizer,
+                                                                  confidences=confidences)
+            ocr_cache.put(cache_key, number)
+        return number
+
+    @staticmethod
+    def list_images(folder_path: str, duplicates: Dict[str, str]) -> List[str]:
+        """
+        Lists the images of a folder to identify, finishing an interrupted bulk rename first
         :param folder_path: The folder path containing the images
-        :return: None
+        :param duplicates: The folder's duplicates manifest, duplicates are not listed
+        :return: The image filenames, sorted
         """
-        # Declare all loop-variable types once in advance (for Cythonization)
-        new_filename: str
-        new_file_path: str
-
-        # Get all files in the folder
-        numbers_identified: int = 0
-        unidentified_images: List[str] = []
-        for filename in os.listdir(folder_path):
-            file_path: str = os.path.join(folder_path, filename)
-
-            # If it's a file and ends with an image extension
-            if os.path.isfile(file_path) and filename.lower().endswith(('jpg', 'jpeg', 'png', 'bmp', 'gif')):
-                # Extract the number from the image
-                new_name: Optional[str] = OCRNumberExtractor.extract_number_from_image(file_path)
-
-                # If a number is found, rename the image
-                if new_name:
-                    numbers_identified += 1
-                    new_filename = f"{new_name}.jpg"  # You can change the extension if needed
-                    new_file_path = os.path.join(folder_path, new_filename)
-                    os.rename(file_path, new_file_path)
-                    print(f"Renamed '{filename}' to '{new_filename}'")
-                else:
-                    unidentified_images.append(file_path)
+        if BulkRenamer.replay(folder_path):
+            print(f"Completed the interrupted renames of '{folder_path}'")
+        return sorted(
+            filename for filename in os.listdir(folder_path)
+            if filename not in duplicates
+            and not filename.startswith(BulkRenamer.temp_prefix)
+            and os.path.isfile(os.path.join(folder_path, filename))
+            and filename.lower().endswith(('jpg', 'jpeg', 'png', 'bmp', 'gif'))
+        )
 
+    @staticmethod
+    def apply_renames(folder_path: str, new_names: Dict[str, Optional[str]],
+                      duplicates: Dict[str, str]) -> Dict[str, str]:
+        """
+        Renames the identified images of a folder in one journaled bulk rename (see BulkRenamer),
+        so images with the same number get distinct names and an interrupted run can be replayed or rolled back.
+        An image whose name is taken by an image with the same content is not renamed but recorded as its duplicate.
+        The duplicates manifest is updated to the new names of the canonical copies
+        :param folder_path: The folder path containing the images
+        :param new_names: A dict mapping every image filename to its number (None if not identified)
+        :param duplicates: The folder's duplicates manifest (updated in place and saved if changed)
+        :return: A dict mapping the filename of every renamed image to its new filename
+        """
+        n_duplicates: int = len(duplicates)
+        renames: Dict[str, str] = BulkRenamer.plan(folder_path, new_names, extension=".jpg", duplicates=duplicates)
+        BulkRenamer.apply(folder_path, renames)
+        for filename, new_filename in renames.items():
+            print(f"Renamed '{filename}' to '{new_filename}'")
+        for duplicate in list(duplicates)[n_duplicates:]:
+            print(f"'{duplicate}' has the same content as '{duplicates[duplicate]}', not renamed")
 
+        # All renames happened at once, so the manifest is remapped at once as well
+        is_duplicates_changed: bool = len(duplicates) != n_duplicates
+        for duplicate, canonical in duplicates.items():
+            if canonical in renames:
+                duplicates[duplicate] = renames[canonical]
+                is_duplicates_changed = True
+        if is_duplicates_changed:
+            ContentStore.save_duplicates(folder_path, duplicates)
+
+        numbers_identified: int = sum(1 for new_name in new_names.values() if new_name)
+        unidentified_images: List[str] = [os.path.join(folder_path, filename)
+                                          for filename, new_name in sorted(new_names.items()) if not new_name]
         print(f"Number of images identified is {numbers_identified}")
         print(f'Number of unidentified images is {len(unidentified_images)}')
         print(f'Unidentified images are {len(unidentified_images)}')
+        return renames
+
+    @staticmethod
+    def save_text_files(
+            folder_path: str,
+            text_extractor: OCRTextExtractor,
+            texts: Dict[str, str],
+            renames: Dict[str, str],
+    ) -> None:
+        """
+        Saves the texts of the images to their text files, under the names the images were renamed to
+        :param folder_path: The folder path containing the images
+        :param text_extractor: The text extractor the texts were extracted with
+        :param texts: A dict mapping image filenames (before the renames) to their texts
+        :param renames: The renames applied, see apply_renames
+        :return: None
+        """
+        for filename, text in texts.items():
+            text_extractor.save_text_file(os.path.join(folder_path, renames.get(filename, filename)), text)
+
+    @classmethod
+    def load_numbers(cls, folder_path: str) -> Dict[str, Dict]:
+        """
+        Loads the numbers manifest of a folder
+        :param folder_path: The images folder
+        :return: A dict mapping the filename of every image named after a number to a dict with the keys
+                 'number' and 'confidence' (None if unknown), empty if the folder has no manifest
+        """
+        manifest_path: str = os.path.join(folder_path, cls.numbers_manifest_filename)
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def save_numbers(
+            cls,
+            folder_path: str,
+            new_names: Dict[str, Optional[str]],
+            confidences: Dict[str, float],
+            renames: Dict[str, str],
+            duplicates: Dict[str, str],
+    ) -> None:
+        """
+        Saves the numbers manifest of a folder after its renames, under the new filenames.
+        Images whose number came from the OCR cache keep the confidence a previous run recorded for the same
+        number under the same new filename
+        :param folder_path: The images folder
+        :param new_names: A dict mapping every image filename to its number (None if not identified)
+        :param confidences: A dict mapping image filenames to the confidence of their number, for the images OCRed
+        :param renames: The renames applied, see apply_renames
+        :param duplicates: The folder's duplicates manifest, duplicates are not recorded
+        :return: None
+        """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        new_filename: str
+        confidence: Optional[float]
+        previous_entry: Dict
+
+        previous_numbers: Dict[str, Dict] = cls.load_numbers(folder_path)
+        numbers: Dict[str, Dict] = {}
+        for filename, number in new_names.items():
+            if not number or filename in duplicates:
+                continue
+            new_filename = renames.get(filename, filename)
+            confidence = confidences.get(filename)
+            previous_entry = previous_numbers.get(new_filename, {})
+            if confidence is None and previous_entry.get('number') == number:
+                confidence = previous_entry.get('confidence')
+            numbers[new_filename] = {'number': number, 'confidence': confidence}
+
+        manifest_path: str = os.path.join(folder_path, cls.numbers_manifest_filename)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(numbers, f, indent=1, sort_keys=True)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    @staticmethod
+    def rename_images_in_folder(
+            folder_path: str,
+            near_duplicate_max_distance: Optional[int] = None,
+            ocr_cache: Optional[OCRResultCache] = None,
+            text_extractor: Optional[OCRTextExtractor] = None,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+    ) -> None:
+        """
+        Rename all images in a given folder to the numbers found in them.
+        All images are identified first and renamed together in one journaled bulk rename (see apply_renames),
+        and their numbers are recorded in the folder's numbers manifest (see save_numbers).
+        Images flagged as duplicates in the folder's ContentStore manifest are skipped
+        :param folder_path: The folder path containing the images
+        :param near_duplicate_max_distance: If given, an image whose perceptual hash is within this Hamming distance
+                                            of an already identified image reuses its number instead of running
+                                            OCR, and is renamed like it (with a '_2', '_3', ... suffix) (Optional)
+        :param ocr_cache: A cache of OCR results, images already OCRed with the same content and parameters
+                          (e.g. on a previous run) are not OCRed again (Optional)
+        :param text_extractor: If given, the text of every image is extracted as well, from the same DecodedImage
+                               as its number and perceptual hash, and saved to the text file of its new name
+                               (see OCRTextExtractor.save_text_file) (Optional)
+        :param digit_recognizer: If given, the number boxes are recognized with its digit templates first, and only
+                                 the boxes it is not confident about are OCRed by tesseract. The numbers tesseract
+                                 reads are learned, the caller saves the grown bank (Optional)
+        :return: None
+        """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        file_path: str
+        image: Union[str, DecodedImage]
+        image_hash: Optional[int]
+        near_duplicate: Optional[str]
+
+        # Images with the same content as another image are only processed once
+        duplicates: Dict[str, str] = ContentStore.load_duplicates(folder_path)
+        image_filenames: List[str] = ImageNameOrganizer.list_images(folder_path, duplicates)
+
+        backend_version: Optional[str] = OCRBackend.get_default().get_version() if ocr_cache is not None else None
+
+        # Index of the identified images, to find re-encoded or resized copies of them
+        hash_index: Optional[PerceptualHashIndex] = PerceptualHashIndex() \
+            if near_duplicate_max_distance is not None else None
+
+        # Identify all images first, the renames are applied together afterwards
+        new_names: Dict[str, Optional[str]] = {}
+        confidences: Dict[str, float] = {}
+        texts: Dict[str, str] = {}
+        for filename in image_filenames:
+            file_path = os.path.join(folder_path, filename)
+
+            # With a text extractor, the image is decoded once for the text, the hash and the number.
+            # The text goes first, the reduced scales of the others are resized from its full resolution decode
+            image = DecodedImage(file_path) if text_extractor is not None else file_path
+            if text_extractor is not None:
+                texts[filename] = text_extractor.extract_text_from_image(image)
+
+            # Reuse the number of a near-duplicate that was already identified
+            image_hash = hash_index.hash_image(image) if hash_index is not None else None
+            if image_hash is not None:
+                near_duplicate = hash_index.find_nearest(image_hash, near_duplicate_max_distance)
+                if near_duplicate is not None:
+                    new_names[filename] = new_names[near_duplicate]
+                    print(f"'{filename}' is a near-duplicate of '{near_duplicate}', reusing its number")
+                    continue
+
+            # Extract the number from the image
+            new_names[filename] = ImageNameOrganizer.extract_number_cached(image, ocr_cache, backend_version,
+                                                                             digit_recognizer, confidences)
+            if new_names[filename] and image_hash is not None:
+                hash_index.add(image_hash, filename)
+
+        renames: Dict[str, str] = ImageNameOrganizer.apply_renames(folder_path, new_names, duplicates)
+        ImageNameOrganizer.save_numbers(folder_path, new_names,
+                                        {os.path.basename(path): confidence
+                                         for path, confidence in confidences.items()},
+                                        renames, duplicates)
+        if text_extractor is not None:
+            ImageNameOrganizer.save_text_files(folder_path, text_extractor, texts, renames)
+        if ocr_cache is not None:
+            print(f"OCR cache stats: {ocr_cache.get_stats()}")
+
+    @staticmethod
+    def identify_images(
+            file_paths: List[str],
+            is_number_needed: bool = True,
+            text_extractor: Optional[OCRTextExtractor] = None,
+            is_batched: bool = False,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+    ) -> Tuple[List[Tuple[Optional[str], Optional[float], Optional[str]]], Optional[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Extracts the numbers, and the texts if a text extractor is given, of images, the pool worker entry point.
+        The images are decoded one at a time. With a text extractor, the number of an image is extracted from the
+        decode of its text (see DecodedImage), in a batch only from its reduced scales, since the batch holds them
+        :param file_paths: The paths to the images
+        :param is_number_needed: If False, only the texts are extracted
+        :param text_extractor: The text extractor, without a cache since it runs on the worker (Optional)
+        :param is_batched: If True, the numbers of all images are extracted together, their number boxes OCRed
+                           in montages (see OCRNumberExtractor.extract_numbers_from_images)
+        :param digit_recognizer: A template recognizer tried before tesseract (Optional).
+                                 The worker learns on a copy of it, and returns the templates it learned
+        :return: The number (None if no number was found or it was not needed), its confidence (None if unknown,
+                 see OCRNumberExtractor.extract_numbers_from_images) and the text (None without a text extractor)
+                 of every image, in the order of file_paths,
+                 and the templates learned (see DigitTemplateRecognizer.get_templates), None without a recognizer
+        """
+        # Threads must not learn into the shared bank, processes would lose what they learn
+        worker_recognizer: Optional[DigitTemplateRecognizer] = copy.copy(digit_recognizer) \
+            if digit_recognizer is not None else None
+        n_templates: int = len(worker_recognizer) if worker_recognizer is not None else 0
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        file_path: str
+        image: Union[str, DecodedImage]
+
+        texts: List[Optional[str]] = []
+        numbers: List[Optional[str]] = []
+        confidences: Dict[str, float] = {}
+
+        # The images are decoded one at a time, the text first
+        def iter_images() -> Iterator[Union[str, DecodedImage]]:
+            for file_path in file_paths:
+                image = DecodedImage(file_path) if text_extractor is not None else file_path
+                texts.append(text_extractor.extract_text_from_image(image) if text_extractor is not None else None)
+
+                # A batch holds its images until their number boxes are cut out, so only the default scale
+                # the boxes are searched at is kept of the full resolution decode
+                if is_batched and isinstance(image, DecodedImage):
+                    image.get_bgr(4)
+                    image.release(is_reduced_kept=True)
+                yield image
+
+        if is_number_needed and is_batched:
+            numbers_by_path: Dict[str, Optional[str]] = OCRNumberExtractor.extract_numbers_from_images(
+                iter_images(), digit_recognizer=worker_recognizer, confidences=confidences
+            )
+            numbers = [numbers_by_path[file_path] for file_path in file_paths]
+        else:
+            # The number boxes are cut out of the full resolution decode of the text, dropped with the image
+            for image in iter_images():
+                numbers.append(OCRNumberExtractor.extract_number_from_image(
+                    image, digit_recognizer=worker_recognizer, confidences=confidences
+                ) if is_number_needed else None)
+        learned_templates: Optional[Tuple[np.ndarray, np.ndarray]] = worker_recognizer.get_templates(n_templates) \
+            if worker_recognizer is not None else None
+        return list(zip(numbers, [confidences.get(file_path) for file_path in file_paths], texts)), learned_templates
+
+    @staticmethod
+    def iter_identify_parallel(
+            pool: BoundedPool,
+            folder_path: str,
+            image_filenames: List[str],
+            text_extractor: Optional[OCRTextExtractor],
+            is_number_needed: bool = True,
+            batch_size: Optional[int] = None,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+    ) -> Iterator[Tuple[str, Optional[str], Optional[float], Optional[str]]]:
+        """
+        Extracts the numbers, and the texts if a text extractor is given, of images on a pool of workers
+        :param pool: The worker pool
+        :param folder_path: The folder path containing the images
+        :param image_filenames: The filenames of the images
+        :param text_extractor: The text extractor, its cache is not used by the workers (Optional)
+        :param is_number_needed: If False, only the texts are extracted
+        :param batch_size: If given, every worker call extracts the numbers of batch_size images together,
+                           see identify_images. Otherwise one image per call (Optional)
+        :param digit_recognizer: A template recognizer tried before tesseract (Optional).
+                                 The templates learned by the workers are added to it as their results arrive
+        :return: An iterator over (filename, number, confidence, text), see identify_images
+        """
+        worker_text_extractor: Optional[OCRTextExtractor] = OCRTextExtractor(
+            text_extractor.langauge, text_extractor.image_to_string_config,
+            None if pool.use_processes else text_extractor.ocr_backend
+        ) if text_extractor is not None else None
+
+        chunk_size: int = batch_size if batch_size is not None else 1
+        file_paths: List[str] = [os.path.join(folder_path, filename) for filename in image_filenames]
+        chunks: List[List[str]] = [file_paths[i: i + chunk_size] for i in range(0, len(file_paths), chunk_size)]
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        number: Optional[str]
+        confidence: Optional[float]
+        text: Optional[str]
+
+        for chunk, (results, learned_templates) in pool.imap(ImageNameOrganizer.identify_images, chunks,
+                                                             is_number_needed, worker_text_extractor,
+                                                             batch_size is not None, digit_recognizer):
+            if learned_templates is not None and len(learned_templates[1]) > 0:
+                digit_recognizer.add_vectors(*learned_templates)
+            for file_path, (number, confidence, text) in zip(chunk, results):
+                yield os.path.basename(file_path), number, confidence, text
+
+    @staticmethod
+    def extract_numbers_parallel(
+            pool: BoundedPool,
+            folder_path: str,
+            image_filenames: List[str],
+            ocr_cache: Optional[OCRResultCache],
+            cache_keys: Dict[str, str],
+            text_extractor: Optional[OCRTextExtractor] = None,
+            texts: Optional[Dict[str, str]] = None,
+            batch_size: Optional[int] = None,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+            confidences: Optional[Dict[str, float]] = None,
+    ) -> Dict[str, Optional[str]]:
+        """
+        Extracts the numbers from images on a pool of workers, storing them in the OCR cache
+        :param pool: The worker pool
+        :param folder_path: The folder path containing the images
+        :param image_filenames: The filenames of the images
+        :param ocr_cache: The OCR result cache (Optional)
+        :param cache_keys: The cache key of every image, if ocr_cache is given
+        :param text_extractor: If given, the images missing from texts get their text extracted
+                               from the same decode as their number (Optional)
+        :param texts: A dict mapping filenames to their texts, updated in place (Optional)
+        :param batch_size: The number of images every worker call extracts the numbers of together,
+                           see iter_identify_parallel (Optional)
+        :param digit_recognizer: A template recognizer tried before tesseract, see iter_identify_parallel (Optional)
+        :param confidences: A dict mapping filenames to the confidence of their number, updated in place
+                            for the numbers that have one (Optional)
+        :return: A dict mapping every filename to its number (None if no number was found)
+        """
+        if texts is None:
+            texts = {}
+        if confidences is None:
+            confidences = {}
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        filename: str
+        new_name: Optional[str]
+        confidence: Optional[float]
+        text: Optional[str]
+
+        new_names: Dict[str, Optional[str]] = {}
+        for filenames, extractor in [
+            ([filename for filename in image_filenames if text_extractor is None or filename in texts], None),
+            ([filename for filename in image_filenames if text_extractor is not None and filename not in texts],
+             text_extractor),
+        ]:
+            for filename, new_name, confidence, text in ImageNameOrganizer.iter_identify_parallel(
+                    pool, folder_path, filenames, extractor, True, batch_size, digit_recognizer):
+                new_names[filename] = new_name
+                if confidence is not None:
+                    confidences[filename] = confidence
+                if ocr_cache is not None:
+                    ocr_cache.put(cache_keys[filename], new_name)
+                if text is not None:
+                    texts[filename] = text
+        return new_names
+
+    @staticmethod
+    def get_cached_texts(
+            folder_path: str,
+            image_filenames: List[str],
+            text_extractor: OCRTextExtractor,
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Takes the texts of the images OCRed before from the text extractor's cache
+        :param folder_path: The folder path containing the images
+        :param image_filenames: The filenames of the images
+        :param text_extractor: The text extractor
+        :return: A dict mapping filenames to their cached texts,
+                 and a dict mapping the other filenames to their cache keys (both empty without a cache)
+        """
+        texts: Dict[str, str] = {}
+        cache_keys: Dict[str, str] = {}
+        if text_extractor.ocr_cache is None:
+            return texts, cache_keys
+
+        ocr_backend: OCRBackend = text_extractor.ocr_backend if text_extractor.ocr_backend is not None \
+            else OCRBackend.get_default()
+        backend_version: str = ocr_backend.get_version()
+        for filename in image_filenames:
+            cache_key: str = text_extractor.get_cache_key(os.path.join(folder_path, filename), backend_version)
+            is_hit, text = text_extractor.ocr_cache.get(cache_key)
+            if is_hit:
+                texts[filename] = text
+            else:
+                cache_keys[filename] = cache_key
+        return texts, cache_keys
+
+    @staticmethod
+    def find_near_duplicates(
+            pool: BoundedPool,
+            folder_path: str,
+            image_filenames: List[str],
+            near_duplicate_max_distance: int,
+    ) -> Dict[str, str]:
+        """
+        Groups the near-duplicate images of a folder, hashing them on a pool of workers.
+        The first image of every group (in the order of image_filenames) represents it
+        :param pool: The worker pool
+        :param folder_path: The folder path containing the images
+        :param image_filenames: The filenames of the images
+        :param near_duplicate_max_distance: The maximal Hamming distance of the perceptual hashes of near-duplicates
+        :return: A dict mapping the filename of every image that is not a representative to its representative
+        """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        filename: str
+        near_duplicate: Optional[str]
+
+        hash_index: PerceptualHashIndex = PerceptualHashIndex()
+        near_duplicates: Dict[str, str] = {}
+        for file_path, image_hash in pool.imap(PerceptualHashIndex.hash_image_with_params,
+                                               [os.path.join(folder_path, filename) for filename in image_filenames],
+                                               hash_index.hash_method, hash_index.hash_size):
+            if image_hash is None:
+                continue
+            filename = os.path.basename(file_path)
+            near_duplicate = hash_index.find_nearest(image_hash, near_duplicate_max_distance)
+            if near_duplicate is not None:
+                near_duplicates[filename] = near_duplicate
+            else:
+                hash_index.add(image_hash, filename)
+        return near_duplicates
+
+    @staticmethod
+    def rename_images_in_folder_parallel(
+            folder_path: str,
+            max_workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            use_processes: bool = True,
+            ocr_cache: Optional[OCRResultCache] = None,
+            near_duplicate_max_distance: Optional[int] = None,
+            text_extractor: Optional[OCRTextExtractor] = None,
+            batch_size: Optional[int] = None,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+    ) -> None:
+        """
+        Rename all images in a given folder to the numbers found in them, running the OCR on a pool of workers.
+        All renames are applied afterwards in one journaled bulk rename on the main process (see apply_renames),
+        and the numbers are recorded in the folder's numbers manifest (see save_numbers).
+        Images flagged as duplicates in the folder's ContentStore manifest are skipped
+        :param folder_path: The folder path containing the images
+        :param max_workers: The number of OCR workers. If None, the number of available cores
+        :param max_in_flight: The maximal number of images submitted to the pool at once.
+                              If None, twice the number of workers
+        :param use_processes: Indicates if the OCR runs in worker processes (True) or threads (False)
+        :param ocr_cache: A cache of OCR results, looked up and updated on the main process,
+                          so only the images missing from it are sent to the workers (Optional)
+        :param near_duplicate_max_distance: If given, near-duplicate images (see rename_images_in_folder) are grouped
+                                            first, and only one image of every group is OCRed. The others reuse
+                                            its number, unless it has none, then they are OCRed as well (Optional)
+        :param text_extractor: If given, the text of every image is extracted as well, by the worker extracting its
+                               number from the same DecodedImage, and saved to the text file of its new name.
+                               The extractor's cache is looked up and updated on the main process (Optional)
+        :param batch_size: If given, every worker extracts the numbers of batch_size images at once, the number
+                           boxes of all of them OCRed in montages with a single OCR call
+                           (see OCRNumberExtractor.extract_numbers_from_images) (Optional)
+        :param digit_recognizer: If given, the number boxes are recognized with its digit templates first
+                                 (see rename_images_in_folder). The templates the workers learn are added to it
+                                 on the main process, the caller saves the grown bank (Optional)
+        :return: None
+        """
+        assert os.path.isdir(folder_path), f'folder_path is not a directory, got {folder_path}'
+        assert batch_size is None or (type(batch_size) is int and batch_size > 0), \
+            f'batch_size must be a positive int, got {batch_size}'
+
+        # Images with the same content as another image are only processed once
+        duplicates: Dict[str, str] = ContentStore.load_duplicates(folder_path)
+        image_filenames: List[str] = ImageNameOrganizer.list_images(folder_path, duplicates)
+
+        # Take the numbers of the images OCRed before from the cache
+        new_names: Dict[str, Optional[str]] = {}
+        cache_keys: Dict[str, str] = {}
+        if ocr_cache is not None:
+            backend_version: str = OCRBackend.get_default().get_version()
+            for filename in image_filenames:
+                cache_keys[filename] = OCRNumberExtractor.get_cache_key(os.path.join(folder_path, filename),
+                                                                        backend_version,
+                                                                        digit_recognizer=digit_recognizer)
+                is_hit, new_name = ocr_cache.get(cache_keys[filename])
+                if is_hit:
+                    new_names[filename] = new_name
+
+        texts: Dict[str, str] = {}
+        text_cache_keys: Dict[str, str] = {}
+        if text_extractor is not None:
+            texts, text_cache_keys = ImageNameOrganizer.get_cached_texts(folder_path, image_filenames, text_extractor)
+
+        # Near-duplicates of another image wait for its number
+        pool: BoundedPool = BoundedPool(max_workers=max_workers, max_in_flight=max_in_flight,
+                                        use_processes=use_processes)
+        near_duplicates: Dict[str, str] = {}
+        if near_duplicate_max_distance is not None:
+            near_duplicates = ImageNameOrganizer.find_near_duplicates(pool, folder_path, image_filenames,
+                                                                      near_duplicate_max_distance)
+
+        # Extract the numbers from all other images in parallel
+        confidences: Dict[str, float] = {}
+        new_names.update(ImageNameOrganizer.extract_numbers_parallel(
+            pool, folder_path,
+            [filename for filename in image_filenames if filename not in new_names and filename not in near_duplicates],
+            ocr_cache, cache_keys, text_extractor, texts, batch_size, digit_recognizer, confidences
+        ))
+
+        # Then give the near-duplicates the number of their group, or OCR them if it has none
+        for filename, near_duplicate in near_duplicates.items():
+            if filename not in new_names and new_names.get(near_duplicate):
+                new_names[filename] = new_names[near_duplicate]
+                print(f"'{filename}' is a near-duplicate of '{near_duplicate}', reusing its number")
+        new_names.update(ImageNameOrganizer.extract_numbers_parallel(
+            pool, folder_path, [filename for filename in near_duplicates if filename not in new_names],
+            ocr_cache, cache_keys, text_extractor, texts, batch_size, digit_recognizer, confidences
+        ))
+
+        # The images whose number needed no OCR still need their text
+        if text_extractor is not None:
+            for filename, _, _, text in ImageNameOrganizer.iter_identify_parallel(
+                    pool, folder_path, [filename for filename in image_filenames if filename not in texts],
+                    text_extractor, is_number_needed=False):
+                texts[filename] = text
+            if text_extractor.ocr_cache is not None:
+                for filename, cache_key in text_cache_keys.items():
+                    text_extractor.ocr_cache.put(cache_key, texts[filename])
+
+        # Apply the renames in one journaled bulk rename
+        renames: Dict[str, str] = ImageNameOrganizer.apply_renames(folder_path, new_names, duplicates)
+        ImageNameOrganizer.save_numbers(folder_path, new_names, confidences, renames, duplicates)
+        if text_extractor is not None:
+            ImageNameOrganizer.save_text_files(folder_path, text_extractor, texts, renames)
+        if ocr_cache is not None:
+            print(f"OCR cache stats: {ocr_cache.get_stats()}")
 
 if __name__ == "__main__":
     # Example usage:
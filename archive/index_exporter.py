@@ -0,0 +1,312 @@
+# External Imports
+from abc import ABC, abstractmethod
+import csv
+from dataclasses import astuple, dataclass, fields
+import os
+import sqlite3
+from PIL import Image
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Internal Imports
+from archive.csv_writer import CSVWriter
+from utils.file_hash import FileHash
+
+
+@dataclass
+class IndexRecord:
+    """
+    A row of the archive index, describing one image
+    """
+    index_number: Optional[int]  # The number extracted from the image, None if it was not named after one
+    filename: str
+    path: str
+    sha256: str
+    width: Optional[int]  # None if the image header cannot be read
+    height: Optional[int]
+    url: Optional[str] = None  # The URL the image was downloaded from, if known
+    ocr_confidence: Optional[float] = None  # The confidence of the extracted number, if known
+
+    @classmethod
+    def get_column_names(cls) -> List[str]:
+        """
+        Returns the column names of the index, in the order of the values of astuple
+        :return: The column names
+        """
+        return [field.name for field in fields(cls)]
+
+    @classmethod
+    def from_image(
+            cls,
+            image_path: str,
+            urls_by_sha256: Optional[Dict[str, str]] = None,
+            numbers: Optional[Dict[str, Dict]] = None,
+    ) -> 'IndexRecord':
+        """
+        Describes an image, reading only its header for the dimensions
+        :param image_path: The path of the image
+        :param urls_by_sha256: A dict mapping content hashes to the URLs they were downloaded from
+                               (see HTTPMetadataCache.get_urls_by_sha256) (Optional)
+        :param numbers: The numbers manifest of the folder (see ImageNameOrganizer.load_numbers), giving the number
+                        the image was named after and its confidence. If None, the number is parsed from the filename
+                        and its confidence is unknown (Optional)
+        :return: The record
+        """
+        filename: str = os.path.basename(image_path)
+        index_number: Optional[int]
+        ocr_confidence: Optional[float] = None
+        if numbers is not None:
+            index_number = int(numbers[filename]['number']) if filename in numbers else None
+            ocr_confidence = numbers[filename]['confidence'] if filename in numbers else None
+        else:
+            sort_key: Tuple[int, int, int, str] = CSVWriter.get_index_sort_key(filename)
+            index_number = sort_key[1] if sort_key[0] == 0 else None
+        sha256: str = FileHash.get_sha256(image_path)
+        width: Optional[int] = None
+        height: Optional[int] = None
+        try:
+            with Image.open(image_path) as img:
+                width, height = img.size
+        except OSError:
+            pass
+        return cls(
+            index_number=index_number,
+            filename=filename,
+            path=image_path,
+            sha256=sha256,
+            width=width,
+            height=height,
+            url=urls_by_sha256.get(sha256) if urls_by_sha256 else None,
+            ocr_confidence=ocr_confidence,
+        )
+
+
+class IndexExporter(ABC):
+    """
+    The interface of a streaming writer of the archive index.
+    Subclasses implement open, write_batch and close, get_exporter_class picks the exporter by the file extension.
+    Records are written in batches as they arrive, so the index is never held in memory
+    """
+    name: str = 'base'
+    extensions: Tuple[str, ...] = ()
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        """
+        Initialize the IndexExporter class
+        :param path: The path of the index file, an existing index is replaced
+        :param batch_size: The number of records written at once
+        """
+        assert type(path) is str, f'path is not a string, got {type(path)}'
+        assert type(batch_size) is int and batch_size > 0, f'batch_size must be a positive int, got {batch_size}'
+        self.path: str = path
+        self.batch_size: int = batch_size
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """
+        Checks if the dependencies of the exporter are installed
+        :return: True if the exporter can be used
+        """
+        return True
+
+    def __enter__(self) -> 'IndexExporter':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @abstractmethod
+    def open(self) -> None:
+        """
+        Creates the index file
+        :return: None
+        """
+
+    @abstractmethod
+    def write_batch(self, records: List[IndexRecord]) -> None:
+        """
+        Writes records to the index file
+        :param records: The records
+        :return: None
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Finishes and closes the index file
+        :return: None
+        """
+
+    def write(self, records: Iterable[IndexRecord]) -> int:
+        """
+        Writes records to the index file in batches of batch_size
+        :param records: The records, may be a lazy iterator
+        :return: The number of records written
+        """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        record: IndexRecord
+
+        n_records: int = 0
+        batch: List[IndexRecord] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                self.write_batch(batch)
+                n_records += len(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+            n_records += len(batch)
+        return n_records
+
+    @staticmethod
+    def iter_records(
+            images_path: str,
+            urls_by_sha256: Optional[Dict[str, str]] = None,
+            numbers: Optional[Dict[str, Dict]] = None,
+    ) -> Iterator[IndexRecord]:
+        """
+        Iterates over the records of a folder of images in index order, leaving out duplicates, as in the sheet
+        :param images_path: The directory where the images are located.
+        :param urls_by_sha256: See IndexRecord.from_image
+        :param numbers: See IndexRecord.from_image
+        :return: An iterator over the records
+        """
+        assert os.path.isdir(images_path), f'images_path is not a directory, got {images_path}'
+        filenames: List[str] = sorted(CSVWriter.get_image_filenames(images_path), key=CSVWriter.get_index_sort_key)
+        for filename in filenames:
+            yield IndexRecord.from_image(os.path.join(images_path, filename), urls_by_sha256, numbers)
+
+    @staticmethod
+    def get_exporter_class(path: str) -> Type['IndexExporter']:
+        """
+        Returns the exporter writing a file type
+        :param path: The path of the index file, its extension selects the exporter
+        :return: The exporter class
+        """
+        extension: str = os.path.splitext(path)[1].lower()
+        for exporter_class in IndexExporter.__subclasses__():
+            if extension in exporter_class.extensions:
+                return exporter_class
+        raise ValueError(f"No index exporter writes '{extension}' files")
+
+    @classmethod
+    def export_folder(
+            cls,
+            images_path: str,
+            path: str,
+            urls_by_sha256: Optional[Dict[str, str]] = None,
+            numbers: Optional[Dict[str, Dict]] = None,
+    ) -> int:
+        """
+        Exports the index of a folder of images with the exporter of the path's file type
+        :param images_path: The directory where the images are located.
+        :param path: The path of the index file, e.g. 'index.csv', 'index.sqlite' or 'index.parquet'
+        :param urls_by_sha256: See IndexRecord.from_image
+        :param numbers: See IndexRecord.from_image
+        :return: The number of records written
+        """
+        n_records: int
+        with cls.get_exporter_class(path)(path) as exporter:
+            n_records = exporter.write(cls.iter_records(images_path, urls_by_sha256, numbers))
+        print(f"Index exported: {path}, {n_records} records")
+        return n_records
+
+
+class CSVIndexExporter(IndexExporter):
+    """
+    Writes the index as a CSV file with a header row, empty cells for unknown values
+    """
+    name: str = 'csv'
+    extensions: Tuple[str, ...] = ('.csv',)
+
+    def open(self) -> None:
+        self._file = open(self.path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(IndexRecord.get_column_names())
+
+    def write_batch(self, records: List[IndexRecord]) -> None:
+        self._writer.writerows(astuple(record) for record in records)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SQLiteIndexExporter(IndexExporter):
+    """
+    Writes the index as an 'images' table of a SQLite database, indexed by index number and content hash.
+    The table indexes are built once all records are inserted, which is faster than maintaining them per insert
+    """
+    name: str = 'sqlite'
+    extensions: Tuple[str, ...] = ('.sqlite', '.sqlite3', '.db')
+    column_types: Dict[str, str] = {
+        'index_number': 'INTEGER',
+        'filename': 'TEXT NOT NULL',
+        'path': 'TEXT NOT NULL',
+        'sha256': 'TEXT NOT NULL',
+        'width': 'INTEGER',
+        'height': 'INTEGER',
+        'url': 'TEXT',
+        'ocr_confidence': 'REAL',
+    }
+
+    def open(self) -> None:
+        self._connection: sqlite3.Connection = sqlite3.connect(self.path)
+        self._connection.execute("DROP TABLE IF EXISTS images")
+        columns: str = ', '.join(f"{name} {self.column_types[name]}" for name in IndexRecord.get_column_names())
+        self._connection.execute(f"CREATE TABLE images ({columns})")
+
+    def write_batch(self, records: List[IndexRecord]) -> None:
+        placeholders: str = ', '.join('?' for _ in IndexRecord.get_column_names())
+        self._connection.executemany(f"INSERT INTO images VALUES ({placeholders})",
+                                     (astuple(record) for record in records))
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.execute("CREATE INDEX images_index_number ON images (index_number)")
+        self._connection.execute("CREATE INDEX images_sha256 ON images (sha256)")
+        self._connection.commit()
+        self._connection.close()
+
+
+class ParquetIndexExporter(IndexExporter):
+    """
+    Writes the index as an Apache Parquet file, one row group per batch. Requires pyarrow
+    """
+    name: str = 'parquet'
+    extensions: Tuple[str, ...] = ('.parquet',)
+
+    def __init__(self, path: str, batch_size: int = 10_000):
+        assert pyarrow is not None, 'The parquet index exporter requires pyarrow to be installed'
+        super().__init__(path, batch_size)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return pyarrow is not None
+
+    def open(self) -> None:
+        self._schema = pyarrow.schema([
+            ('index_number', pyarrow.int64()),
+            ('filename', pyarrow.string()),
+            ('path', pyarrow.string()),
+            ('sha256', pyarrow.string()),
+            ('width', pyarrow.int32()),
+            ('height', pyarrow.int32()),
+            ('url', pyarrow.string()),
+            ('ocr_confidence', pyarrow.float32()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+
+    def write_batch(self, records: List[IndexRecord]) -> None:
+        columns: Dict[str, list] = {name: [getattr(record, name) for record in records]
+                                    for name in IndexRecord.get_column_names()}
+        self._writer.write_table(pyarrow.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
@@ -0,0 +1,262 @@
+# External Imports
+import cv2
+import numpy as np
+import os
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Internal Imports
+from classify.decoded_image import DecodedImage
+
+
+class BKTree(object):
+    """
+    A BK-tree over integer hashes with the Hamming distance as its metric.
+    Range queries only visit subtrees whose edge distance can still hold a match (triangle inequality),
+    so near-duplicate lookups stay sub-linear in the number of hashes
+    """
+    def __init__(self):
+        # Every node is [hash, items with that hash, {distance: child node}]
+        self.root: Optional[List] = None
+        self.size: int = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @staticmethod
+    def hamming_distance(hash_a: int, hash_b: int) -> int:
+        """
+        Returns the number of differing bits between two hashes
+        :param hash_a: The first hash
+        :param hash_b: The second hash
+        :return: The Hamming distance
+        """
+        return bin(hash_a ^ hash_b).count('1')
+
+    def add(self, image_hash: int, item: Any) -> None:
+        """
+        Adds an item to the tree
+        :param image_hash: The hash of the item
+        :param item: The item to store (e.g. an image filename)
+        :return: None
+        """
+        self.size += 1
+        if self.root is None:
+            self.root = [image_hash, [item], {}]
+            return
+
+        node: List = self.root
+        while True:
+            distance: int = self.hamming_distance(image_hash, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [image_hash, [item], {}]
+                return
+            node = node[2][distance]
+
+    def search(self, image_hash: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Finds all items within a Hamming distance of a hash
+        :param image_hash: The hash to search around
+        :param max_distance: The maximal Hamming distance of a match
+        :return: A list of (distance, item), closest first
+        """
+        matches: List[Tuple[int, Any]] = []
+        if self.root is None:
+            return matches
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        node: List
+        distance: int
+
+        stack: List[List] = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = self.hamming_distance(image_hash, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class PerceptualHashIndex(object):
+    """
+    An index of perceptual hashes (dHash or pHash) of images, for finding re-encoded and resized
+    versions of the same image
+    """
+    def __init__(self, hash_method: str = 'dhash', hash_size: int = 8):
+        """
+        Initialize the PerceptualHashIndex class
+        :param hash_method: The perceptual hash to use, either 'dhash' (difference hash) or 'phash' (DCT hash)
+        :param hash_size: The side of the hash grid, the hashes have hash_size ** 2 bits
+        """
+        assert hash_method in self.get_hash_methods(), \
+            f'hash_method must be one of {self.get_hash_methods()}, got {hash_method}'
+        assert type(hash_size) is int and hash_size > 1, f'hash_size must be an int > 1, got {hash_size}'
+        self.hash_method: str = hash_method
+        self.hash_size: int = hash_size
+        self.tree: BKTree = BKTree()
+        self.hashes: Dict[Any, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    @staticmethod
+    def get_hash_methods() -> Tuple[str, str]:
+        """
+        Returns the supported hash methods
+        :return: Supported hash methods
+        """
+        return 'dhash', 'phash'
+
+    @staticmethod
+    def bits_to_int(bits: np.ndarray) -> int:
+        """
+        Packs an array of booleans into an int
+        :param bits: The bits, most significant first
+        :return: The packed int
+        """
+        return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big') >> (-bits.size % 8)
+
+    @classmethod
+    def dhash(cls, gray_img: np.ndarray, hash_size: int = 8) -> int:
+        """
+        Computes the difference hash of an image, comparing every pixel of a downscaled image to its right neighbour
+        :param gray_img: A grayscale image
+        :param hash_size: The side of the hash grid
+        :return: The hash as an int of hash_size ** 2 bits
+        """
+        small: np.ndarray = cv2.resize(gray_img, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+        return cls.bits_to_int(small[:, 1:] > small[:, :-1])
+
+    @classmethod
+    def phash(cls, gray_img: np.ndarray, hash_size: int = 8) -> int:
+        """
+        Computes the DCT based perceptual hash of an image,
+        comparing the lowest frequencies of a downscaled image to their median
+        :param gray_img: A grayscale image
+        :param hash_size: The side of the hash grid
+        :return: The hash as an int of hash_size ** 2 bits
+        """
+        side: int = hash_size * 4
+        small: np.ndarray = cv2.resize(gray_img, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low_frequencies: np.ndarray = cv2.dct(small)[:hash_size, :hash_size]
+        return cls.bits_to_int(low_frequencies > np.median(low_frequencies))
+
+    def hash_array(self, gray_img: np.ndarray) -> int:
+        """
+        Computes the configured perceptual hash of a grayscale image
+        :param gray_img: A grayscale image
+        :return: The hash
+        """
+        if self.hash_method == 'dhash':
+            return self.dhash(gray_img, self.hash_size)
+        return self.phash(gray_img, self.hash_size)
+
+    @classmethod
+    def hash_image_with_params(
+            cls,
+            image_path: Union[str, DecodedImage],
+            hash_method: str = 'dhash',
+            hash_size: int = 8,
+    ) -> Optional[int]:
+        """
+        Computes a perceptual hash of an image file, the pool worker entry point
+        (the workers are not sent the index, only its hash parameters).
+        The image is decoded at a quarter of its resolution, since the hash only needs a tiny thumbnail
+        :param image_path: The path to the image, or the DecodedImage shared with the OCR extractors
+        :param hash_method: See __init__
+        :param hash_size: See __init__
+        :return: The hash, or None if the file could not be decoded
+        """
+        gray_img: Optional[np.ndarray]
+        if isinstance(image_path, DecodedImage):
+            gray_img = image_path.get_gray(4)
+        else:
+            gray_img = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        if gray_img is None or gray_img.size == 0:
+            return None
+        if hash_method == 'dhash':
+            return cls.dhash(gray_img, hash_size)
+        return cls.phash(gray_img, hash_size)
+
+    def hash_image(self, image_path: Union[str, DecodedImage]) -> Optional[int]:
+        """
+        Computes the configured perceptual hash of an image file, see hash_image_with_params
+        :param image_path: The path to the image, or the DecodedImage shared with the OCR extractors
+        :return: The hash, or None if the file could not be decoded
+        """
+        return self.hash_image_with_params(image_path, self.hash_method, self.hash_size)
+
+    def add(self, image_hash: int, item: Any) -> None:
+        """
+        Adds a hash to the index
+        :param image_hash: The hash of the image
+        :param item: The item to return for this image in lookups (e.g. its filename)
+        :return: None
+        """
+        self.tree.add(image_hash, item)
+        self.hashes[item] = image_hash
+
+    def add_folder(self, folder_path: str) -> int:
+        """
+        Adds all images in a folder to the index, keyed by their filenames
+        :param folder_path: The folder of images
+        :return: The number of images added
+        """
+        assert os.path.isdir(folder_path), f'folder_path is not a directory, got {folder_path}'
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        image_hash: Optional[int]
+
+        n_added: int = 0
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.lower().endswith(('jpg', 'jpeg', 'png', 'bmp', 'gif')):
+                image_hash = self.hash_image(os.path.join(folder_path, filename))
+                if image_hash is not None:
+                    self.add(image_hash, filename)
+                    n_added += 1
+        return n_added
+
+    def find_near_duplicates(self, image_hash: int, max_distance: int = 6) -> List[Tuple[int, Any]]:
+        """
+        Finds the images in the index close to a hash
+        :param image_hash: The hash to look up
+        :param max_distance: The maximal Hamming distance of a near-duplicate
+        :return: A list of (distance, item), closest first
+        """
+        return self.tree.search(image_hash, max_distance)
+
+    def find_nearest(self, image_hash: int, max_distance: int = 6) -> Optional[Any]:
+        """
+        Finds the image in the index closest to a hash
+        :param image_hash: The hash to look up
+        :param max_distance: The maximal Hamming distance of a near-duplicate
+        :return: The item of the closest image, or None if no image is within max_distance
+        """
+        matches: List[Tuple[int, Any]] = self.find_near_duplicates(image_hash, max_distance)
+        return matches[0][1] if matches else None
+
+    def group_near_duplicates(self, max_distance: int = 6) -> List[List[Any]]:
+        """
+        Groups the indexed images into clusters of near-duplicates
+        :param max_distance: The maximal Hamming distance between two near-duplicates
+        :return: A list of groups (with more than one item each), every group ordered as the items were added
+        """
+        order: Dict[Any, int] = {item: i for i, item in enumerate(self.hashes)}
+        grouped: set = set()
+        groups: List[List[Any]] = []
+        for item, image_hash in self.hashes.items():
+            if item in grouped:
+                continue
+            group: List[Any] = sorted((match for _, match in self.find_near_duplicates(image_hash, max_distance)
+                                       if match not in grouped), key=order.get)
+            if len(group) > 1:
+                groups.append(group)
+            grouped.update(group)
+        return groups
@@ -0,0 +1,116 @@
+# External Imports
+from io import BytesIO
+import os
+import tempfile
+from PIL import Image
+from typing import Optional, Tuple
+
+# Internal Imports
+from utils.file_hash import FileHash
+
+
+class ThumbnailCache(object):
+    """
+    Downscaled, re-encoded thumbnails of images, cached on disk by the content hash of the image
+    and the thumbnail parameters, so unchanged images are never resized again.
+    The thumbnails are returned as encoded bytes, ready to be embedded from memory
+    """
+    def __init__(self, cache_dir: Optional[str] = None, size: Tuple[int, int] = (150, 150), quality: int = 75):
+        """
+        Initialize the ThumbnailCache class
+        :param cache_dir: The directory the thumbnails are cached in. If None, thumbnails are made in memory every time
+        :param size: The maximal (width, height) of a thumbnail, images are downscaled to fit keeping their aspect ratio
+        :param quality: The JPEG quality of the thumbnails (1-95)
+        """
+        assert cache_dir is None or type(cache_dir) is str, f'cache_dir is not a string, got {type(cache_dir)}'
+        assert len(size) == 2 and all(type(n) is int and n > 0 for n in size), \
+            f'size must be a pair of positive ints, got {size}'
+        assert type(quality) is int and 1 <= quality <= 95, f'quality must be an int in [1, 95], got {quality}'
+        self.cache_dir: Optional[str] = cache_dir
+        self.size: Tuple[int, int] = (size[0], size[1])
+        self.quality: int = quality
+
+    @staticmethod
+    def make_thumbnail(image_path: str, size: Tuple[int, int], quality: int) -> bytes:
+        """
+        Decodes an image at the smallest scale that still covers the thumbnail, downscales it and encodes it as JPEG
+        :param image_path: The path of the image
+        :param size: The maximal (width, height) of the thumbnail
+        :param quality: The JPEG quality
+        :return: The encoded thumbnail
+        """
+        with Image.open(image_path) as img:
+            # Let libjpeg decode JPEGs directly at a reduced scale
+            img.draft('RGB', size)
+
+            # Flatten transparency on white, JPEG has no alpha channel
+            if img.mode in ('RGBA', 'LA', 'P'):
+                rgba: Image.Image = img.convert('RGBA')
+                thumbnail: Image.Image = Image.new('RGBA', rgba.size, 'white')
+                thumbnail.alpha_composite(rgba)
+                thumbnail = thumbnail.convert('RGB')
+            else:
+                thumbnail = img.convert('RGB')
+        thumbnail.thumbnail(size, Image.Resampling.LANCZOS)
+
+        buffer: BytesIO = BytesIO()
+        thumbnail.save(buffer, format='JPEG', quality=quality, optimize=True)
+        return buffer.getvalue()
+
+    def get_thumbnail_path(self, content_hash: str) -> str:
+        """
+        Returns the path a thumbnail is cached at
+        :param content_hash: The content hash of the image, see FileHash.get_sha256
+        :return: The path of the cached thumbnail
+        """
+        return os.path.join(self.cache_dir, content_hash[:2],
+                            f"{content_hash}-{self.size[0]}x{self.size[1]}-q{self.quality}.jpg")
+
+    def get_cached(self, content_hash: str) -> Optional[bytes]:
+        """
+        Returns the cached thumbnail of an image by its content hash, without reading the image
+        :param content_hash: The content hash of the image, see FileHash.get_sha256
+        :return: The encoded thumbnail, None if it is not cached (or there is no cache_dir)
+        """
+        if self.cache_dir is None:
+            return None
+        thumbnail_path: str = self.get_thumbnail_path(content_hash)
+        if not os.path.isfile(thumbnail_path):
+            return None
+        with open(thumbnail_path, 'rb') as f:
+            return f.read()
+
+    def get(self, image_path: str) -> bytes:
+        """
+        Returns the thumbnail of an image, from the cache when it was made before
+        :param image_path: The path of the image
+        :return: The encoded thumbnail
+        """
+        if self.cache_dir is None:
+            return self.make_thumbnail(image_path, self.size, self.quality)
+
+        thumbnail_path: str = self.get_thumbnail_path(FileHash.get_sha256(image_path))
+        if os.path.isfile(thumbnail_path):
+            with open(thumbnail_path, 'rb') as f:
+                return f.read()
+
+        data: bytes = self.make_thumbnail(image_path, self.size, self.quality)
+        self.put(thumbnail_path, data)
+        return data
+
+    @staticmethod
+    def put(thumbnail_path: str, data: bytes) -> None:
+        """
+        Writes a thumbnail to the cache atomically, through a temporary file of its own,
+        so concurrent workers writing the same thumbnail never see a partial file
+        :param thumbnail_path: The path of the cached thumbnail, see get_thumbnail_path
+        :param data: The encoded thumbnail
+        :return: None
+        """
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        fd: int
+        tmp_path: str
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(thumbnail_path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, thumbnail_path)
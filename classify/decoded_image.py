@@ -0,0 +1,161 @@
+# External Imports
+import os
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+from typing import Dict, Optional, Tuple, Union
+
+
+class DecodedImage(object):
+    """
+    An image decoded once and shared by all extractors.
+    The BGR and grayscale pixels (at full or reduced resolution) and the HSV and Otsu-binarized views are
+    computed lazily, the first time they are needed, and memoized.
+    The pixels are rotated upright by the EXIF orientation of the image, as cv2.imread does
+    """
+    read_flags: Dict[int, int] = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+
+    def __init__(self, image_path: str):
+        """
+        Initialize the DecodedImage class, nothing is decoded yet
+        :param image_path: The path to the image
+        """
+        assert os.path.isfile(image_path), f"File '{image_path}' does not exist"
+        self.image_path: str = image_path
+        self._bgr: Dict[int, Optional[np.ndarray]] = {}
+        self._gray: Dict[int, Optional[np.ndarray]] = {}
+        self._hsv: Optional[np.ndarray] = None
+        self._binary: Optional[np.ndarray] = None
+
+    @classmethod
+    def of(cls, image: Union[str, 'DecodedImage']) -> 'DecodedImage':
+        """
+        Wraps an image path, or passes a DecodedImage through, so extractors accept both
+        :param image: The path to the image, or a DecodedImage
+        :return: A DecodedImage
+        """
+        return image if isinstance(image, DecodedImage) else cls(image)
+
+    def get_bgr(self, reduction: int = 1) -> Optional[np.ndarray]:
+        """
+        Returns the BGR pixels at 1/reduction scale. Reduced scales are decoded directly (with libjpeg's
+        DCT scaling for JPEGs), unless the full resolution pixels are decoded already and can be resized instead
+        :param reduction: The scale reduction, one of the keys of read_flags
+        :return: A uint8 array of shape (height, width, 3), None if the image cannot be decoded
+        """
+        assert reduction in self.read_flags, f'reduction must be one of {sorted(self.read_flags)}, got {reduction}'
+        if reduction not in self._bgr:
+            full_bgr: Optional[np.ndarray] = self._bgr.get(1)
+            if reduction != 1 and full_bgr is not None:
+                self._bgr[reduction] = cv2.resize(full_bgr, (-(-full_bgr.shape[1] // reduction),
+                                                             -(-full_bgr.shape[0] // reduction)),
+                                                  interpolation=cv2.INTER_AREA)
+            else:
+                self._bgr[reduction] = self.read(reduction)
+        return self._bgr[reduction]
+
+    def read(self, reduction: int = 1) -> Optional[np.ndarray]:
+        """
+        Decodes the image from disk, falling back to PIL for formats OpenCV cannot read (e.g. GIF).
+        Both decoders apply the EXIF orientation
+        :param reduction: The scale reduction, one of the keys of read_flags
+        :return: The BGR pixels, None if the image cannot be decoded
+        """
+        bgr: Optional[np.ndarray] = cv2.imread(self.image_path, self.read_flags[reduction])
+        if bgr is not None:
+            return bgr
+        try:
+            with Image.open(self.image_path) as pil_img:
+                width: int = pil_img.width
+                height: int = pil_img.height
+                if reduction != 1:
+                    pil_img.draft('RGB', (pil_img.width // reduction, pil_img.height // reduction))
+                upright_img: Image.Image = ImageOps.exif_transpose(pil_img.convert('RGB'))
+                rgb: np.ndarray = np.asarray(upright_img)
+        except OSError:
+            return None
+        bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+        # exif_transpose may have swapped the axes
+        if upright_img.width != pil_img.width:
+            width, height = height, width
+
+        # draft only reduces JPEGs, and only by powers of 2 up to the requested size
+        size: Tuple[int, int] = (-(-width // reduction), -(-height // reduction))
+        if (bgr.shape[1], bgr.shape[0]) != size:
+            bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+        return bgr
+
+    @property
+    def bgr(self) -> Optional[np.ndarray]:
+        """
+        The full resolution BGR pixels, None if the image cannot be decoded
+        """
+        return self.get_bgr(1)
+
+    def get_gray(self, reduction: int = 1) -> Optional[np.ndarray]:
+        """
+        Returns the grayscale pixels (ITU-R 601-2 luma, as PIL's 'L' mode) at 1/reduction scale
+        :param reduction: The scale reduction, see get_bgr
+        :return: A uint8 array of shape (height, width), None if the image cannot be decoded
+        """
+        if reduction not in self._gray:
+            bgr: Optional[np.ndarray] = self.get_bgr(reduction)
+            self._gray[reduction] = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if bgr is not None else None
+        return self._gray[reduction]
+
+    @property
+    def gray(self) -> Optional[np.ndarray]:
+        """
+        The full resolution grayscale pixels, see get_gray
+        """
+        return self.get_gray(1)
+
+    @property
+    def hsv(self) -> Optional[np.ndarray]:
+        """
+        The full resolution HSV pixels (OpenCV's 0-179 hue range)
+        """
+        if self._hsv is None and self.bgr is not None:
+            self._hsv = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+        return self._hsv
+
+    @property
+    def binary(self) -> Optional[np.ndarray]:
+        """
+        The grayscale pixels binarized with Otsu's threshold
+        """
+        if self._binary is None and self.gray is not None:
+            _, self._binary = cv2.threshold(self.gray, thresh=0, maxval=255, type=cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return self._binary
+
+    @staticmethod
+    def to_pil(view: np.ndarray) -> Image.Image:
+        """
+        Wraps a single channel view as a PIL image, sharing its memory when the view is contiguous
+        :param view: A uint8 array of shape (height, width)
+        :return: A PIL image in 'L' mode
+        """
+        view = np.ascontiguousarray(view)
+        return Image.frombuffer('L', (view.shape[1], view.shape[0]), view, 'raw', 'L', 0, 1)
+
+    def release(self, is_reduced_kept: bool = False) -> None:
+        """
+        Drops the decoded pixels and views, they are decoded again if they are needed later
+        :param is_reduced_kept: If True, only the full resolution pixels and the views computed from them
+                                (HSV and binary) are dropped, the reduced scales are kept
+        :return: None
+        """
+        if is_reduced_kept:
+            self._bgr.pop(1, None)
+            self._gray.pop(1, None)
+        else:
+            self._bgr = {}
+            self._gray = {}
+        self._hsv = None
+        self._binary = None
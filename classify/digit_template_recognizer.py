@@ -0,0 +1,199 @@
+# External Imports
+import os
+import cv2
+import numpy as np
+from PIL import Image
+from typing import List, Optional, Tuple, Union
+
+
+class DigitTemplateRecognizer(object):
+    """
+    An in-process recognizer for the digits of the blue index boxes.
+    The digits are rendered in one fixed font, so every digit is segmented as a connected component of the
+    binarized box and classified by its nearest neighbours in a bank of normalized digit templates.
+    The bank is learned from boxes whose number is known (e.g. read by tesseract), see learn
+    """
+    def __init__(self, template_size: Tuple[int, int] = (16, 24), min_confidence: float = 0.85, k: int = 1):
+        """
+        Initialize the DigitTemplateRecognizer class
+        :param template_size: The (width, height) every digit is resized to before it is compared
+        :param min_confidence: The confidence below which a result should not be trusted (see is_confident)
+        :param k: The number of nearest templates voting for the label of a digit
+        """
+        assert type(k) is int and k > 0, f'k must be a positive int, got {k}'
+        assert 0.0 <= min_confidence <= 1.0, f'min_confidence must be in [0, 1], got {min_confidence}'
+        self.template_size: Tuple[int, int] = template_size
+        self.min_confidence: float = min_confidence
+        self.k: int = k
+        self.vectors: np.ndarray = np.zeros((0, template_size[0] * template_size[1]), dtype=np.float32)
+        self.labels: np.ndarray = np.zeros((0,), dtype='<U1')
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @staticmethod
+    def binarize(img: Union[Image.Image, np.ndarray]) -> np.ndarray:
+        """
+        Binarizes a box crop with Otsu's threshold, the digits being the minority of the pixels
+        :param img: The grayscale crop of a box
+        :return: A uint8 mask, 255 on the digits
+        """
+        gray: np.ndarray = np.asarray(img.convert('L') if isinstance(img, Image.Image) else img, dtype=np.uint8)
+        mask: np.ndarray
+        _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if np.count_nonzero(mask) > mask.size // 2:
+            mask = cv2.bitwise_not(mask)
+        return mask
+
+    @staticmethod
+    def segment(mask: np.ndarray, min_height_ratio: float = 0.5) -> List[np.ndarray]:
+        """
+        Splits a binarized box into its digits
+        :param mask: The mask returned by binarize
+        :param min_height_ratio: Components lower than this ratio of the tallest component are dropped as noise
+        :return: The mask of every digit, left to right
+        """
+        n_labels: int
+        labels: np.ndarray
+        stats: np.ndarray
+        n_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        height: int = mask.shape[0]
+        width: int = mask.shape[1]
+
+        # Components touching the border are the remains of the box edges or of the background
+        boxes: List[Tuple[int, int, int, int, int]] = []
+        for label in range(1, n_labels):
+            x, y, w, h = (int(v) for v in stats[label, :4])
+            if x == 0 or y == 0 or x + w == width or y + h == height:
+                continue
+            boxes.append((x, y, w, h, label))
+        if not boxes:
+            return []
+
+        max_height: int = max(box[3] for box in boxes)
+        return [(labels[y: y + h, x: x + w] == label).astype(np.uint8) * 255
+                for x, y, w, h, label in sorted(boxes) if h >= min_height_ratio * max_height]
+
+    def vectorize(self, digits: List[np.ndarray]) -> np.ndarray:
+        """
+        Resizes the digits to the template size and normalizes them to zero mean and unit length
+        :param digits: The digit masks returned by segment
+        :return: A float32 array of shape (len(digits), template width * template height)
+        """
+        vectors: np.ndarray = np.stack([
+            cv2.resize(digit, self.template_size, interpolation=cv2.INTER_AREA).ravel() for digit in digits
+        ]).astype(np.float32)
+        vectors -= vectors.mean(axis=1, keepdims=True)
+        norms: np.ndarray = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-6)
+
+    def add_templates(self, digits: List[np.ndarray], labels: str) -> None:
+        """
+        Adds digits to the template bank
+        :param digits: The digit masks returned by segment
+        :param labels: The digit every mask shows, one character per mask
+        :return: None
+        """
+        assert len(digits) == len(labels), f'got {len(digits)} digits but {len(labels)} labels'
+        assert labels.isdigit(), f'labels must be digits, got {labels}'
+        self.vectors = np.concatenate([self.vectors, self.vectorize(digits)])
+        self.labels = np.concatenate([self.labels, np.array(list(labels), dtype='<U1')])
+
+    def get_templates(self, start: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the templates of the bank from an index on, e.g. the ones learned since the bank had start templates
+        :param start: The index of the first template
+        :return: The template vectors and their labels
+        """
+        return self.vectors[start:], self.labels[start:]
+
+    def add_vectors(self, vectors: np.ndarray, labels: np.ndarray) -> None:
+        """
+        Adds templates returned by get_templates to the bank, e.g. the ones learned by a pool worker
+        :param vectors: The template vectors
+        :param labels: Their labels
+        :return: None
+        """
+        assert len(vectors) == len(labels), f'got {len(vectors)} vectors but {len(labels)} labels'
+        assert vectors.shape[1:] == self.vectors.shape[1:], \
+            f'vectors must be of shape (n, {self.vectors.shape[1]}), got {vectors.shape}'
+        self.vectors = np.concatenate([self.vectors, vectors.astype(np.float32)])
+        self.labels = np.concatenate([self.labels, labels.astype('<U1')])
+
+    def learn(self, img: Union[Image.Image, np.ndarray], number: str) -> bool:
+        """
+        Learns the digits of a box whose number is known
+        :param img: The grayscale crop of a box
+        :param number: The number in the box
+        :return: True if the box was segmented into exactly len(number) digits and learned
+        """
+        digits: List[np.ndarray] = self.segment(self.binarize(img))
+        if not number.isdigit() or len(digits) != len(number):
+            return False
+        self.add_templates(digits, number)
+        return True
+
+    def recognize(self, img: Union[Image.Image, np.ndarray]) -> Tuple[str, float]:
+        """
+        Recognizes the number in a box
+        :param img: The grayscale crop of a box
+        :return: The number and its confidence, the lowest cosine similarity of a digit to its nearest template.
+                 ('', 0.0) if no digit was found or the bank is empty
+        """
+        if len(self) == 0:
+            return '', 0.0
+        digits: List[np.ndarray] = self.segment(self.binarize(img))
+        if not digits:
+            return '', 0.0
+
+        # Cosine similarity of every digit to every template, in one matrix product
+        similarities: np.ndarray = self.vectorize(digits) @ self.vectors.T
+        k: int = min(self.k, len(self))
+        nearest: np.ndarray = np.argsort(-similarities, axis=1)[:, :k]
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        votes: np.ndarray
+        counts: np.ndarray
+
+        number: str = ''
+        for row in nearest:
+            votes, counts = np.unique(self.labels[row], return_counts=True)
+            number += str(votes[np.argmax(counts)])
+        confidence: float = float(np.clip(similarities[np.arange(len(digits)), nearest[:, 0]].min(), 0.0, 1.0))
+        return number, confidence
+
+    def is_confident(self, confidence: float) -> bool:
+        """
+        Checks if a recognition result may be trusted without a fallback
+        :param confidence: The confidence returned by recognize
+        :return: True if the confidence reaches min_confidence
+        """
+        return confidence >= self.min_confidence
+
+    def save(self, path: str) -> None:
+        """
+        Saves the template bank
+        :param path: The path of the .npz file
+        :return: None
+        """
+        directory: str = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f, vectors=self.vectors, labels=self.labels, template_size=np.array(self.template_size))
+
+    @classmethod
+    def load(cls, path: str, min_confidence: float = 0.85, k: int = 1) -> 'DigitTemplateRecognizer':
+        """
+        Loads a template bank saved by save
+        :param path: The path of the .npz file
+        :param min_confidence: See __init__
+        :param k: See __init__
+        :return: The recognizer
+        """
+        data = np.load(path)
+        recognizer: DigitTemplateRecognizer = cls(template_size=tuple(int(v) for v in data['template_size']),
+                                                  min_confidence=min_confidence, k=k)
+        recognizer.vectors = data['vectors'].astype(np.float32)
+        recognizer.labels = data['labels'].astype('<U1')
+        return recognizer
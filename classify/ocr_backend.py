@@ -0,0 +1,197 @@
+# External Imports
+from abc import ABC, abstractmethod
+import os
+import shlex
+import threading
+import pytesseract
+from PIL import Image
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+class OCRBackend(ABC):
+    """
+    The interface of an OCR engine used by the extractors.
+    Subclasses implement image_to_string, get_default returns the best backend available in this process
+    """
+    name: str = 'base'
+    _default: Optional['OCRBackend'] = None
+    _default_pid: Optional[int] = None
+
+    @abstractmethod
+    def image_to_string(self, img: Image.Image, lang: Optional[str] = None, config: str = '') -> str:
+        """
+        Recognizes the text in an image
+        :param img: The image to recognize
+        :param lang: The tesseract language(s), e.g. 'heb' or 'eng+heb' (Optional, tesseract's default if None)
+        :param config: Tesseract command line options, e.g. '--psm 6'
+        :return: The recognized text
+        """
+
+    @abstractmethod
+    def image_to_data(self, img: Image.Image, lang: Optional[str] = None, config: str = '') -> Dict[str, List]:
+        """
+        Recognizes the words in an image together with their bounding boxes
+        :param img: The image to recognize
+        :param lang: The tesseract language(s) (Optional, tesseract's default if None)
+        :param config: Tesseract command line options, e.g. '--psm 11'
+        :return: A dict of lists with (at least) the keys 'text', 'conf', 'left', 'top', 'width' and 'height',
+                 one item per word, as returned by pytesseract.image_to_data
+        """
+
+    @abstractmethod
+    def get_version(self) -> str:
+        """
+        Returns a string identifying the backend and its engine version, for cache keys
+        :return: The version string
+        """
+
+    def close(self) -> None:
+        """
+        Releases the resources held by the backend
+        :return: None
+        """
+        pass
+
+    @classmethod
+    def get_default(cls) -> 'OCRBackend':
+        """
+        Returns the default backend of this process: a persistent TesserocrBackend if tesserocr is installed,
+        otherwise a PytesseractBackend. The backend is created once per process (also in forked pool workers)
+        :return: The default backend
+        """
+        if OCRBackend._default is None or OCRBackend._default_pid != os.getpid():
+            OCRBackend._default = TesserocrBackend() if tesserocr is not None else PytesseractBackend()
+            OCRBackend._default_pid = os.getpid()
+        return OCRBackend._default
+
+
+class PytesseractBackend(OCRBackend):
+    """
+    The fallback backend, running the tesseract executable through pytesseract on every call.
+    Every call starts a new process and loads the language model again
+    """
+    name: str = 'pytesseract'
+    _version: Optional[str] = None
+
+    def image_to_string(self, img: Image.Image, lang: Optional[str] = None, config: str = '') -> str:
+        if lang is None and not config:
+            return pytesseract.image_to_string(img)
+        return pytesseract.image_to_string(img, lang=lang, config=config)
+
+    def image_to_data(self, img: Image.Image, lang: Optional[str] = None, config: str = '') -> Dict[str, List]:
+        return pytesseract.image_to_data(img, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+
+    def get_version(self) -> str:
+        # Asking the executable for its version starts a process, so it is only done once
+        if self._version is None:
+            try:
+                self._version = f"{self.name}-{pytesseract.get_tesseract_version()}"
+            except Exception:
+                self._version = f"{self.name}-unknown"
+        return self._version
+
+
+class TesserocrBackend(OCRBackend):
+    """
+    A persistent backend calling the tesseract C API through tesserocr.
+    The language model is loaded once per (language, configuration) and thread, and reused for every call.
+    Every engine created is also tracked across threads, so close releases them all
+    """
+    name: str = 'tesserocr'
+
+    def __init__(self):
+        assert tesserocr is not None, 'The tesserocr backend requires tesserocr to be installed'
+        self._local: threading.local = threading.local()
+        self._lock: threading.Lock = threading.Lock()
+        self._apis: List = []
+
+    @staticmethod
+    def parse_config(config: str) -> Tuple[Optional[int], Dict[str, str]]:
+        """
+        Parses the tesseract command line options supported by the C API
+        :param config: Tesseract command line options, e.g. '--psm 6 -c tessedit_char_whitelist=0123456789'
+        :return: The page segmentation mode (None if not given) and the variables to set
+        """
+        psm: Optional[int] = None
+        variables: Dict[str, str] = {}
+        tokens = shlex.split(config)
+        for i, token in enumerate(tokens):
+            if token == '--psm' and i + 1 < len(tokens):
+                psm = int(tokens[i + 1])
+            elif token == '-c' and i + 1 < len(tokens) and '=' in tokens[i + 1]:
+                key, value = tokens[i + 1].split('=', 1)
+                variables[key] = value
+        return psm, variables
+
+    def get_api(self, lang: Optional[str], config: str):
+        """
+        Returns this thread's engine for a language and configuration, creating it on first use
+        :param lang: The tesseract language(s)
+        :param config: Tesseract command line options
+        :return: A tesserocr.PyTessBaseAPI
+        """
+        apis: Optional[Dict] = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        key: Tuple[Optional[str], str] = (lang, config)
+        if key not in apis:
+            psm: Optional[int]
+            variables: Dict[str, str]
+            psm, variables = self.parse_config(config)
+            kwargs: Dict = {'lang': lang or 'eng'}
+            if psm is not None:
+                kwargs['psm'] = psm
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            for name, value in variables.items():
+                api.SetVariable(name, value)
+            apis[key] = api
+            with self._lock:
+                self._apis.append(api)
+        return apis[key]
+
+    def image_to_string(self, img: Image.Image, lang: Optional[str] = None, config: str = '') -> str:
+        api = self.get_api(lang, config)
+        api.SetImage(img)
+        text: str = api.GetUTF8Text()
+        api.Clear()
+        return text
+
+    def image_to_data(self, img: Image.Image, lang: Optional[str] = None, config: str = '') -> Dict[str, List]:
+        api = self.get_api(lang, config)
+        api.SetImage(img)
+        api.Recognize()
+        data: Dict[str, List] = {'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': []}
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(api.GetIterator(), level):
+            box = word.BoundingBox(level)
+            if box is None:
+                continue
+            data['text'].append(word.GetUTF8Text(level))
+            data['conf'].append(word.Confidence(level))
+            data['left'].append(box[0])
+            data['top'].append(box[1])
+            data['width'].append(box[2] - box[0])
+            data['height'].append(box[3] - box[1])
+        api.Clear()
+        return data
+
+    def get_version(self) -> str:
+        return f"{self.name}-{tesserocr.tesseract_version().split()[1]}"
+
+    def close(self) -> None:
+        """
+        Ends the engines of all threads. Must only be called once no thread is recognizing with the backend anymore,
+        threads using it afterwards create new engines
+        :return: None
+        """
+        with self._lock:
+            apis: List = self._apis
+            self._apis = []
+            self._local = threading.local()
+        for api in apis:
+            api.End()
@@ -0,0 +1,170 @@
+# External Imports
+from PIL import Image
+from typing import Dict, List, Optional, Tuple
+
+# Internal Imports
+from classify.ocr_backend import OCRBackend
+
+
+class OCRMontage(object):
+    """
+    Recognizes many small crops in a single OCR call by tiling them into one montage canvas.
+    Every crop is pasted into its own grid cell, and every word found by the OCR engine is mapped back
+    to the cell its bounding box center falls in
+    """
+    def __init__(
+            self,
+            ocr_backend: Optional[OCRBackend] = None,
+            padding: int = 20,
+            max_canvas_width: int = 2400,
+            config: str = '--psm 11',
+            lang: Optional[str] = None,
+    ):
+        """
+        Initialize the OCRMontage class
+        :param ocr_backend: The OCR engine to use. If None, the default backend of the process
+        :param padding: The white margin (in pixels) around every crop, keeping words of neighbouring crops apart
+        :param max_canvas_width: The maximal width of the montage, cells wrap into new rows beyond it
+        :param config: The tesseract options of the montage call, '--psm 11' (sparse text) finds every cell's text
+        :param lang: The tesseract language(s) (Optional)
+        """
+        assert type(padding) is int and padding >= 0, f'padding must be a non-negative int, got {padding}'
+        assert type(max_canvas_width) is int and max_canvas_width > 0, \
+            f'max_canvas_width must be a positive int, got {max_canvas_width}'
+        self.ocr_backend: Optional[OCRBackend] = ocr_backend
+        self.padding: int = padding
+        self.max_canvas_width: int = max_canvas_width
+        self.config: str = config
+        self.lang: Optional[str] = lang
+
+    def build(
+            self,
+            crops: List[Image.Image]
+    ) -> Tuple[Image.Image, List[Tuple[int, int, int, int]], Tuple[int, int, int]]:
+        """
+        Tiles the crops into a white grayscale canvas of equally sized cells
+        :param crops: The crops to tile
+        :return: The canvas, the (x, y, w, h) box every crop was pasted at,
+                 and the grid layout (cell width, cell height, number of columns)
+        """
+        assert len(crops) > 0, 'crops is empty'
+        cell_width: int = max(crop.width for crop in crops) + 2 * self.padding
+        cell_height: int = max(crop.height for crop in crops) + 2 * self.padding
+        n_columns: int = max(1, min(len(crops), self.max_canvas_width // cell_width))
+        n_rows: int = -(-len(crops) // n_columns)
+
+        canvas: Image.Image = Image.new('L', (cell_width * n_columns, cell_height * n_rows), color=255)
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        x: int
+        y: int
+
+        boxes: List[Tuple[int, int, int, int]] = []
+        for i, crop in enumerate(crops):
+            x = (i % n_columns) * cell_width + self.padding
+            y = (i // n_columns) * cell_height + self.padding
+            canvas.paste(crop.convert('L'), (x, y))
+            boxes.append((x, y, crop.width, crop.height))
+        return canvas, boxes, (cell_width, cell_height, n_columns)
+
+    @staticmethod
+    def get_word_cells(
+            data: Dict[str, List],
+            n_crops: int,
+            layout: Tuple[int, int, int]
+    ) -> List[Optional[int]]:
+        """
+        Finds the grid cell every word of an image_to_data result was found in
+        :param data: The image_to_data result of the montage, a dict of lists with the keys
+                     'text', 'left', 'top', 'width' and 'height'
+        :param n_crops: The number of crops in the montage
+        :param layout: The grid layout returned by build
+        :return: The cell of every word, in the order of data, None for empty words and words outside the cells
+        """
+        cell_width: int
+        cell_height: int
+        n_columns: int
+        cell_width, cell_height, n_columns = layout
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        center_x: float
+        center_y: float
+        cell: int
+
+        cells: List[Optional[int]] = []
+        for text, left, top, width, height in zip(data['text'], data['left'], data['top'],
+                                                  data['width'], data['height']):
+            center_x = int(left) + int(width) / 2
+            center_y = int(top) + int(height) / 2
+            cell = int(center_y // cell_height) * n_columns + int(center_x // cell_width)
+            is_in_cell: bool = 0 <= center_x < cell_width * n_columns and 0 <= cell < n_crops
+            cells.append(cell if str(text).strip() and is_in_cell else None)
+        return cells
+
+    @classmethod
+    def assign_words(
+            cls,
+            data: Dict[str, List],
+            n_crops: int,
+            layout: Tuple[int, int, int]
+    ) -> List[str]:
+        """
+        Maps the words of an image_to_data result back to the cells they were found in
+        :param data: The image_to_data result of the montage, see get_word_cells
+        :param n_crops: The number of crops in the montage
+        :param layout: The grid layout returned by build
+        :return: The text of every crop, its words ordered top to bottom and left to right
+        """
+        words: List[List[Tuple[int, int, str]]] = [[] for _ in range(n_crops)]
+        for cell, text, left, top in zip(cls.get_word_cells(data, n_crops, layout),
+                                         data['text'], data['left'], data['top']):
+            if cell is not None:
+                words[cell].append((int(top), int(left), str(text).strip()))
+        return [' '.join(text for _, _, text in sorted(cell_words)) for cell_words in words]
+
+    @classmethod
+    def assign_confidences(
+            cls,
+            data: Dict[str, List],
+            n_crops: int,
+            layout: Tuple[int, int, int]
+    ) -> List[Optional[float]]:
+        """
+        Maps the word confidences of an image_to_data result back to the cells they were found in
+        :param data: The image_to_data result of the montage, see get_word_cells, with a 'conf' key
+                     (tesseract's 0-100 confidence of every word, -1 for non-words)
+        :param n_crops: The number of crops in the montage
+        :param layout: The grid layout returned by build
+        :return: The confidence of every crop in [0, 1], the lowest of its words,
+                 None for crops without words (or if data has no confidences)
+        """
+        confidences: List[Optional[float]] = [None] * n_crops
+        if 'conf' not in data:
+            return confidences
+        for cell, conf in zip(cls.get_word_cells(data, n_crops, layout), data['conf']):
+            if cell is not None and float(conf) >= 0:
+                confidences[cell] = min(float(conf) / 100, 1.0 if confidences[cell] is None else confidences[cell])
+        return confidences
+
+    def recognize_with_confidences(self, crops: List[Image.Image]) -> Tuple[List[str], List[Optional[float]]]:
+        """
+        Recognizes the text of every crop with a single OCR call, with the confidence of the OCR engine
+        :param crops: The crops to recognize
+        :return: The text of every crop and its confidence (see assign_confidences), in the order of crops
+        """
+        if not crops:
+            return [], []
+        canvas: Image.Image
+        layout: Tuple[int, int, int]
+        canvas, _, layout = self.build(crops)
+        ocr_backend: OCRBackend = self.ocr_backend if self.ocr_backend is not None else OCRBackend.get_default()
+        data: Dict[str, List] = ocr_backend.image_to_data(canvas, lang=self.lang, config=self.config)
+        return self.assign_words(data, len(crops), layout), self.assign_confidences(data, len(crops), layout)
+
+    def recognize(self, crops: List[Image.Image]) -> List[str]:
+        """
+        Recognizes the text of every crop with a single OCR call
+        :param crops: The crops to recognize
+        :return: The text of every crop, in the order of crops
+        """
+        return self.recognize_with_confidences(crops)[0]
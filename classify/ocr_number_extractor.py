@@ -1,16 +1,59 @@
 # External Imports
 import cv2
 import numpy as np
-import pytesseract
 from PIL import Image
 import os
-from typing import Tuple, List, Optional
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Tuple, List, Optional, Union
+
+# Internal Imports
+from classify.decoded_image import DecodedImage
+from classify.digit_template_recognizer import DigitTemplateRecognizer
+from classify.ocr_backend import OCRBackend
+from classify.ocr_montage import OCRMontage
+from classify.ocr_result_cache import OCRResultCache
+
+
+@dataclass
+class ContourCandidate:
+    """
+    A blue contour considered for OCR, with the measures it was ranked by.
+    rejection_reason is None for candidates that may be OCRed
+    """
+    contour: np.ndarray
+    crop_rect: Optional[Tuple[int, int, int, int]]
+    bbox: Tuple[int, int, int, int]
+    area: float
+    aspect_ratio: float
+    rectangularity: float
+    n_vertices: int
+    score: float
+    rejection_reason: Optional[str] = None
+
+    @property
+    def accepted(self) -> bool:
+        return self.rejection_reason is None
+
 
 class OCRNumberExtractor(object):
     """
     An OCR extractor class to extract numbers from an image.
     All methods are static/class methods
     """
+    # Contour candidate filters, a blue index box is a reasonably large, roughly rectangular, landscape-ish box
+    min_contour_area: float = 100.0
+    min_aspect_ratio: float = 0.5
+    max_aspect_ratio: float = 10.0
+    min_rectangularity: float = 0.8
+    max_polygon_vertices: int = 6
+    polygon_epsilon: float = 0.02
+    max_ocr_attempts: int = 3
+
+    # Reduced resolution decoding, the blue box is found on a 1/n scale decode (see DecodedImage.get_bgr)
+    # and the box is OCRed at the coarsest scale that keeps it at least min_ocr_box_height pixels high
+    min_ocr_box_height: int = 48
+
     def __init__(self):
         pass
 
@@ -18,7 +61,7 @@ class OCRNumberExtractor(object):
     def preprocess(img: np.ndarray, contour: Optional[np.ndarray]) -> Image.Image:
         """
         Preprocess an image
-        :param img: The image to preprocess
+        :param img: The grayscale image to preprocess (see DecodedImage.get_gray), BGR images are converted
         :param contour: The contour to create a bbox from (Optional)
         :return: Preprocessed image
         """
@@ -31,11 +74,11 @@ class OCRNumberExtractor(object):
             x, y, w, h = cv2.boundingRect(contour)
             img = img[y: y + h, x: x + w]
 
-        pil_img = Image.fromarray(img)
-        bw_pil_img = pil_img.convert('L')
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        bw_pil_img: Image.Image = DecodedImage.to_pil(img)
         return bw_pil_img
 
-
     @staticmethod
     def get_contours(
             img: np.ndarray,
@@ -65,29 +108,228 @@ class OCRNumberExtractor(object):
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         return contours
 
+    @staticmethod
+    def get_masks(
+            rois: np.ndarray,
+            lower_blue_search_range: List[int],
+            upper_blue_search_range: List[int]
+    ) -> np.ndarray:
+        """
+        Computes the blue masks of a stack of same-size images in one pass:
+        the stack is viewed as a single tall image, so cvtColor and inRange run once for all of them
+        :param rois: A uint8 BGR stack of shape (n, height, width, 3)
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box
+        :return: A uint8 stack of masks of shape (n, height, width), 255 on blue pixels
+        """
+        assert rois.ndim == 4 and rois.shape[3] == 3, f'rois must be of shape (n, height, width, 3), got {rois.shape}'
+        n: int
+        height: int
+        width: int
+        n, height, width = rois.shape[:3]
+        hsv: np.ndarray = cv2.cvtColor(np.ascontiguousarray(rois).reshape(n * height, width, 3), cv2.COLOR_BGR2HSV)
+        mask: np.ndarray = cv2.inRange(hsv, np.array(lower_blue_search_range), np.array(upper_blue_search_range))
+        return mask.reshape(n, height, width)
+
     @classmethod
-    def extract_number_from_image(
+    def iter_batch_contour_candidates(
             cls,
-            image_path: str,
-            crop_rects: Optional[List[Optional[Tuple[int, int, int, int]]]] = None,
+            rois: Union[np.ndarray, Iterable[np.ndarray]],
             lower_blue_search_range: Optional[List[int]] = None,
             upper_blue_search_range: Optional[List[int]] = None,
-    ) -> Optional[str]:
+            batch_size: int = 64,
+            reduction: int = 1,
+    ) -> Iterator[List[ContourCandidate]]:
+        """
+        Ranks the blue box candidates of many corner ROIs, masking them in batches with get_masks.
+        Consecutive ROIs of the same size are stacked together, so an iterator of ROIs is consumed lazily
+        :param rois: A (n, height, width, 3) BGR stack, or an iterable of BGR ROIs
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box (Optional)
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box (Optional)
+        :param batch_size: The maximal number of ROIs masked in one pass
+        :param reduction: The scale (1/reduction) the ROIs were decoded at, see rank_contours
+        :return: An iterator over the ranked candidates of every ROI, in the order of rois
+        """
+        assert type(batch_size) is int and batch_size > 0, f'batch_size must be a positive int, got {batch_size}'
+        _, lower_blue_search_range, upper_blue_search_range = cls.validate_search_params(
+            None, lower_blue_search_range, upper_blue_search_range
+        )
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        masks: np.ndarray
+        contours: Tuple[np.ndarray, ...]
+
+        batch: List[np.ndarray] = []
 
+        def flush() -> Iterator[List[ContourCandidate]]:
+            masks = cls.get_masks(np.stack(batch), lower_blue_search_range, upper_blue_search_range)
+            batch.clear()
+            # Contours are found per mask, blobs must not merge across neighbouring ROIs
+            for mask in masks:
+                contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                yield cls.rank_contours(contours, reduction=reduction)
+
+        for roi in rois:
+            if batch and (len(batch) >= batch_size or roi.shape != batch[0].shape):
+                yield from flush()
+            batch.append(roi)
+        if batch:
+            yield from flush()
+
+    @classmethod
+    def rank_contours(
+            cls,
+            contours: Iterable[np.ndarray],
+            crop_rect: Optional[Tuple[int, int, int, int]] = None,
+            reduction: int = 1,
+    ) -> List[ContourCandidate]:
         """
-        Extracts the number from an image, if crop rects are passed,
-        it will try to extract the number from the crop rects and stop
-        once it finds the first number.
-        :param image_path: The path to the image
-        :param crop_rects: The crop rectangles to search in, the algorithm will return the first number it finds.
-                           If None, the entire image will be checked for numbers
-        :param lower_blue_search_range: The lower bounds (in HSV) for the shade of blue we expect
-                                        the index numbers to appear in
-        :param upper_blue_search_range: The upper bounds (in HSV) for the shade of blue we expect
-                                        the index numbers to appear in
-        :return: A string containing the number from the image
+        Measures every contour, rejects the ones that cannot be a blue index box and ranks the rest,
+        the largest and most rectangular first
+        :param contours: The contours returned by get_contours
+        :param crop_rect: The crop rectangle the contours were found in (Optional)
+        :param reduction: The scale (1/reduction) of the image the contours were found in,
+                          min_contour_area is given at full resolution
+        :return: The accepted candidates ordered by descending score, followed by the rejected ones
+                 (each with its rejection reason)
         """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        area: float
+        bbox: Tuple[int, int, int, int]
+        aspect_ratio: float
+        rectangularity: float
+        n_vertices: int
+        rejection_reason: Optional[str]
+
+        min_contour_area: float = cls.min_contour_area / reduction ** 2
+        candidates: List[ContourCandidate] = []
+        for contour in contours:
+            area = float(cv2.contourArea(contour))
+            bbox = tuple(int(v) for v in cv2.boundingRect(contour))
+            aspect_ratio = bbox[2] / bbox[3] if bbox[3] > 0 else 0.0
+            rectangularity = area / (bbox[2] * bbox[3]) if bbox[2] * bbox[3] > 0 else 0.0
+            n_vertices = len(cv2.approxPolyDP(contour, cls.polygon_epsilon * cv2.arcLength(contour, True), True))
+
+            rejection_reason = None
+            if area < min_contour_area:
+                rejection_reason = f'area {area:.0f} < {min_contour_area:.0f}'
+            elif not cls.min_aspect_ratio <= aspect_ratio <= cls.max_aspect_ratio:
+                rejection_reason = f'aspect ratio {aspect_ratio:.2f} not in ' \
+                                   f'[{cls.min_aspect_ratio}, {cls.max_aspect_ratio}]'
+            elif rectangularity < cls.min_rectangularity:
+                rejection_reason = f'rectangularity {rectangularity:.2f} < {cls.min_rectangularity}'
+            elif not 4 <= n_vertices <= cls.max_polygon_vertices:
+                rejection_reason = f'{n_vertices} polygon vertices not in [4, {cls.max_polygon_vertices}]'
+
+            candidates.append(ContourCandidate(contour=contour, crop_rect=crop_rect, bbox=bbox, area=area,
+                                               aspect_ratio=aspect_ratio, rectangularity=rectangularity,
+                                               n_vertices=n_vertices, score=area * rectangularity,
+                                               rejection_reason=rejection_reason))
+
+        candidates.sort(key=lambda candidate: (not candidate.accepted, -candidate.score))
+        return candidates
+
+    @classmethod
+    def get_contour_candidates(
+            cls,
+            img: np.ndarray,
+            crop_rects: List[Optional[Tuple[int, int, int, int]]],
+            lower_blue_search_range: List[int],
+            upper_blue_search_range: List[int],
+            reduction: int = 1,
+    ) -> List[ContourCandidate]:
+        """
+        Returns the ranked contour candidates of all crop rectangles of an image.
+        Useful for debugging why a box was (not) OCRed
+        :param img: The image (BGR)
+        :param crop_rects: The crop rectangles to search in (at full resolution), None searches the entire image
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box
+        :param reduction: The scale (1/reduction) img was decoded at
+        :return: The candidates of every crop rectangle in order, accepted ones first within each rectangle.
+                 Their bboxes are relative to the (reduced) crop they were found in
+        """
+        candidates: List[ContourCandidate] = []
+        for crop_rect in crop_rects:
+            candidates.extend(cls.get_crop_candidates(img, crop_rect, lower_blue_search_range,
+                                                      upper_blue_search_range, reduction)[1])
+        return candidates
+
+    @classmethod
+    def get_crop_candidates(
+            cls,
+            img: np.ndarray,
+            crop_rect: Optional[Tuple[int, int, int, int]],
+            lower_blue_search_range: List[int],
+            upper_blue_search_range: List[int],
+            reduction: int = 1,
+    ) -> Tuple[np.ndarray, List[ContourCandidate]]:
+        """
+        Crops an image to a crop rectangle and ranks the contours found in it
+        :param img: The image (BGR)
+        :param crop_rect: The crop rectangle to search in (at full resolution), None searches the entire image
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box
+        :param reduction: The scale (1/reduction) img was decoded at
+        :return: The cropped image and its ranked candidates
+        """
+        cropped_img: np.ndarray = cls.crop(img, cls.scale_crop_rect(crop_rect, reduction))
+        contours: Tuple[np.ndarray, ...] = cls.get_contours(img=cropped_img,
+                                                             lower_blue_search_range=lower_blue_search_range,
+                                                             upper_blue_search_range=upper_blue_search_range)
+        return cropped_img, cls.rank_contours(contours, crop_rect=crop_rect, reduction=reduction)
 
+    @staticmethod
+    def crop(img: np.ndarray, crop_rect: Optional[Tuple[int, int, int, int]]) -> np.ndarray:
+        """
+        Crops an image to a crop rectangle
+        :param img: The image
+        :param crop_rect: The (top, left, bottom, right) rectangle, None keeps the entire image
+        :return: The cropped image (a view)
+        """
+        return img[crop_rect[0]: crop_rect[2], crop_rect[1]: crop_rect[3]] if crop_rect is not None else img
+
+    @staticmethod
+    def scale_crop_rect(
+            crop_rect: Optional[Tuple[int, int, int, int]],
+            reduction: int
+    ) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Scales a full resolution crop rectangle to an image decoded at 1/reduction scale
+        :param crop_rect: The (top, left, bottom, right) rectangle, or None
+        :param reduction: The scale reduction
+        :return: The scaled rectangle (rounded outwards), None if crop_rect is None
+        """
+        if crop_rect is None or reduction == 1:
+            return crop_rect
+        return (crop_rect[0] // reduction, crop_rect[1] // reduction,
+                -(-crop_rect[2] // reduction), -(-crop_rect[3] // reduction))
+
+    @classmethod
+    def get_ocr_reduction(cls, box_height: int) -> int:
+        """
+        Returns the coarsest scale a box can be OCRed at
+        :param box_height: The height of the box at full resolution
+        :return: The largest reduction keeping the box at least min_ocr_box_height pixels high (1 if none does)
+        """
+        for reduction in sorted(DecodedImage.read_flags, reverse=True):
+            if box_height / reduction >= cls.min_ocr_box_height:
+                return reduction
+        return 1
+
+    @staticmethod
+    def validate_search_params(
+            crop_rects: Optional[List[Optional[Tuple[int, int, int, int]]]] = None,
+            lower_blue_search_range: Optional[List[int]] = None,
+            upper_blue_search_range: Optional[List[int]] = None,
+    ) -> Tuple[List[Optional[Tuple[int, int, int, int]]], List[int], List[int]]:
+        """
+        Replaces missing search parameters with their defaults and asserts they are valid
+        :param crop_rects: The crop rectangles to search in (Optional, the entire image if None)
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box (Optional)
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box (Optional)
+        :return: The crop rectangles, the lower bounds and the upper bounds
+        """
         # Replace Nones with defaults
         if lower_blue_search_range is None:
             lower_blue_search_range: List[int] = [90, 50, 50]
@@ -97,7 +339,6 @@ class OCRNumberExtractor(object):
             crop_rects: Optional[List[Optional[Tuple[int, int, int, int]]]] = [None]
 
         # Assert all inputs are valid
-        assert os.path.isfile(image_path), f"File '{image_path}' does not exist"
         assert type(lower_blue_search_range) is list, "lower_blue_search_range is not a list"
         assert type(upper_blue_search_range) is list, "upper_blue_search_range is not a list"
         assert type(crop_rects) is list, "crop_rects is not a list"
@@ -111,36 +352,380 @@ class OCRNumberExtractor(object):
                 for i in crop_rect:
                     assert type(i) is int, "crop_rects is not a int"
 
+        return crop_rects, lower_blue_search_range, upper_blue_search_range
+
+    @classmethod
+    def iter_number_crops_from_file(
+            cls,
+            image: Union[str, DecodedImage],
+            crop_rects: List[Optional[Tuple[int, int, int, int]]],
+            lower_blue_search_range: List[int],
+            upper_blue_search_range: List[int],
+            detection_reduction: int = 4,
+            candidates_per_crop_rect: Optional[List[List[ContourCandidate]]] = None,
+    ) -> Iterator[Tuple[Optional[Tuple[int, int, int, int]], Image.Image]]:
+        """
+        Yields the preprocessed crop of the best blue box candidates in an image, in the order they should be OCRed.
+        Rejected contours are skipped and at most max_ocr_attempts crops are yielded per image.
+        The blue boxes are searched at 1/detection_reduction scale, and every box is cut out of a decode at the
+        coarsest scale that is still legible for OCR (see get_ocr_reduction), which is decoded only if a box needs it.
+        With a detection_reduction of 1, the full resolution image is searched
+        :param image: The path to the image, or the DecodedImage shared with other extractors
+        :param crop_rects: The crop rectangles to search in (at full resolution), None searches the entire image
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box
+        :param detection_reduction: The scale reduction the boxes are searched at,
+                                    one of the keys of DecodedImage.read_flags
+        :param candidates_per_crop_rect: The ranked candidates of every crop rectangle, if they were searched already
+                                         (see get_batch_candidates) (Optional, searched here if None)
+        :return: An iterator over (crop rect, preprocessed crop of a candidate)
+        """
+        decoded_image: DecodedImage = DecodedImage.of(image)
+        img: Optional[np.ndarray] = None
+        if candidates_per_crop_rect is None:
+            img = decoded_image.get_bgr(detection_reduction)
+            if img is None:
+                print(f'Could not decode {decoded_image.image_path}')
+                return
+
         # Declare all loop-variable types once in advance (for Cythonization)
-        first_cropped_img: np.ndarray
-        contours: Tuple[np.ndarray, ...]
-        cropped_img: np.ndarray
-        bw_pil_img: Image.Image
-        text: str
-        number: str
+        candidates: List[ContourCandidate]
+        ocr_reduction: int
+        factor: float
+        top: int
+        left: int
+        x: int
+        y: int
+        w: int
+        h: int
 
-        # Load the image from disk
-        img: np.ndarray = cv2.imread(image_path)
-        for crop_rect in crop_rects:
-            # Crop the image if needed
-            first_cropped_img = img[crop_rect[0]: crop_rect[2], crop_rect[1]: crop_rect[3]] \
-                if crop_rect is not None else img
+        n_attempts: int = 0
+        for i, crop_rect in enumerate(crop_rects):
+            if candidates_per_crop_rect is not None:
+                candidates = candidates_per_crop_rect[i]
+            else:
+                _, candidates = cls.get_crop_candidates(img, crop_rect, lower_blue_search_range,
+                                                        upper_blue_search_range, detection_reduction)
+            scaled_crop_rect: Optional[Tuple[int, int, int, int]] = cls.scale_crop_rect(crop_rect, detection_reduction)
+            top, left = scaled_crop_rect[:2] if scaled_crop_rect is not None else (0, 0)
+            for candidate in candidates:
+                if not candidate.accepted:
+                    break
+                if n_attempts >= cls.max_ocr_attempts:
+                    return
+                n_attempts += 1
 
-            contours = cls.get_contours(img=first_cropped_img,
-                                        lower_blue_search_range=lower_blue_search_range,
-                                        upper_blue_search_range=upper_blue_search_range)
+                # Cut the box out of the memoized grayscale view at the OCR scale,
+                # copied so the crop does not keep the whole decode alive once it is released
+                x, y, w, h = candidate.bbox
+                ocr_reduction = cls.get_ocr_reduction(h * detection_reduction)
+                factor = detection_reduction / ocr_reduction
+                box_img: np.ndarray = decoded_image.get_gray(ocr_reduction)[
+                    int((top + y) * factor): int((top + y + h) * factor),
+                    int((left + x) * factor): int((left + x + w) * factor)
+                ].copy()
+                yield crop_rect, cls.preprocess(img=box_img, contour=None)
 
-            # Find the bounding box for the largest contour (which should be the blue rectangle)
-            for contour in contours:
-                bw_pil_img = cls.preprocess(img=first_cropped_img, contour=contour)
+    @classmethod
+    def get_batch_candidates(
+            cls,
+            decoded_images: List[DecodedImage],
+            crop_rects: List[Optional[Tuple[int, int, int, int]]],
+            lower_blue_search_range: List[int],
+            upper_blue_search_range: List[int],
+            detection_reduction: int = 4,
+            max_rois_per_mask_batch: int = 64,
+    ) -> List[Optional[List[List[ContourCandidate]]]]:
+        """
+        Ranks the blue box candidates of every crop rectangle of many images, masking the crops of all images
+        together in batches (see iter_batch_contour_candidates)
+        :param decoded_images: The images
+        :param crop_rects: The crop rectangles to search in (at full resolution), None searches the entire image
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box
+        :param detection_reduction: The scale reduction the boxes are searched at
+        :param max_rois_per_mask_batch: The maximal number of crops masked in one pass
+        :return: The candidates of every crop rectangle of every image, in the format of the
+                 candidates_per_crop_rect argument of iter_number_crops_from_file. None for images that cannot be decoded
+        """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        img: Optional[np.ndarray]
+
+        imgs: List[Optional[np.ndarray]] = []
+        for decoded_image in decoded_images:
+            img = decoded_image.get_bgr(detection_reduction)
+            if img is None:
+                print(f'Could not decode {decoded_image.image_path}')
+            imgs.append(img)
 
-                # Perform OCR on the cropped image
-                text = pytesseract.image_to_string(bw_pil_img)
-                number = ''.join([c for c in text if c.isdigit()])
+        rois: Iterator[np.ndarray] = (cls.crop(img, cls.scale_crop_rect(crop_rect, detection_reduction))
+                                      for img in imgs if img is not None for crop_rect in crop_rects)
+        candidates: Iterator[List[ContourCandidate]] = cls.iter_batch_contour_candidates(
+            rois, lower_blue_search_range, upper_blue_search_range, batch_size=max_rois_per_mask_batch,
+            reduction=detection_reduction
+        )
+        return [[next(candidates) for _ in crop_rects] if img is not None else None for img in imgs]
 
+    @staticmethod
+    def get_number_from_text(text: str) -> str:
+        """
+        Keeps only the digits of an OCR result
+        :param text: The OCR result
+        :return: The digits, an empty string if there are none
+        """
+        return ''.join([c for c in text if c.isdigit()])
+
+    @classmethod
+    def get_cache_key(
+            cls,
+            image_path: Union[str, DecodedImage],
+            backend_version: str,
+            crop_rects: Optional[List[Optional[Tuple[int, int, int, int]]]] = None,
+            lower_blue_search_range: Optional[List[int]] = None,
+            upper_blue_search_range: Optional[List[int]] = None,
+            detection_reduction: int = 4,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+    ) -> str:
+        """
+        Returns the OCRResultCache key of the number of an image,
+        covering its content and every parameter the number depends on
+        :param image_path: The path to the image, or its DecodedImage
+        :param backend_version: The version of the OCR backend, see OCRBackend.get_version
+        :param crop_rects: See extract_number_from_image
+        :param lower_blue_search_range: See extract_number_from_image
+        :param upper_blue_search_range: See extract_number_from_image
+        :param detection_reduction: See extract_number_from_image
+        :param digit_recognizer: See extract_number_from_image. Its configuration is part of the key, so a number
+                                 the templates recognized is never reused as if tesseract read it (Optional)
+        :return: The cache key
+        """
+        crop_rects, lower_blue_search_range, upper_blue_search_range = cls.validate_search_params(
+            crop_rects, lower_blue_search_range, upper_blue_search_range
+        )
+        params: Dict = {
+            'extractor': cls.__name__,
+            'crop_rects': crop_rects,
+            'lower_blue_search_range': lower_blue_search_range,
+            'upper_blue_search_range': upper_blue_search_range,
+            'detection_reduction': detection_reduction,
+            'min_contour_area': cls.min_contour_area,
+            'aspect_ratio': [cls.min_aspect_ratio, cls.max_aspect_ratio],
+            'min_rectangularity': cls.min_rectangularity,
+            'max_polygon_vertices': cls.max_polygon_vertices,
+            'polygon_epsilon': cls.polygon_epsilon,
+            'max_ocr_attempts': cls.max_ocr_attempts,
+            'min_ocr_box_height': cls.min_ocr_box_height,
+            'digit_templates': {
+                'template_size': list(digit_recognizer.template_size),
+                'min_confidence': digit_recognizer.min_confidence,
+                'k': digit_recognizer.k,
+            } if digit_recognizer is not None else None,
+        }
+        return OCRResultCache.make_key(OCRResultCache.get_content_hash(DecodedImage.of(image_path).image_path),
+                                       params, backend_version)
+
+    @staticmethod
+    def recognize_digits(
+            bw_pil_img: Image.Image,
+            digit_recognizer: DigitTemplateRecognizer
+    ) -> Tuple[Optional[str], float]:
+        """
+        Recognizes a box with the template recognizer
+        :param bw_pil_img: The preprocessed crop of the box
+        :param digit_recognizer: The template recognizer
+        :return: The number, None if the recognizer is not confident enough (the box should go to tesseract),
+                 and its confidence (see DigitTemplateRecognizer.recognize)
+        """
+        number: str
+        confidence: float
+        number, confidence = digit_recognizer.recognize(bw_pil_img)
+        return (number if number and digit_recognizer.is_confident(confidence) else None), confidence
+
+    @classmethod
+    def extract_number_from_image(
+            cls,
+            image_path: Union[str, DecodedImage],
+            crop_rects: Optional[List[Optional[Tuple[int, int, int, int]]]] = None,
+            lower_blue_search_range: Optional[List[int]] = None,
+            upper_blue_search_range: Optional[List[int]] = None,
+            ocr_backend: Optional[OCRBackend] = None,
+            detection_reduction: int = 4,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+            confidences: Optional[Dict[str, float]] = None,
+    ) -> Optional[str]:
+
+        """
+        Extracts the number from an image, if crop rects are passed,
+        it will try to extract the number from the crop rects and stop
+        once it finds the first number.
+        :param image_path: The path to the image, or the DecodedImage shared with other extractors
+        :param crop_rects: The crop rectangles to search in, the algorithm will return the first number it finds.
+                           If None, the entire image will be checked for numbers
+        :param lower_blue_search_range: The lower bounds (in HSV) for the shade of blue we expect
+                                        the index numbers to appear in
+        :param upper_blue_search_range: The upper bounds (in HSV) for the shade of blue we expect
+                                        the index numbers to appear in
+        :param ocr_backend: The OCR engine to use. If None, the default backend of this process
+                            (a persistent engine when available, otherwise pytesseract)
+        :param detection_reduction: The scale reduction (1, 2, 4 or 8) the blue box is searched at,
+                                    see iter_number_crops_from_file. 1 decodes the image at full resolution
+        :param digit_recognizer: A template recognizer tried before tesseract (Optional). Boxes it is not confident
+                                 about are OCRed by tesseract, and the numbers tesseract reads are learned by it
+        :param confidences: A dict mapping image paths to the confidence of their number in [0, 1], updated in place
+                            when the number has one: the template recognizer's score (tesseract's image_to_string
+                            reports none) (Optional)
+        :return: A string containing the number from the image
+        """
+        decoded_image: DecodedImage = DecodedImage.of(image_path)
+        crop_rects, lower_blue_search_range, upper_blue_search_range = cls.validate_search_params(
+            crop_rects, lower_blue_search_range, upper_blue_search_range
+        )
+        if ocr_backend is None:
+            ocr_backend: OCRBackend = OCRBackend.get_default()
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        text: str
+        number: Optional[str]
+        confidence: float
+
+        # Load the image from disk, at reduced resolution
+        for crop_rect, bw_pil_img in cls.iter_number_crops_from_file(decoded_image, crop_rects,
+                                                                    lower_blue_search_range,
+                                                                    upper_blue_search_range,
+                                                                    detection_reduction):
+            # Try the in-process template recognizer first
+            if digit_recognizer is not None:
+                number, confidence = cls.recognize_digits(bw_pil_img, digit_recognizer)
                 if number:
-                    print(f'found a number, with crop rect: {crop_rect}')
+                    print(f'found a number with the digit templates, with crop rect: {crop_rect}')
+                    if confidences is not None:
+                        confidences[decoded_image.image_path] = confidence
                     return number
 
-        print(f'No number found in {image_path}')
+            # Perform OCR on the cropped image
+            text = ocr_backend.image_to_string(bw_pil_img)
+            number = cls.get_number_from_text(text)
+            if number and digit_recognizer is not None:
+                digit_recognizer.learn(bw_pil_img, number)
+
+            if number:
+                print(f'found a number, with crop rect: {crop_rect}')
+                return number
+
+        print(f'No number found in {decoded_image.image_path}')
         return None
+
+    @classmethod
+    def extract_numbers_from_images(
+            cls,
+            image_paths: Iterable[Union[str, DecodedImage]],
+            crop_rects: Optional[List[Optional[Tuple[int, int, int, int]]]] = None,
+            lower_blue_search_range: Optional[List[int]] = None,
+            upper_blue_search_range: Optional[List[int]] = None,
+            ocr_backend: Optional[OCRBackend] = None,
+            max_crops_per_batch: int = 256,
+            detection_reduction: int = 4,
+            digit_recognizer: Optional[DigitTemplateRecognizer] = None,
+            max_rois_per_mask_batch: int = 64,
+            confidences: Optional[Dict[str, float]] = None,
+    ) -> Dict[str, Optional[str]]:
+        """
+        Extracts the numbers from many images, OCRing the candidate crops of many images at once:
+        the crops are tiled into a montage that is recognized in a single OCR call and the digits are
+        mapped back to their crops by their bounding boxes.
+        The blue boxes are searched in batches as well, the crops of max_rois_per_mask_batch images at a time
+        are masked together (see get_batch_candidates). Every image is released once its crops are taken.
+        Every image gets the number of its first candidate crop with digits, as in extract_number_from_image
+        :param image_paths: The paths to the images, or their DecodedImages
+        :param crop_rects: The crop rectangles to search in, see extract_number_from_image
+        :param lower_blue_search_range: The lower bounds (in HSV) of the blue box, see extract_number_from_image
+        :param upper_blue_search_range: The upper bounds (in HSV) of the blue box, see extract_number_from_image
+        :param ocr_backend: The OCR engine to use. If None, the default backend of this process
+        :param max_crops_per_batch: The maximal number of crops recognized in one OCR call
+        :param detection_reduction: The scale reduction the blue boxes are searched at, see extract_number_from_image
+        :param digit_recognizer: A template recognizer tried before tesseract, see extract_number_from_image.
+                                 Only the boxes it is not confident about are put into montages
+        :param max_rois_per_mask_batch: The maximal number of crops masked in one pass,
+                                        also the number of images decoded at the detection scale at once
+        :param confidences: A dict mapping image paths to the confidence of their number in [0, 1], updated in place:
+                            the template recognizer's score, or the lowest confidence tesseract gave
+                            the words of the montage cell (see OCRMontage.assign_confidences) (Optional)
+        :return: A dict mapping every image path to its number (None if no number was found)
+        """
+        crop_rects, lower_blue_search_range, upper_blue_search_range = cls.validate_search_params(
+            crop_rects, lower_blue_search_range, upper_blue_search_range
+        )
+        montage: OCRMontage = OCRMontage(ocr_backend=ocr_backend)
+
+        # Every crop gets a slot in its image's list, filled right away by the template recognizer
+        # or when its batch is OCRed, so the first number is still picked in crop order
+        numbers_per_image: Dict[str, List[str]] = {}
+        confidences_per_image: Dict[str, List[Optional[float]]] = {}
+        batch_slots: List[Tuple[str, int]] = []
+        batch_crops: List[Image.Image] = []
+
+        def flush() -> None:
+            texts: List[str]
+            crop_confidences: List[Optional[float]]
+            texts, crop_confidences = montage.recognize_with_confidences(batch_crops)
+            for (crop_path, slot), crop, text, crop_confidence in zip(batch_slots, batch_crops, texts,
+                                                                      crop_confidences):
+                numbers_per_image[crop_path][slot] = cls.get_number_from_text(text)
+                confidences_per_image[crop_path][slot] = crop_confidence
+                if numbers_per_image[crop_path][slot] and digit_recognizer is not None:
+                    digit_recognizer.learn(crop, numbers_per_image[crop_path][slot])
+            batch_slots.clear()
+            batch_crops.clear()
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        number: Optional[str]
+        confidence: float
+        decoded_images: List[DecodedImage]
+        candidates_per_image: List[Optional[List[List[ContourCandidate]]]]
+
+        images: Iterator[Union[str, DecodedImage]] = iter(image_paths)
+        n_images_per_mask_batch: int = max(1, max_rois_per_mask_batch // len(crop_rects))
+        while True:
+            decoded_images = [DecodedImage.of(image) for image in islice(images, n_images_per_mask_batch)]
+            if not decoded_images:
+                break
+            candidates_per_image = cls.get_batch_candidates(decoded_images, crop_rects, lower_blue_search_range,
+                                                            upper_blue_search_range, detection_reduction,
+                                                            max_rois_per_mask_batch)
+            for decoded_image, candidates_per_crop_rect in zip(decoded_images, candidates_per_image):
+                image_path: str = decoded_image.image_path
+                numbers_per_image[image_path] = []
+                confidences_per_image[image_path] = []
+                if candidates_per_crop_rect is None:
+                    decoded_image.release()
+                    continue
+                for _, bw_pil_img in cls.iter_number_crops_from_file(decoded_image, crop_rects,
+                                                                     lower_blue_search_range,
+                                                                     upper_blue_search_range, detection_reduction,
+                                                                     candidates_per_crop_rect):
+                    number, confidence = cls.recognize_digits(bw_pil_img, digit_recognizer) \
+                        if digit_recognizer is not None else (None, 0.0)
+                    numbers_per_image[image_path].append(number or '')
+                    confidences_per_image[image_path].append(confidence if number else None)
+                    if number:
+                        break
+                    batch_slots.append((image_path, len(numbers_per_image[image_path]) - 1))
+                    batch_crops.append(bw_pil_img)
+                    if len(batch_crops) >= max_crops_per_batch:
+                        flush()
+
+                # The crops are taken, only they wait for the montage
+                decoded_image.release()
+        if batch_crops:
+            flush()
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        slot: Optional[int]
+
+        image_numbers: Dict[str, Optional[str]] = {}
+        for image_path, numbers in numbers_per_image.items():
+            slot = next((slot for slot, number in enumerate(numbers) if number), None)
+            image_numbers[image_path] = numbers[slot] if slot is not None else None
+            if slot is not None and confidences is not None and confidences_per_image[image_path][slot] is not None:
+                confidences[image_path] = confidences_per_image[image_path][slot]
+        return image_numbers
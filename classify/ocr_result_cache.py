@@ -0,0 +1,177 @@
+# External Imports
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Internal Imports
+from utils.file_hash import FileHash
+
+
+class OCRResultCache(object):
+    """
+    A persistent SQLite cache of OCR results, keyed by the content hash of the image, the extractor parameters
+    and the OCR backend version, so re-running an extractor over an archive only OCRs new or changed images.
+    Entries are evicted by age and, beyond max_entries, least recently used first, when the cache is opened and
+    closed and every evict_interval inserts in between
+    """
+    def __init__(
+            self,
+            db_path: str,
+            max_entries: Optional[int] = 100_000,
+            max_age: Optional[float] = None,
+            evict_interval: int = 1000,
+    ):
+        """
+        Initialize the OCRResultCache class, opening (or creating) the cache database
+        :param db_path: The path of the SQLite database file
+        :param max_entries: The maximal number of entries kept, the least recently used are evicted beyond it.
+                            If None, unlimited. While the cache is open, it may exceed it by up to evict_interval
+        :param max_age: The maximal age (in seconds) of an entry, older entries are evicted. If None, unlimited
+        :param evict_interval: The number of inserts after which the cache is evicted again
+        """
+        assert type(db_path) is str, f'db_path is not a string, got {type(db_path)}'
+        assert max_entries is None or (type(max_entries) is int and max_entries > 0), \
+            f'max_entries must be a positive int or None, got {max_entries}'
+        assert max_age is None or max_age > 0, f'max_age must be positive or None, got {max_age}'
+        assert type(evict_interval) is int and evict_interval > 0, \
+            f'evict_interval must be a positive int, got {evict_interval}'
+        self.db_path: str = db_path
+        self.max_entries: Optional[int] = max_entries
+        self.max_age: Optional[float] = max_age
+        self.evict_interval: int = evict_interval
+        self.n_puts_since_eviction: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+        directory: str = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection: sqlite3.Connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._connection.commit()
+        self.evict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __enter__(self) -> 'OCRResultCache':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @staticmethod
+    def get_content_hash(image_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Hashes the bytes of an image file
+        :param image_path: The path of the image
+        :param chunk_size: The number of bytes read at once
+        :return: The hex SHA-256 digest of the file
+        """
+        return FileHash.get_sha256(image_path, chunk_size)
+
+    @staticmethod
+    def make_key(content_hash: str, params: Dict[str, Any], backend_version: str) -> str:
+        """
+        Builds the cache key of an OCR result
+        :param content_hash: The content hash of the image, see get_content_hash
+        :param params: The extractor parameters the result depends on (must be JSON serializable)
+        :param backend_version: The OCR backend version, see OCRBackend.get_version
+        :return: The key
+        """
+        serialized_params: str = json.dumps(params, sort_keys=True, default=list)
+        return hashlib.sha256(f"{content_hash}|{serialized_params}|{backend_version}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Looks up an OCR result, counting a hit or a miss
+        :param key: The key, see make_key
+        :return: (True, the cached result) on a hit, (False, None) on a miss.
+                 A cached result may itself be None (e.g. no number was found in the image)
+        """
+        now: float = time.time()
+        with self._lock:
+            row: Optional[Tuple[str, float]] = self._connection.execute(
+                "SELECT value, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+                self.misses += 1
+                return False, None
+            self._connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self.hits += 1
+            return True, json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Stores an OCR result, evicting the cache every evict_interval inserts
+        :param key: The key, see make_key
+        :param value: The result (must be JSON serializable)
+        :return: None
+        """
+        now: float = time.time()
+        is_eviction_due: bool
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._connection.commit()
+            self.n_puts_since_eviction += 1
+            is_eviction_due = self.n_puts_since_eviction >= self.evict_interval
+        if is_eviction_due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes the entries older than max_age, then the least recently used entries beyond max_entries
+        :return: The number of entries removed
+        """
+        n_removed: int = 0
+        with self._lock:
+            self.n_puts_since_eviction = 0
+            if self.max_age is not None:
+                n_removed += self._connection.execute(
+                    "DELETE FROM results WHERE created < ?", (time.time() - self.max_age,)
+                ).rowcount
+            if self.max_entries is not None:
+                n_removed += self._connection.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                ).rowcount
+            self._connection.commit()
+        return n_removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit/miss statistics of this session
+        :return: A dict with the keys hits, misses, hit_rate and entries
+        """
+        n_lookups: int = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / n_lookups if n_lookups else 0.0,
+            'entries': len(self),
+        }
+
+    def close(self) -> None:
+        """
+        Evicts the expired and surplus entries and closes the database
+        :return: None
+        """
+        self.evict()
+        with self._lock:
+            self._connection.close()
@@ -1,90 +1,245 @@
 # External Imports
-import pytesseract
 from PIL import Image
-import cv2
 import numpy as np
 import os
+from typing import Dict, List, Optional, Union
+
+# Internal Imports
+from classify.decoded_image import DecodedImage
+from classify.ocr_backend import OCRBackend
+from classify.ocr_result_cache import OCRResultCache
+from utils.bounded_pool import BoundedPool
 
 class OCRTextExtractor:
     """
     An OCR extractor class to extract text from an image.
     All methods are static/class methods
     """
-    def __init__(self, langauge='heb', image_to_string_config='--psm 6'):
+    def __init__(
+            self,
+            langauge='heb',
+            image_to_string_config='--psm 6',
+            ocr_backend: Optional[OCRBackend] = None,
+            ocr_cache: Optional[OCRResultCache] = None,
+    ):
         """
         Initialize the OCRTextExtractor class
         :param langauge: The language of the OCR text - default: Hebrew
         :param image_to_string_config: The config mode to use for text extraction -
                                        default: '--psm 6'  (Assuming single uniform block of text)
+        :param ocr_backend: The OCR engine to use. If None, the default backend of the process running the OCR
+                            (a persistent engine when available, otherwise pytesseract)
+        :param ocr_cache: A cache of OCR results, images whose content and parameters were already OCRed
+                          are not OCRed again (Optional)
         """
         self.langauge = langauge
         self.image_to_string_config = image_to_string_config
+        self.ocr_backend: Optional[OCRBackend] = ocr_backend
+        self.ocr_cache: Optional[OCRResultCache] = ocr_cache
 
     @staticmethod
-    def preprocess_image(image_path: str) -> Image.Image:
+    def preprocess_image(image_path: Union[str, DecodedImage]) -> Image.Image:
         """
         Preprocess the image before passing it to the OCR extractor
-        :param image_path: The path of the image to preprocess
+        :param image_path: The path of the image to preprocess, or the DecodedImage shared with other extractors
         :return: A PIL Image object after preprocessing
         """
-        img: Image.ImageFile = Image.open(image_path)
-        gray_img: Image.Image = img.convert('L')
-        gray_img_np: np.ndarray = np.array(gray_img)
-
         # Use Otsu's thresholding to convert to black and white
-        binary_img: np.ndarray
-        _, binary_img = cv2.threshold(gray_img_np,
-                                      thresh=0,
-                                      maxval=255,
-                                      type=cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        binary_img: Optional[np.ndarray] = DecodedImage.of(image_path).binary
+        assert binary_img is not None, f"Could not decode '{DecodedImage.of(image_path).image_path}'"
 
-        # Convert back to PIL for consistency
-        binary_img_pil: Image.Image = Image.fromarray(binary_img)
+        # Wrap as PIL for consistency, sharing the binarized pixels
+        binary_img_pil: Image.Image = DecodedImage.to_pil(binary_img)
 
         return binary_img_pil
 
-    def extract_text_from_image(self, image_path: str) -> str:
+    def get_cache_key(self, image_path: Union[str, DecodedImage], backend_version: str) -> str:
+        """
+        Returns the OCRResultCache key of the text of an image
+        :param image_path: The path of the image, or its DecodedImage
+        :param backend_version: The version of the OCR backend, see OCRBackend.get_version
+        :return: The cache key
+        """
+        params: dict = {
+            'extractor': type(self).__name__,
+            'lang': self.langauge,
+            'config': self.image_to_string_config,
+        }
+        return OCRResultCache.make_key(OCRResultCache.get_content_hash(DecodedImage.of(image_path).image_path),
+                                       params, backend_version)
+
+    def extract_text_from_image(self, image_path: Union[str, DecodedImage]) -> str:
         """
         Extract text from an image
-        :param image_path: The path of the image to preprocess
+        :param image_path: The path of the image to preprocess, or the DecodedImage shared with other extractors
         :return: A string of text extracted from the image
         """
+        ocr_backend: OCRBackend = self.ocr_backend if self.ocr_backend is not None else OCRBackend.get_default()
+
+        # Reuse the text of an identical image OCRed with the same parameters
+        cache_key: Optional[str] = None
+        if self.ocr_cache is not None:
+            cache_key = self.get_cache_key(image_path, ocr_backend.get_version())
+            is_hit: bool
+            cached_text: Optional[str]
+            is_hit, cached_text = self.ocr_cache.get(cache_key)
+            if is_hit:
+                return cached_text
+
         # Preprocess the image to improve OCR results
         processed_img: Image.Image = self.preprocess_image(image_path)
 
-        # Use pytesseract to do OCR
-        text: str = pytesseract.image_to_string(
+        # Use the OCR backend to do OCR
+        text: str = ocr_backend.image_to_string(
             processed_img,
             lang=self.langauge,
             config=self.image_to_string_config
         )
 
+        if cache_key is not None:
+            self.ocr_cache.put(cache_key, text)
         return text
 
-    def save_text_files_in_folder(self, folder_path: str):
+    @staticmethod
+    def extract_text_with_params(
+            image_path: Union[str, DecodedImage],
+            langauge: str,
+            image_to_string_config: str,
+            ocr_backend: Optional[OCRBackend] = None,
+    ) -> str:
+        """
+        Extracts the text from an image with an extractor built from its parameters, the pool worker entry point
+        (the extractor's cache stays on the main process)
+        :param image_path: The path of the image, or the DecodedImage shared with other extractors
+        :param langauge: See __init__
+        :param image_to_string_config: See __init__
+        :param ocr_backend: See __init__
+        :return: A string of text extracted from the image
+        """
+        return OCRTextExtractor(langauge, image_to_string_config, ocr_backend).extract_text_from_image(image_path)
+
+    @staticmethod
+    def get_text_file_path(image_path: str) -> str:
+        """
+        Returns the path of the text file saved next to an image
+        :param image_path: The path of the image
+        :return: The path of its .txt sidecar
+        """
+        return f"{os.path.splitext(image_path)[0]}.txt"
+
+    @classmethod
+    def is_text_file_up_to_date(cls, image_path: str) -> bool:
+        """
+        Checks if the text file of an image was written after the image was last modified
+        :param image_path: The path of the image
+        :return: True if the sidecar exists and is not older than the image
         """
-        Save text files in folder
+        text_file_path: str = cls.get_text_file_path(image_path)
+        return os.path.isfile(text_file_path) and os.path.getmtime(text_file_path) >= os.path.getmtime(image_path)
+
+    @classmethod
+    def get_images_to_process(cls, folder_path: str, force: bool = False) -> List[str]:
+        """
+        Lists the images of a folder whose text file has to be (re)written
+        :param folder_path: The path of the folder
+        :param force: If True, all images, even those with an up to date text file
+        :return: The paths of the images, sorted
+        """
+        image_paths: List[str] = [
+            os.path.join(folder_path, filename) for filename in sorted(os.listdir(folder_path))
+            if filename.lower().endswith(('jpg', 'jpeg', 'png', 'bmp', 'gif'))
+        ]
+        if force:
+            return image_paths
+        return [image_path for image_path in image_paths if not cls.is_text_file_up_to_date(image_path)]
+
+    def save_text_file(self, image_path: str, text: str) -> None:
+        """
+        Saves the text of an image to its text file
+        :param image_path: The path of the image
+        :param text: The text extracted from the image
+        :return: None
+        """
+        text_file_path: str = self.get_text_file_path(image_path)
+        with open(text_file_path, "w", encoding="utf-8") as text_file:
+            text_file.write(text)
+        print(f"Saved text for {os.path.basename(image_path)} to {text_file_path}")
+
+    def save_text_files_in_folder(self, folder_path: str, force: bool = False):
+        """
+        Save text files in folder.
+        Images whose text file is newer than the image itself are skipped
         :param folder_path: The path of the folder to save the text files
+        :param force: If True, the text files of all images are rewritten
         :return: None
         """
         # Declare all loop-variable types once in advance (for Cythonization)
-        image_path: str
         text: str
-        text_file_path: str
 
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('jpg', 'jpeg', 'png', 'bmp', 'gif')):
-                image_path = os.path.join(folder_path, filename)
+        image_paths: List[str] = self.get_images_to_process(folder_path, force=force)
+        for image_path in image_paths:
+            # Extract the text from the image
+            text = self.extract_text_from_image(image_path)
+
+            # Save the extracted text to the file
+            self.save_text_file(image_path, text)
+
+        print(f"Saved {len(image_paths)} text files, the other text files are up to date")
+        if self.ocr_cache is not None:
+            print(f"OCR cache stats: {self.ocr_cache.get_stats()}")
+
+    def save_text_files_in_folder_parallel(
+            self,
+            folder_path: str,
+            max_workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            use_processes: bool = True,
+            force: bool = False,
+    ) -> None:
+        """
+        Save text files in folder, running the OCR on a pool of workers.
+        The text files are written on the main process as the results arrive, in sorted filename order.
+        Images whose text file is newer than the image itself are skipped
+        :param folder_path: The path of the folder to save the text files
+        :param max_workers: The number of OCR workers. If None, the number of available cores
+        :param max_in_flight: The maximal number of images submitted to the pool at once.
+                              If None, twice the number of workers
+        :param use_processes: Indicates if the OCR runs in worker processes (True) or threads (False).
+                              Worker processes use their own default backend
+        :param force: If True, the text files of all images are rewritten
+        :return: None
+        """
+        assert os.path.isdir(folder_path), f'folder_path is not a directory, got {folder_path}'
+        image_paths: List[str] = self.get_images_to_process(folder_path, force=force)
 
-                # Extract the text from the image
-                text = self.extract_text_from_image(image_path)
+        # Take the texts of the images OCRed before from the cache
+        cache_keys: Dict[str, str] = {}
+        image_paths_to_ocr: List[str] = image_paths
+        if self.ocr_cache is not None:
+            ocr_backend: OCRBackend = self.ocr_backend if self.ocr_backend is not None else OCRBackend.get_default()
+            backend_version: str = ocr_backend.get_version()
+            image_paths_to_ocr = []
+            for image_path in image_paths:
+                cache_keys[image_path] = self.get_cache_key(image_path, backend_version)
+                is_hit, text = self.ocr_cache.get(cache_keys[image_path])
+                if is_hit:
+                    self.save_text_file(image_path, text)
+                else:
+                    image_paths_to_ocr.append(image_path)
 
-                # Save the extracted text to the file
-                text_file_path = os.path.join(folder_path, f"{os.path.splitext(filename)[0]}.txt")
-                with open(text_file_path, "w", encoding="utf-8") as text_file:
-                    text_file.write(text)
-                print(f"Saved text for {filename} to {text_file_path}")
+        # OCR all other images in parallel
+        pool: BoundedPool = BoundedPool(max_workers=max_workers, max_in_flight=max_in_flight,
+                                        use_processes=use_processes)
+        for image_path, text in pool.imap(self.extract_text_with_params, image_paths_to_ocr,
+                                          self.langauge, self.image_to_string_config,
+                                          None if use_processes else self.ocr_backend):
+            self.save_text_file(image_path, text)
+            if self.ocr_cache is not None:
+                self.ocr_cache.put(cache_keys[image_path], text)
 
+        print(f"Saved {len(image_paths)} text files, the other text files are up to date")
+        if self.ocr_cache is not None:
+            print(f"OCR cache stats: {self.ocr_cache.get_stats()}")
 
 if __name__ == '__main__':
     folder_path_main = "~/PycharmProjects/scrape_classify_and_archive_images/data/archive_images"
@@ -1,8 +1,14 @@
 import os
 
+from archive.content_store import ContentStore
 from archive.image_name_organizer import ImageNameOrganizer
 from archive.csv_writer import CSVWriter
+from archive.index_exporter import IndexExporter
+from archive.thumbnail_cache import ThumbnailCache
+from classify.digit_template_recognizer import DigitTemplateRecognizer
+from classify.ocr_result_cache import OCRResultCache
 from scrape.html_parser import HTMLParser
+from scrape.http_cache import HTTPMetadataCache
 from scrape.image_downloader import ImageDownloader
 
 
@@ -10,24 +16,43 @@ def main():
     # Step 1: Extract image URLs from the given webpage
     url = "https://www.ilitazoulay.com/no-thing-dies/#"
     print(f"Extracting image URLs from: {url}")
-    image_urls = HTMLParser.get_all_image_urls_from_site(url)
+    http_cache = HTTPMetadataCache("data/.http_cache")
+    image_urls = HTMLParser.get_all_image_urls_from_site(url, cache=http_cache, rendition_policy="largest")
     print(f"Found {len(image_urls)} image URLs.")
 
     # Step 2: Download the images into a local folder
     output_dir = "data/archive_images"
     print(f"Downloading images to: {output_dir}")
-    ImageDownloader().download_image(image_urls, output_dir=output_dir)
+    downloader = ImageDownloader(cache=http_cache, content_store=ContentStore("data/.content_store"))
+    download_results = downloader.download_images_concurrently(image_urls, output_dir=output_dir)
+    print(f"Downloaded {sum(result.ok for result in download_results)}/{len(download_results)} images.")
 
     # Step 3: Run OCR to extract numbers and rename the images accordingly
+    # The digit templates learned from tesseract's results are kept across runs
     print("Extracting numbers and renaming images...")
-    ImageNameOrganizer.rename_images_in_folder(output_dir)
+    digit_templates_path = "data/.digit_templates.npz"
+    digit_recognizer = DigitTemplateRecognizer.load(digit_templates_path) if os.path.isfile(digit_templates_path) \
+        else DigitTemplateRecognizer()
+    with OCRResultCache("data/.ocr_cache.sqlite") as ocr_cache:
+        ImageNameOrganizer.rename_images_in_folder_parallel(output_dir, ocr_cache=ocr_cache,
+                                                            near_duplicate_max_distance=4, batch_size=32,
+                                                            digit_recognizer=digit_recognizer)
+    digit_recognizer.save(digit_templates_path)
 
     # Step 4: Create an Excel sheet containing all the renamed images
     excel_output_path = "outputs/image_index_sheet.xlsx"
     print(f"Generating Excel sheet: {excel_output_path}")
     os.makedirs(os.path.dirname(excel_output_path), exist_ok=True)
-    writer = CSVWriter(excel_output_path)
-    writer.create_sheet_from_images(output_dir, title="Image Indexes")
+    writer = CSVWriter(excel_output_path, thumbnail_cache=ThumbnailCache("data/.thumbnail_cache"))
+    writer.update_sheet_from_images(output_dir, title="Image Indexes")
+
+    # Step 5: Export the queryable index of the images next to the sheet
+    # The numbers and OCR confidences come from the manifest the renaming step recorded
+    urls_by_sha256 = http_cache.get_urls_by_sha256()
+    numbers = ImageNameOrganizer.load_numbers(output_dir)
+    for index_output_path in ["outputs/image_index.csv", "outputs/image_index.sqlite", "outputs/image_index.parquet"]:
+        if IndexExporter.get_exporter_class(index_output_path).is_available():
+            IndexExporter.export_folder(output_dir, index_output_path, urls_by_sha256=urls_by_sha256, numbers=numbers)
 
     print("Processing complete.")
 
@@ -1,8 +1,124 @@
 # External Imports
-from typing import Dict, List
+import codecs
+import html.parser
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from bs4 import BeautifulSoup
 from bs4.element import ResultSet
 import requests
+from urllib.parse import urldefrag, urljoin
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+# Internal Imports
+from scrape.http_cache import HTTPMetadataCache
+from scrape.image_url_normalizer import ImageURLNormalizer
+
+
+class ImgURLTokenizer(html.parser.HTMLParser):
+    """
+    An incremental tokenizer collecting the 'src' of every <img> tag, without building a document tree.
+    HTML can be fed in chunks, and the URLs found so far are taken with pop_urls
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.urls: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag == 'img':
+            src: Optional[str] = dict(attrs).get('src')
+            if src:
+                self.urls.append(src)
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.handle_starttag(tag, attrs)
+
+    def pop_urls(self) -> List[str]:
+        """
+        Returns the URLs found since the last call
+        :return: List of URLs of images
+        """
+        urls: List[str] = self.urls
+        self.urls = []
+        return urls
+
+
+class ImgURLTarget(object):
+    """
+    A parser target for lxml collecting the 'src' of every <img> tag.
+    lxml calls the target for every tag instead of building a document tree, the URLs found so far are taken with pop_urls
+    """
+    def __init__(self):
+        self.urls: List[str] = []
+
+    def start(self, tag: str, attrib: Dict[str, str]) -> None:
+        if tag == 'img':
+            src: Optional[str] = attrib.get('src')
+            if src:
+                self.urls.append(src)
+
+    def end(self, tag: str) -> None:
+        pass
+
+    def data(self, data: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def pop_urls(self) -> List[str]:
+        """
+        Returns the URLs found since the last call
+        :return: List of URLs of images
+        """
+        urls: List[str] = self.urls
+        self.urls = []
+        return urls
+
+
+class ImgAttributesTokenizer(html.parser.HTMLParser):
+    """
+    An incremental tokenizer collecting the attributes of every <img> and <picture> <source> tag,
+    without building a document tree
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags_attributes: List[Dict[str, Optional[str]]] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag in ('img', 'source'):
+            self.tags_attributes.append(dict(attrs))
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.handle_starttag(tag, attrs)
+
+    def pop_attributes(self) -> List[Dict[str, Optional[str]]]:
+        """
+        Returns the attributes of the tags found since the last call
+        :return: List of attribute dicts
+        """
+        tags_attributes: List[Dict[str, Optional[str]]] = self.tags_attributes
+        self.tags_attributes = []
+        return tags_attributes
+
+
+class LinkTokenizer(html.parser.HTMLParser):
+    """
+    An incremental tokenizer collecting the 'href' of every <a> tag, without building a document tree
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag == 'a':
+            href: Optional[str] = dict(attrs).get('href')
+            if href:
+                self.hrefs.append(href)
+
 
 class HTMLParser(object):
     """
@@ -32,11 +148,208 @@ class HTMLParser(object):
         return img_urls
 
     @staticmethod
-    def get_html_content(url: str, is_debug: bool = False) -> str:
+    def get_streaming_backends() -> Tuple[str, str]:
+        """
+        Returns the backends available for iter_img_urls
+        :return: Streaming backends
+        """
+        return 'html.parser', 'lxml'
+
+    @staticmethod
+    def get_streaming_parser_errors() -> Tuple[type, ...]:
+        """
+        Returns the errors the streaming backends of iter_img_urls raise on markup they cannot parse
+        :return: Parser error types
+        """
+        if lxml_etree is not None:
+            return AssertionError, ValueError, UnicodeError, lxml_etree.Error
+        return AssertionError, ValueError, UnicodeError
+
+    @classmethod
+    def iter_img_urls(cls, html_chunks: Iterable[Union[str, bytes]], backend: Optional[str] = None) -> Iterator[str]:
+        """
+        Extracts the URL for every image from HTML given in chunks, yielding every URL as soon as its tag was read.
+        No document tree is built (lxml reports the tags to a parser target), so memory does not grow with the size
+        of the page
+        :param html_chunks: The HTML as an iterable of strings (or bytes for the lxml backend)
+        :param backend: 'html.parser' (the standard library tokenizer) or 'lxml' (requires lxml).
+                        If None, lxml is used when it is installed
+        :return: An iterator over the URLs of images
+        """
+        if backend is None:
+            backend = 'lxml' if lxml_etree is not None else 'html.parser'
+        assert backend in cls.get_streaming_backends(), \
+            f'backend must be one of {cls.get_streaming_backends()}, got {backend}'
+        assert backend != 'lxml' or lxml_etree is not None, 'The lxml backend requires lxml to be installed'
+
+        # Both backends are fed chunk by chunk and only report the tags, neither keeps the parsed elements
+        parser: Union[ImgURLTokenizer, 'lxml_etree.HTMLParser']
+        collector: Union[ImgURLTokenizer, ImgURLTarget]
+        if backend == 'lxml':
+            collector = ImgURLTarget()
+            parser = lxml_etree.HTMLParser(target=collector)
+        else:
+            collector = parser = ImgURLTokenizer()
+
+        for chunk in html_chunks:
+            parser.feed(chunk)
+            yield from collector.pop_urls()
+        parser.close()
+        yield from collector.pop_urls()
+
+    @classmethod
+    def extract_img_urls_fast(cls, html_content: str, backend: Optional[str] = None) -> List[str]:
+        """
+        Extracts the URL for every image in the given HTML string with a streaming tokenizer.
+        Gives the same result as extract_img_urls, without building a BeautifulSoup tree
+        :param html_content: The HTML as a string to extract the image URLs from
+        :param backend: The streaming backend to use, see iter_img_urls
+        :return: List of URLs of images
+        """
+        return list(cls.iter_img_urls([html_content], backend=backend))
+
+    @staticmethod
+    def iter_img_attributes(html_chunks: Iterable[str]) -> Iterator[Dict[str, Optional[str]]]:
+        """
+        Yields the attributes of every <img> and <source> tag from HTML given in chunks
+        :param html_chunks: The HTML as an iterable of strings
+        :return: An iterator over attribute dicts
+        """
+        tokenizer: ImgAttributesTokenizer = ImgAttributesTokenizer()
+        for chunk in html_chunks:
+            tokenizer.feed(chunk)
+            yield from tokenizer.pop_attributes()
+        tokenizer.close()
+        yield from tokenizer.pop_attributes()
+
+    @classmethod
+    def extract_img_renditions(
+            cls,
+            html_content: str,
+            base_url: Optional[str] = None,
+            policy: str = 'largest',
+            target_width: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Extracts one URL per image in the given HTML string, reading src, srcset and lazy-load data-* attributes
+        and collapsing all renditions of an image (e.g. WordPress '-300x200' copies) into the one chosen by policy
+        :param html_content: The HTML as a string to extract the image URLs from
+        :param base_url: The URL of the page, used to resolve relative URLs (Optional)
+        :param policy: The rendition selection policy, see ImageURLNormalizer
+        :param target_width: The desired width in pixels for the 'closest' policy
+        :return: List of URLs of images, one per image
+        """
+        normalizer: ImageURLNormalizer = ImageURLNormalizer(base_url=base_url, policy=policy,
+                                                            target_width=target_width)
+        return normalizer.select_renditions(cls.iter_img_attributes([html_content]))
+
+    @staticmethod
+    def extract_links(html_content: str, base_url: str) -> List[str]:
+        """
+        Extracts the absolute URL of every link in the given HTML string, without fragments and duplicates
+        :param html_content: The HTML as a string to extract the links from
+        :param base_url: The URL of the page, used to resolve relative links
+        :return: List of http(s) URLs, in page order
+        """
+        tokenizer: LinkTokenizer = LinkTokenizer()
+        tokenizer.feed(html_content)
+        tokenizer.close()
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        link: str
+
+        links: Dict[str, None] = {}
+        for href in tokenizer.hrefs:
+            link = urldefrag(urljoin(base_url, href.strip())).url
+            if link.startswith(('http://', 'https://')):
+                links[link] = None
+        return list(links)
+
+    @classmethod
+    def iter_img_urls_from_site(
+            cls,
+            url: str,
+            chunk_size: int = 64 * 1024,
+            backend: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Streams the HTML of the given URL and yields the URL of every image while the page is still downloading
+        :param url: The URL of the page to extract the image URLs from
+        :param chunk_size: The size (in bytes) of the chunks the page is read in
+        :param backend: The streaming backend to use, see iter_img_urls
+        :return: An iterator over the URLs of images
+        """
+        yield from cls.iter_img_urls(cls.iter_html_chunks(url, chunk_size=chunk_size), backend=backend)
+
+    @staticmethod
+    def iter_html_chunks(
+            url: str,
+            is_debug: bool = False,
+            cache: Optional[HTTPMetadataCache] = None,
+            chunk_size: int = 64 * 1024,
+    ) -> Iterator[str]:
+        """
+        Streams the HTML string of a given URL in decoded chunks, so the page is never held in memory as a whole.
+        Behaves like get_html_content: a downloaded page is written to the cache while it streams,
+        and on a 304 Not Modified answer the cached page is read back in chunks
+        :param url: The URL to extract the HTML from
+        :param is_debug: Indicating if to print verbose information while extracting
+        :param cache: An HTTP metadata cache to make the request conditional with (Optional)
+        :param chunk_size: The size (in bytes) of the chunks the page is read in
+        :return: An iterator over the chunks of the HTML
+        """
+        headers: Dict[str, str] = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+        }
+
+        # Only revalidate if the body itself is cached, otherwise a 304 would leave us with nothing
+        is_body_cached: bool = cache is not None and os.path.isfile(cache.get_body_path(url))
+        if is_body_cached:
+            headers.update(cache.get_conditional_headers(url))
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        chunk: bytes
+        text: str
+
+        with requests.get(url, headers=headers, stream=True) as response:
+            if is_body_cached and response.status_code == 304:
+                if is_debug:
+                    print(f'HTML of {url} was not modified, using cached copy')
+                # The cache holds the page encoded as UTF-8, see below
+                decoder = codecs.getincrementaldecoder("utf-8")(errors='replace')
+                for chunk in cache.iter_body_chunks(url, chunk_size=chunk_size):
+                    yield decoder.decode(chunk)
+                yield decoder.decode(b'', final=True)
+                return
+
+            response.raise_for_status()
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+
+            def decoded_chunks() -> Iterator[str]:
+                for body_chunk in response.iter_content(chunk_size=chunk_size):
+                    yield decoder.decode(body_chunk)
+                yield decoder.decode(b'', final=True)
+
+            if cache is None:
+                yield from decoded_chunks()
+                return
+
+            # Store the page as UTF-8, as get_html_content does, whatever encoding it was served in
+            n_bytes: int = 0
+            for chunk in cache.store_body_chunks(url, (text.encode("utf-8") for text in decoded_chunks())):
+                n_bytes += len(chunk)
+                yield chunk.decode("utf-8")
+            cache.update(url, response.headers, content_length=n_bytes)
+            cache.save()
+
+    @staticmethod
+    def get_html_content(url: str, is_debug: bool = False, cache: Optional[HTTPMetadataCache] = None) -> str:
         """
         Extract the HTML string from a given URL
         :param url: The URL to extract the HTML from
         :param is_debug: Indicating if to print verbose information while extracting
+        :param cache: An HTTP metadata cache to make the request conditional with (Optional).
+                      If the server answers 304 Not Modified, the HTML is read from the cache
         :return: A string containing the desired HTML
         """
 
@@ -45,14 +358,32 @@ class HTMLParser(object):
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
         }
 
+        # Only revalidate if the body itself is cached, otherwise a 304 would leave us with nothing
+        cached_body: Optional[bytes] = cache.load_body(url) if cache is not None else None
+        if cached_body is not None:
+            headers.update(cache.get_conditional_headers(url))
+
         # Send request
         response: requests.models.Response = requests.get(url, headers=headers)
 
-        # Raise an error if the request failed
-        response.raise_for_status()
+        html_content: str
+        if cached_body is not None and response.status_code == 304:
+            # Get HTML as string from the cache
+            html_content = cached_body.decode("utf-8")
+            if is_debug:
+                print(f'HTML of {url} was not modified, using cached copy')
+        else:
+            # Raise an error if the request failed
+            response.raise_for_status()
+
+            # Get HTML as string
+            html_content = response.text
 
-        # Get HTML as string
-        html_content: str = response.text
+            if cache is not None:
+                body: bytes = html_content.encode("utf-8")
+                cache.store_body(url, body)
+                cache.update(url, response.headers, content_length=len(body))
+                cache.save()
 
         if is_debug:
             print('===========================DEBUGGING HTML PREVIEW================================')
@@ -61,15 +392,41 @@ class HTMLParser(object):
         return html_content
 
     @classmethod
-    def get_all_image_urls_from_site(cls, url: str, is_debug: bool = False) -> List[str]:
+    def get_all_image_urls_from_site(
+            cls,
+            url: str,
+            is_debug: bool = False,
+            cache: Optional[HTTPMetadataCache] = None,
+            rendition_policy: Optional[str] = None,
+            target_width: Optional[int] = None,
+    ) -> List[str]:
         """
-        Reads the html file of the given URL and return a list of all image urls in that HTML
+        Streams the html file of the given URL and return a list of all image urls in that HTML
         :param url: The URL of the page in the site were we want to get all images from
         :param is_debug: Indicates if the parser should print out debug prints
+        :param cache: An HTTP metadata cache to make the page request conditional with (Optional)
+        :param rendition_policy: If given, one URL per image is returned, picked out of all its renditions
+                                 (src, srcset, lazy-load attributes) by this policy, see ImageURLNormalizer.
+                                 If None, the 'src' of every image tag is returned
+        :param target_width: The desired width in pixels for the 'closest' rendition policy
         :return: A list of all image URLs from the given URL
         """
-        html_content: str = cls.get_html_content(url, is_debug=is_debug)
-        image_urls: List[str] = cls.extract_img_urls(html_content)
+        html_chunks: Iterator[str] = cls.iter_html_chunks(url, is_debug=is_debug, cache=cache)
+        if rendition_policy is not None:
+            normalizer: ImageURLNormalizer = ImageURLNormalizer(base_url=url, policy=rendition_policy,
+                                                                target_width=target_width)
+            return normalizer.select_renditions(cls.iter_img_attributes(html_chunks))
+        try:
+            image_urls: List[str] = list(cls.iter_img_urls(html_chunks))
+        except requests.RequestException:
+            # Network and HTTP errors are not the tokenizer's fault (some, like InvalidURL, are also ValueErrors)
+            raise
+        except cls.get_streaming_parser_errors() as e:
+            # Fall back to the BeautifulSoup tree if the streaming tokenizer chokes on the markup
+            html_chunks.close()
+            if is_debug:
+                print(f'Streaming image URL extraction failed ({e}), falling back to BeautifulSoup')
+            image_urls = cls.extract_img_urls(cls.get_html_content(url, is_debug=is_debug, cache=cache))
         return image_urls
 
 if __name__ == "__main__":
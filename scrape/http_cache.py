@@ -0,0 +1,204 @@
+# External Imports
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Iterable, Iterator, Optional, Any
+
+
+class HTTPMetadataCache(object):
+    """
+    An on-disk cache of HTTP validators (ETag, Last-Modified) and content lengths per URL,
+    used to send conditional requests and skip the body of unchanged resources on a 304 response.
+    Bodies which are not saved anywhere else (e.g. HTML pages) can be stored in the cache as well
+    """
+    def __init__(self, cache_dir: str):
+        """
+        Initialize the HTTPMetadataCache class, loading previously saved metadata if it exists
+        :param cache_dir: The directory the metadata (and cached bodies) are saved in
+        """
+        assert type(cache_dir) is str, f'cache_dir is not a string, got {type(cache_dir)}'
+        self.cache_dir: str = cache_dir
+        self.metadata_path: str = os.path.join(cache_dir, "metadata.json")
+        self._lock: threading.Lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.isfile(self.metadata_path):
+            with open(self.metadata_path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached metadata of a URL
+        :param url: The URL to look up
+        :return: A dict with the keys etag, last_modified, content_length (and any extra keys stored
+                 with the entry) or None if the URL is not cached
+        """
+        with self._lock:
+            entry: Optional[Dict[str, Any]] = self._entries.get(url)
+            return dict(entry) if entry is not None else None
+
+    def get_urls_by_sha256(self) -> Dict[str, str]:
+        """
+        Returns the URL every downloaded body was fetched from, by its content hash.
+        Unlike the path stored with an entry, the hash still identifies the image after it was renamed
+        :return: A dict mapping hex SHA-256 digests to URLs (the first URL in sorted order for repeated bodies)
+        """
+        with self._lock:
+            urls_by_sha256: Dict[str, str] = {}
+            for url in sorted(self._entries):
+                sha256: Optional[str] = self._entries[url].get("sha256")
+                if sha256 and sha256 not in urls_by_sha256:
+                    urls_by_sha256[sha256] = url
+            return urls_by_sha256
+
+    def get_conditional_headers(self, url: str) -> Dict[str, str]:
+        """
+        Returns the headers to send to make a request for the URL conditional
+        :param url: The URL to be requested
+        :return: A dict with If-None-Match and/or If-Modified-Since, empty if nothing is cached for the URL
+        """
+        entry: Optional[Dict[str, Any]] = self.get(url)
+        headers: Dict[str, str] = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url: str, response_headers: Any, content_length: int, **extra: Any) -> None:
+        """
+        Stores the validators of a response
+        :param url: The URL that was requested
+        :param response_headers: The (case-insensitive) headers of the response
+        :param content_length: The length (in bytes) of the body that was received
+        :param extra: Any additional values to save with the entry (e.g. the path the body was saved to)
+        :return: None
+        """
+        entry: Dict[str, Any] = {
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "content_length": content_length,
+        }
+        entry.update(extra)
+        with self._lock:
+            self._entries[url] = entry
+
+    def remove(self, url: str) -> None:
+        """
+        Removes a URL (and its cached body, if any) from the cache
+        :param url: The URL to remove
+        :return: None
+        """
+        with self._lock:
+            self._entries.pop(url, None)
+        body_path: str = self.get_body_path(url)
+        if os.path.isfile(body_path):
+            os.remove(body_path)
+
+    def get_body_path(self, url: str) -> str:
+        """
+        Returns the path the body of a URL is cached at
+        :param url: The URL of the body
+        :return: The path of the cached body
+        """
+        return os.path.join(self.cache_dir, "bodies", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def store_body(self, url: str, body: bytes) -> None:
+        """
+        Saves a body to the cache
+        :param url: The URL the body was received from
+        :param body: The body to save
+        :return: None
+        """
+        body_path: str = self.get_body_path(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        self._atomic_write(body_path, body)
+
+    def store_body_chunks(self, url: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Saves a body to the cache while it streams, passing its chunks through.
+        The cached body is only replaced once all chunks were written, a stream which is not read to the end is dropped
+        :param url: The URL the body is received from
+        :param chunks: The chunks of the body
+        :return: An iterator over the same chunks
+        """
+        body_path: str = self.get_body_path(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        fd: int
+        tmp_path: str
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(body_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, body_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def iter_body_chunks(self, url: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """
+        Reads a cached body in chunks
+        :param url: The URL of the body
+        :param chunk_size: The size (in bytes) of the chunks
+        :return: An iterator over the chunks of the body, empty if it was not cached
+        """
+        body_path: str = self.get_body_path(url)
+        if not os.path.isfile(body_path):
+            return
+        with open(body_path, "rb") as f:
+            while True:
+                chunk: bytes = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def load_body(self, url: str) -> Optional[bytes]:
+        """
+        Loads a cached body
+        :param url: The URL of the body
+        :return: The cached body, or None if it was not cached
+        """
+        body_path: str = self.get_body_path(url)
+        if not os.path.isfile(body_path):
+            return None
+        with open(body_path, "rb") as f:
+            return f.read()
+
+    def save(self) -> None:
+        """
+        Saves the metadata to disk
+        :return: None
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock:
+            data: bytes = json.dumps(self._entries, indent=1, sort_keys=True).encode("utf-8")
+        self._atomic_write(self.metadata_path, data)
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        """
+        Writes data to a temporary file and renames it to path, so a crash never leaves a half written file
+        :param path: The path to write to
+        :param data: The data to write
+        :return: None
+        """
+        fd: int
+        tmp_path: str
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -1,18 +1,100 @@
 # External Imports
+import hashlib
+import json
 import os
+import re
+import tempfile
+import time
 import requests
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 # Internal Imports
+from archive.content_store import ContentStore
 from data.urls import img_urls as urls
+from scrape.http_cache import HTTPMetadataCache
+from utils.file_hash import FileHash
+
+
+@dataclass
+class DownloadResult:
+    """
+    The outcome of downloading a single image URL
+    """
+    url: str
+    path: Optional[str]
+    bytes: int
+    status: Optional[int]
+    elapsed: float
+    error: Optional[str] = None
+    sha256: Optional[str] = None
+    not_modified: bool = False
+    resumed_from: int = 0
+    duplicate_of: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """
+        Indicates if the image was downloaded and saved successfully
+        :return: True if the download succeeded
+        """
+        return self.error is None
 
 
 class ImageDownloader:
     """
     A Class for downloading images from URLs
     """
-    def __init__(self):
-        pass
+    def __init__(
+            self,
+            max_workers: int = 8,
+            max_connections_per_host: int = 4,
+            timeout: float = 30.0,
+            chunk_size: Optional[int] = 64 * 1024,
+            cache: Optional[HTTPMetadataCache] = None,
+            resume: bool = True,
+            content_store: Optional[ContentStore] = None,
+    ):
+        """
+        Initialize the ImageDownloader class
+        :param max_workers: The number of threads used by download_images_concurrently
+        :param max_connections_per_host: The maximal number of open keep-alive connections to a single host
+        :param timeout: The timeout (in seconds) for each HTTP request made by download_images_concurrently
+        :param chunk_size: The size (in bytes) of the chunks the response body is streamed to disk in,
+                           which caps the memory used per download.
+                           If None, the whole body is read into memory before it is written
+        :param cache: An HTTP metadata cache (Optional). If given, images that were already downloaded and are
+                      still in the folder (under their download name, or renamed) are revalidated with a
+                      conditional request and not downloaded again if unchanged
+        :param resume: Indicates if interrupted downloads are kept as '.part' files and continued with
+                       HTTP Range requests on the next attempt
+        :param content_store: A content-addressed store (Optional). If given, every downloaded body is stored once
+                              and images with the same body as an earlier URL are flagged as duplicates
+        """
+        assert type(max_workers) is int and max_workers > 0, \
+            f'max_workers must be a positive int, got {max_workers}'
+        assert type(max_connections_per_host) is int and max_connections_per_host > 0, \
+            f'max_connections_per_host must be a positive int, got {max_connections_per_host}'
+        assert chunk_size is None or (type(chunk_size) is int and chunk_size > 0), \
+            f'chunk_size must be a positive int or None, got {chunk_size}'
+        self.max_workers: int = max_workers
+        self.max_connections_per_host: int = max_connections_per_host
+        self.timeout: float = timeout
+        self.chunk_size: Optional[int] = chunk_size
+        self.cache: Optional[HTTPMetadataCache] = cache
+        self.resume: bool = resume
+        self.content_store: Optional[ContentStore] = content_store
+
+    @staticmethod
+    def get_image_filename(idx: int) -> str:
+        """
+        Returns the filename an image is saved under
+        :param idx: The (zero based) index of the image URL
+        :return: The filename of the image
+        """
+        return f"image_{idx+1:03d}.jpg"
 
     @staticmethod
     def download_image(img_urls: List[str], output_dir: str) -> None:
@@ -41,9 +123,378 @@ class ImageDownloader:
             except Exception as e:
                 print(f"Failed to download {url}: {e}")
 
+    def create_session(self) -> requests.Session:
+        """
+        Creates a keep-alive session shared by all download threads.
+        Connections are pooled per host and the pool blocks once max_connections_per_host are in use,
+        so no single host gets more than that many concurrent connections
+        :return: A configured requests session
+        """
+        session: requests.Session = requests.Session()
+        session.headers.update({"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"})
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=self.max_workers,
+                                           pool_maxsize=self.max_connections_per_host,
+                                           pool_block=True)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def write_response_to_file(
+            response: requests.models.Response,
+            filename: str,
+            chunk_size: Optional[int]
+    ) -> Tuple[int, str]:
+        """
+        Writes a response body to a temporary file next to filename and atomically renames it into place,
+        so a partially written image never appears under its final name.
+        The SHA-256 of the body is computed while the bytes are written
+        :param response: The response to write, requested with stream=True if chunk_size is not None
+        :param filename: The final path of the file
+        :param chunk_size: The size (in bytes) of every chunk read from the response.
+                           If None, the whole body is read at once
+        :return: The number of bytes written and the hex SHA-256 digest of the body
+        """
+        sha256 = hashlib.sha256()
+        n_bytes: int = 0
+        fd: int
+        tmp_path: str
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filename) or ".",
+                                        prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                chunks = response.iter_content(chunk_size=chunk_size) if chunk_size is not None \
+                    else [response.content]
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        sha256.update(chunk)
+                        n_bytes += len(chunk)
+            os.replace(tmp_path, filename)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return n_bytes, sha256.hexdigest()
+
+    @staticmethod
+    def get_part_paths(filename: str) -> Tuple[str, str]:
+        """
+        Returns the paths of the partial file of a download and of its state file
+        :param filename: The final path of the file
+        :return: The path of the '.part' file and the path of the JSON file describing it
+        """
+        part_path: str = f"{filename}.part"
+        return part_path, f"{part_path}.json"
+
+    @classmethod
+    def remove_part_files(cls, filename: str) -> None:
+        """
+        Removes the partial file of a download and its state file, if they exist
+        :param filename: The final path of the file
+        :return: None
+        """
+        for path in cls.get_part_paths(filename):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    @classmethod
+    def load_part_state(cls, url: str, filename: str) -> Optional[Dict]:
+        """
+        Returns the state of an interrupted download of url to filename, if it can be resumed
+        :param url: The URL of the image
+        :param filename: The final path of the file
+        :return: A dict with the keys url, offset, expected_length, etag and last_modified,
+                 or None if there is no partial download of this URL to resume
+        """
+        part_path: str
+        state_path: str
+        part_path, state_path = cls.get_part_paths(filename)
+        if not os.path.isfile(part_path) or not os.path.isfile(state_path):
+            return None
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state: Dict = json.load(f)
+        except ValueError:
+            return None
+        if state.get("url") != url:
+            return None
+        state["offset"] = os.path.getsize(part_path)
+        if state["offset"] == 0 or state.get("expected_length") is None \
+                or state["offset"] >= state["expected_length"]:
+            return None
+        return state
+
+    @staticmethod
+    def get_expected_length(response: requests.models.Response) -> Optional[int]:
+        """
+        Returns the full length of the resource a response is (a part of)
+        :param response: A 200 or 206 response
+        :return: The length in bytes, or None if the server did not tell (or the body is content-encoded)
+        """
+        if response.headers.get("Content-Encoding"):
+            return None
+        if response.status_code == 206:
+            match = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range") or "")
+            return int(match.group(1)) if match else None
+        content_length: Optional[str] = response.headers.get("Content-Length")
+        return int(content_length) if content_length is not None and content_length.isdigit() else None
+
+    @staticmethod
+    def get_range_start(response: requests.models.Response) -> Optional[int]:
+        """
+        Returns the offset a 206 Partial Content response starts at
+        :param response: The response
+        :return: The first byte position of the body, or None if the response is not a byte range
+        """
+        if response.status_code != 206:
+            return None
+        match = re.match(r"bytes (\d+)-", response.headers.get("Content-Range") or "")
+        return int(match.group(1)) if match else None
+
+    @classmethod
+    def write_response_to_part_file(
+            cls,
+            response: requests.models.Response,
+            url: str,
+            filename: str,
+            chunk_size: Optional[int],
+            offset: int = 0,
+    ) -> Tuple[int, str]:
+        """
+        Writes a response body to filename's '.part' file, next to a state file recording the expected length,
+        and promotes it to filename once it is complete.
+        If the download is interrupted the '.part' file is kept, so it can be resumed later.
+        The SHA-256 of the whole file is computed while the bytes are written
+        :param response: The response to write (a 206 response if offset > 0)
+        :param url: The URL that was requested
+        :param filename: The final path of the file
+        :param chunk_size: The size (in bytes) of every chunk read from the response.
+                           If None, the whole body is read at once
+        :param offset: The number of bytes already in the '.part' file that the response continues
+        :return: The size of the complete file in bytes and its hex SHA-256 digest
+        """
+        part_path: str
+        state_path: str
+        part_path, state_path = cls.get_part_paths(filename)
+        expected_length: Optional[int] = cls.get_expected_length(response)
+
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "url": url,
+                "expected_length": expected_length,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }, f)
+
+        # Hash the bytes we already have, so the digest covers the whole file
+        sha256 = hashlib.sha256()
+        if offset > 0:
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size or 64 * 1024), b""):
+                    sha256.update(chunk)
+
+        n_bytes: int = offset
+        with open(part_path, "ab" if offset > 0 else "wb") as f:
+            chunks = response.iter_content(chunk_size=chunk_size) if chunk_size is not None \
+                else [response.content]
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    n_bytes += len(chunk)
+
+        # Check completeness before the file is promoted
+        if expected_length is not None and n_bytes != expected_length:
+            raise IOError(f"Incomplete download, got {n_bytes} of {expected_length} bytes")
+
+        os.replace(part_path, filename)
+        os.remove(state_path)
+        return n_bytes, sha256.hexdigest()
+
+    def get_files_by_sha256(self, output_dir: str) -> Dict[str, str]:
+        """
+        Finds the files of a folder holding bodies that were downloaded before, whatever they are named now
+        (e.g. after ImageNameOrganizer renamed them to their index number), so they can still be revalidated.
+        Only files with the size of a cached body are considered, and a file hard linked to its body in the
+        content store is recognized without hashing it
+        :param output_dir: The folder the images are downloaded to
+        :return: A dict mapping the hex SHA-256 digests of cached bodies to the path of a file holding them
+        """
+        if self.cache is None or not os.path.isdir(output_dir):
+            return {}
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        path: str
+        candidates: Set[str]
+        sha256: Optional[str]
+
+        sha256s_by_length: Dict[int, Set[str]] = {}
+        for sha256, url in self.cache.get_urls_by_sha256().items():
+            sha256s_by_length.setdefault(self.cache.get(url).get("content_length"), set()).add(sha256)
+
+        files_by_sha256: Dict[str, str] = {}
+        for filename in sorted(os.listdir(output_dir)):
+            path = os.path.join(output_dir, filename)
+            if filename.startswith('.') or not os.path.isfile(path):
+                continue
+            candidates = sha256s_by_length.get(os.path.getsize(path), set())
+            if not candidates:
+                continue
+            sha256 = next((candidate for candidate in sorted(candidates)
+                           if self.content_store is not None and self.content_store.is_stored(path, candidate)), None)
+            if sha256 is None:
+                sha256 = FileHash.get_sha256(path)
+            if sha256 in candidates and sha256 not in files_by_sha256:
+                files_by_sha256[sha256] = path
+        return files_by_sha256
+
+    def get_revalidation_entry(self, url: str, filename: str,
+                               files_by_sha256: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+        """
+        Returns the cache entry of a URL if the body it describes is still intact on disk, meaning a 304 response
+        for the URL can be trusted to leave a valid image in the folder. The body is either at filename,
+        or in another file of the folder with the same content (e.g. the image renamed to its index number)
+        :param url: The URL of the image
+        :param filename: The path the image is expected at
+        :param files_by_sha256: The files of the folder holding cached bodies, see get_files_by_sha256 (Optional)
+        :return: The cache entry with its 'path' set to the file holding the body,
+                 or None if the URL should be downloaded unconditionally
+        """
+        if self.cache is None:
+            return None
+        entry: Optional[Dict] = self.cache.get(url)
+        if entry is None:
+            return None
+        if entry.get("path") == filename and os.path.isfile(filename) \
+                and os.path.getsize(filename) == entry.get("content_length"):
+            return entry
+        if files_by_sha256 and entry.get("sha256") in files_by_sha256:
+            entry["path"] = files_by_sha256[entry["sha256"]]
+            return entry
+        return None
+
+    def fetch_to_file(self, session: requests.Session, url: str, filename: str,
+                      files_by_sha256: Optional[Dict[str, str]] = None) -> DownloadResult:
+        """
+        Downloads a single URL to the given filename
+        :param session: The session to send the request with
+        :param url: The URL of the image
+        :param filename: The path to save the image to
+        :param files_by_sha256: The files of the folder holding cached bodies, see get_files_by_sha256 (Optional)
+        :return: A DownloadResult describing the download. For an unchanged image, its path is the file
+                 already holding it
+        """
+        start: float = time.perf_counter()
+        status: Optional[int] = None
+        try:
+            cached_entry: Optional[Dict] = self.get_revalidation_entry(url, filename, files_by_sha256)
+            headers: Dict[str, str] = self.cache.get_conditional_headers(url) if cached_entry is not None else {}
+
+            # Continue an interrupted download, unless the server changed the image since (If-Range)
+            part_state: Optional[Dict] = self.load_part_state(url, filename) \
+                if self.resume and cached_entry is None else None
+            if part_state is not None:
+                headers["Range"] = f"bytes={part_state['offset']}-"
+                if part_state.get("etag") or part_state.get("last_modified"):
+                    headers["If-Range"] = part_state.get("etag") or part_state.get("last_modified")
+
+            # Runs at most twice, a stale partial download is retried once without a Range header
+            while True:
+                with session.get(url, headers=headers, timeout=self.timeout,
+                                 stream=self.chunk_size is not None) as response:
+                    status = response.status_code
+                    if part_state is not None and status == 416:
+                        # The '.part' file is stale (e.g. the image got shorter since), so a Range request for it
+                        # can never succeed. Drop it and download the whole image instead
+                        self.remove_part_files(filename)
+                        part_state = None
+                        headers = {name: value for name, value in headers.items()
+                                   if name not in ("Range", "If-Range")}
+                        continue
+                    if cached_entry is not None and status == 304:
+                        return DownloadResult(url=url, path=cached_entry["path"], bytes=0, status=status,
+                                              elapsed=time.perf_counter() - start,
+                                              sha256=cached_entry.get("sha256"), not_modified=True)
+                    response.raise_for_status()
+                    n_bytes: int
+                    digest: str
+                    offset: int = 0
+                    if not self.resume:
+                        n_bytes, digest = self.write_response_to_file(response, filename, self.chunk_size)
+                    else:
+                        # A 200 instead of a 206 means the server sent the whole image again, so start over
+                        if part_state is not None and self.get_range_start(response) == part_state["offset"]:
+                            offset = part_state["offset"]
+                        n_bytes, digest = self.write_response_to_part_file(response, url, filename,
+                                                                           self.chunk_size, offset=offset)
+                    if self.cache is not None:
+                        self.cache.update(url, response.headers, content_length=n_bytes, path=filename,
+                                          sha256=digest)
+                return DownloadResult(url=url, path=filename, bytes=n_bytes, status=status,
+                                      elapsed=time.perf_counter() - start, sha256=digest, resumed_from=offset)
+        except Exception as e:
+            return DownloadResult(url=url, path=None, bytes=0, status=status,
+                                  elapsed=time.perf_counter() - start, error=str(e))
+
+    def download_images_concurrently(self, img_urls: Iterable[str], output_dir: str) -> List[DownloadResult]:
+        """
+        Downloads all images from all given URLs using a bounded thread pool and a single pooled session.
+        Files are named the same way as in download_image.
+        img_urls may be a lazy iterator (e.g. SiteCrawler.iter_image_urls), every URL starts downloading
+        as soon as it is yielded
+        :param img_urls: The URLs to download the images from
+        :param output_dir: The path to the desired output directory for saving the images
+        :return: A list of DownloadResult, in the same order as img_urls
+        """
+        assert not isinstance(img_urls, str), 'img_urls is a string, expected an iterable of URLs'
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Images renamed since they were downloaded are revalidated under their new name
+        files_by_sha256: Dict[str, str] = self.get_files_by_sha256(output_dir)
+
+        with self.create_session() as session, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures: Dict = {
+                executor.submit(self.fetch_to_file, session, url,
+                                os.path.join(output_dir, self.get_image_filename(idx)), files_by_sha256): idx
+                for idx, url in enumerate(img_urls)
+            }
+            results: List[Optional[DownloadResult]] = [None] * len(futures)
+
+            # Declare all loop-variable types once in advance (for Cythonization)
+            result: DownloadResult
+
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if result.not_modified:
+                    print(f"✓ Not modified {os.path.basename(result.path)}")
+                elif result.resumed_from:
+                    print(f"✓ Downloaded {os.path.basename(result.path)} "
+                          f"({result.bytes} bytes, {result.elapsed:.2f}s, resumed from byte {result.resumed_from})")
+                elif result.ok:
+                    print(f"✓ Downloaded {os.path.basename(result.path)} "
+                          f"({result.bytes} bytes, {result.elapsed:.2f}s)")
+                else:
+                    print(f"Failed to download {result.url}: {result.error}")
+
+        if self.cache is not None:
+            self.cache.save()
+
+        if self.content_store is not None:
+            duplicates: Dict[str, str] = self.content_store.deduplicate(
+                output_dir, [(result.path, result.sha256) for result in results if result.ok and result.sha256]
+            )
+            for result in results:
+                if result.ok:
+                    result.duplicate_of = duplicates.get(os.path.basename(result.path))
+            print(f"Found {len(duplicates)} duplicate images")
+
+        return results
+
 
 if __name__ == "__main__":
 
     output_dir_main = "~/PycharmProjects/scrape_classify_and_archive_images/data/archive_images"
 
-    ImageDownloader().download_image(urls, output_dir=output_dir_main)
\ No newline at end of file
+    ImageDownloader().download_image(urls, output_dir=output_dir_main)
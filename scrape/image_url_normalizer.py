@@ -0,0 +1,189 @@
+# External Imports
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+
+class ImageURLNormalizer(object):
+    """
+    A class collapsing every rendition of an image found in a page (src, srcset, lazy-load data-* attributes and
+    WordPress '-WxH' resized copies) into a single URL per artwork, chosen by a configurable policy
+    """
+    # Attributes holding a single image URL, lazy-load plugins keep the real image in the data-* ones
+    url_attributes: Tuple[str, ...] = ('src', 'data-src', 'data-lazy-src', 'data-original',
+                                       'data-orig-file', 'data-large-file', 'data-medium-file')
+    # Attributes holding a srcset list of '<url> <descriptor>' candidates
+    srcset_attributes: Tuple[str, ...] = ('srcset', 'data-srcset', 'data-lazy-srcset')
+    # A '-<width>x<height>' suffix right before the file extension, as added by WordPress to resized copies
+    size_suffix_pattern = re.compile(r'-(\d+)x(\d+)(?=\.[A-Za-z0-9]+$)')
+    # A srcset candidate URL after the separating whitespace and commas, and the descriptors up to the next comma
+    srcset_url_pattern = re.compile(r'[\s,]*(\S*)')
+    srcset_descriptors_pattern = re.compile(r'[^,]*')
+
+    def __init__(
+            self,
+            base_url: Optional[str] = None,
+            policy: str = 'largest',
+            target_width: Optional[int] = None,
+            force_scheme: Optional[str] = None,
+    ):
+        """
+        Initialize the ImageURLNormalizer class
+        :param base_url: The URL of the page, relative image URLs are resolved against it (Optional)
+        :param policy: 'largest' to pick the biggest rendition (the original upload if it is listed),
+                       or 'closest' to pick the rendition whose width is closest to target_width
+        :param target_width: The desired width in pixels, required by the 'closest' policy
+        :param force_scheme: A scheme ('http' or 'https') to give every URL (Optional)
+        """
+        assert policy in self.get_policies(), f'policy must be one of {self.get_policies()}, got {policy}'
+        assert policy != 'closest' or type(target_width) is int, \
+            f'target_width must be an int for the closest policy, got {target_width}'
+        assert force_scheme in (None, 'http', 'https'), f'force_scheme must be http or https, got {force_scheme}'
+        self.base_url: Optional[str] = base_url
+        self.policy: str = policy
+        self.target_width: Optional[int] = target_width
+        self.force_scheme: Optional[str] = force_scheme
+
+    @staticmethod
+    def get_policies() -> Tuple[str, str]:
+        """
+        Returns the supported rendition selection policies
+        :return: Supported policies
+        """
+        return 'largest', 'closest'
+
+    @classmethod
+    def parse_srcset(cls, srcset: str) -> List[Tuple[str, Optional[int]]]:
+        """
+        Parses a srcset attribute the way the HTML spec does: a candidate URL runs up to the next whitespace
+        (trailing commas end it), and its descriptors run up to the next comma, so the commas need no space after them
+        :param srcset: The value of the attribute, e.g. 'a-300x200.jpg 300w, a.jpg 1024w'
+        :return: A list of (url, width), width is None for density ('2x') or missing descriptors
+        """
+        # Declare all loop-variable types once in advance (for Cythonization)
+        url: str
+        descriptors: List[str]
+        width: Optional[int]
+
+        candidates: List[Tuple[str, Optional[int]]] = []
+        position: int = 0
+        while position < len(srcset):
+            match = cls.srcset_url_pattern.match(srcset, position)
+            url = match.group(1)
+            position = match.end()
+            if not url:
+                break
+
+            # A URL ending with a comma has no descriptors
+            descriptors = []
+            if url.endswith(','):
+                url = url.rstrip(',')
+            else:
+                match = cls.srcset_descriptors_pattern.match(srcset, position)
+                descriptors = match.group().split()
+                position = match.end()
+
+            width = None
+            if descriptors and re.fullmatch(r'\d+w', descriptors[0]):
+                width = int(descriptors[0][:-1])
+            candidates.append((url, width))
+        return candidates
+
+    def normalize_url(self, url: str) -> Optional[str]:
+        """
+        Normalizes an image URL: resolves it against the base URL, lower-cases the scheme and host,
+        drops the fragment and applies force_scheme
+        :param url: The URL as found in the page
+        :return: The normalized URL, or None for inline (data:) images and unsupported schemes
+        """
+        url = url.strip()
+        if not url or url.startswith('data:'):
+            return None
+        if self.base_url is not None:
+            url = urljoin(self.base_url, url)
+        elif url.startswith('//'):
+            url = f"{self.force_scheme or 'https'}:{url}"
+
+        parts = urlsplit(url)
+        if parts.scheme.lower() not in ('http', 'https'):
+            return None
+        scheme: str = self.force_scheme or parts.scheme.lower()
+        return urlunsplit((scheme, parts.netloc.lower(), parts.path, parts.query, ''))
+
+    @classmethod
+    def get_artwork_key(cls, url: str) -> str:
+        """
+        Returns a key shared by all renditions of the same image, ignoring the scheme,
+        a 'www.' host prefix, the query and a '-WxH' size suffix
+        :param url: A normalized URL
+        :return: The key of the image
+        """
+        parts = urlsplit(url)
+        host: str = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+        return f"{host}{cls.size_suffix_pattern.sub('', parts.path)}".lower()
+
+    @classmethod
+    def get_width_from_url(cls, url: str) -> Optional[int]:
+        """
+        Returns the width encoded in a '-WxH' size suffix
+        :param url: The URL of the image
+        :return: The width in pixels, or None if the URL has no size suffix
+        """
+        match = cls.size_suffix_pattern.search(urlsplit(url).path)
+        return int(match.group(1)) if match else None
+
+    def get_candidates(self, attributes: Dict[str, Optional[str]]) -> List[Tuple[str, Optional[int]]]:
+        """
+        Returns every rendition listed in the attributes of an <img> (or <source>) tag
+        :param attributes: The attributes of the tag
+        :return: A list of (normalized url, width), width is None if it is unknown
+        """
+        raw_candidates: List[Tuple[str, Optional[int]]] = []
+        for attribute in self.url_attributes:
+            if attributes.get(attribute):
+                raw_candidates.append((attributes[attribute], None))
+        for attribute in self.srcset_attributes:
+            if attributes.get(attribute):
+                raw_candidates.extend(self.parse_srcset(attributes[attribute]))
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        url: Optional[str]
+
+        candidates: List[Tuple[str, Optional[int]]] = []
+        for raw_url, width in raw_candidates:
+            url = self.normalize_url(raw_url)
+            if url is not None:
+                candidates.append((url, width if width is not None else self.get_width_from_url(url)))
+        return candidates
+
+    def choose(self, candidates: List[Tuple[str, Optional[int]]]) -> str:
+        """
+        Chooses one rendition of an image under the policy.
+        A rendition without a known width is taken to be the full size original, larger than all the others
+        :param candidates: The (url, width) renditions of one image, in page order
+        :return: The URL of the chosen rendition
+        """
+        originals: List[str] = [url for url, width in candidates if width is None]
+        sized: List[Tuple[str, int]] = [(url, width) for url, width in candidates if width is not None]
+
+        if self.policy == 'largest' or not sized:
+            if originals:
+                return originals[0]
+            return max(sized, key=lambda candidate: candidate[1])[0]
+
+        # Only fall back to the original if every resized copy is narrower than the target
+        if originals and self.target_width > max(width for _, width in sized):
+            return originals[0]
+        return min(sized, key=lambda candidate: (abs(candidate[1] - self.target_width), -candidate[1]))[0]
+
+    def select_renditions(self, tags_attributes: Iterable[Dict[str, Optional[str]]]) -> List[str]:
+        """
+        Picks one URL per image out of the attributes of all image tags of a page
+        :param tags_attributes: The attributes of every <img> and <source> tag, in page order
+        :return: One URL per image, in the order the images first appear in the page
+        """
+        renditions: Dict[str, List[Tuple[str, Optional[int]]]] = {}
+        for attributes in tags_attributes:
+            for url, width in self.get_candidates(attributes):
+                renditions.setdefault(self.get_artwork_key(url), []).append((url, width))
+        return [self.choose(candidates) for candidates in renditions.values()]
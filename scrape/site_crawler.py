@@ -0,0 +1,240 @@
+# External Imports
+import time
+import requests
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from requests.adapters import HTTPAdapter
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
+
+# Internal Imports
+from scrape.html_parser import HTMLParser
+from scrape.image_downloader import DownloadResult, ImageDownloader
+
+
+@dataclass
+class HostState:
+    """
+    The politeness state of a single host: its queue of pages, its in-flight requests and
+    the earliest time the next request to it may start
+    """
+    queue: Deque[Tuple[str, int]] = field(default_factory=deque)
+    in_flight: int = 0
+    next_request_time: float = 0.0
+
+
+class SiteCrawler(object):
+    """
+    A crawler following links from start pages across a whole site and yielding the image URLs it discovers.
+    Pages are fetched concurrently, with a per-host concurrency cap and a minimal delay between requests
+    to the same host, so throughput grows with the number of hosts while every single host is treated politely
+    """
+    image_extensions: Tuple[str, ...] = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+    def __init__(
+            self,
+            max_depth: int = 2,
+            max_pages: int = 200,
+            allowed_domains: Optional[List[str]] = None,
+            max_workers: int = 8,
+            max_concurrency_per_host: int = 2,
+            min_delay_per_host: float = 0.5,
+            timeout: float = 30.0,
+            rendition_policy: Optional[str] = 'largest',
+    ):
+        """
+        Initialize the SiteCrawler class
+        :param max_depth: The maximal number of links followed from a start page (0 only crawls the start pages)
+        :param max_pages: The maximal number of pages fetched
+        :param allowed_domains: The domains (and their subdomains) pages are fetched from.
+                                If None, the domains of the start URLs
+        :param max_workers: The maximal number of pages fetched at the same time, over all hosts
+        :param max_concurrency_per_host: The maximal number of pages fetched at the same time from a single host
+        :param min_delay_per_host: The minimal time (in seconds) between two requests to the same host
+        :param timeout: The timeout (in seconds) of every page request
+        :param rendition_policy: The rendition policy used to pick one URL per image, see ImageURLNormalizer.
+                                 If None, the 'src' of every image tag is used
+        """
+        assert type(max_depth) is int and max_depth >= 0, f'max_depth must be a non-negative int, got {max_depth}'
+        assert type(max_pages) is int and max_pages > 0, f'max_pages must be a positive int, got {max_pages}'
+        assert type(max_workers) is int and max_workers > 0, \
+            f'max_workers must be a positive int, got {max_workers}'
+        assert type(max_concurrency_per_host) is int and max_concurrency_per_host > 0, \
+            f'max_concurrency_per_host must be a positive int, got {max_concurrency_per_host}'
+        assert min_delay_per_host >= 0, f'min_delay_per_host must be non-negative, got {min_delay_per_host}'
+        self.max_depth: int = max_depth
+        self.max_pages: int = max_pages
+        self.allowed_domains: Optional[List[str]] = \
+            [domain.lower() for domain in allowed_domains] if allowed_domains is not None else None
+        self.max_workers: int = max_workers
+        self.max_concurrency_per_host: int = max_concurrency_per_host
+        self.min_delay_per_host: float = min_delay_per_host
+        self.timeout: float = timeout
+        self.rendition_policy: Optional[str] = rendition_policy
+
+    @staticmethod
+    def get_host(url: str) -> str:
+        """
+        Returns the host (and port) of a URL
+        :param url: The URL
+        :return: The lower-cased host
+        """
+        return urlsplit(url).netloc.lower()
+
+    @staticmethod
+    def is_domain_allowed(url: str, allowed_domains: List[str]) -> bool:
+        """
+        Checks if a URL is on one of the allowed domains or their subdomains
+        :param url: The URL to check
+        :param allowed_domains: The allowed domains
+        :return: True if the URL may be crawled
+        """
+        hostname: str = (urlsplit(url).hostname or '').lower()
+        return any(hostname == domain or hostname.endswith(f".{domain}") for domain in allowed_domains)
+
+    @classmethod
+    def is_image_url(cls, url: str) -> bool:
+        """
+        Checks if a URL points at an image file (e.g. a gallery link to the full size image)
+        :param url: The URL to check
+        :return: True if the URL path has an image extension
+        """
+        return urlsplit(url).path.lower().endswith(cls.image_extensions)
+
+    def create_session(self) -> requests.Session:
+        """
+        Creates a keep-alive session for the page requests, pooling max_concurrency_per_host connections per host
+        :return: A configured requests session
+        """
+        session: requests.Session = requests.Session()
+        session.headers.update({"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"})
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=self.max_workers,
+                                           pool_maxsize=self.max_concurrency_per_host)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def fetch_page(self, session: requests.Session, url: str) -> Tuple[List[str], List[str]]:
+        """
+        Fetches a page and extracts its image URLs and links
+        :param session: The session to send the request with
+        :param url: The URL of the page
+        :return: The image URLs and the links of the page (both empty if the page is not HTML)
+        """
+        with session.get(url, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if 'html' not in response.headers.get('Content-Type', 'text/html'):
+                return [], []
+            html_content: str = response.text
+
+        img_urls: List[str]
+        if self.rendition_policy is not None:
+            img_urls = HTMLParser.extract_img_renditions(html_content, base_url=url, policy=self.rendition_policy)
+        else:
+            img_urls = [urljoin(url, img_url) for img_url in HTMLParser.extract_img_urls_fast(html_content)]
+        return img_urls, HTMLParser.extract_links(html_content, base_url=url)
+
+    def iter_image_urls(self, start_urls: Iterable[str]) -> Iterator[str]:
+        """
+        Crawls from the start URLs and yields every image URL as soon as the page it is on was fetched.
+        Every image URL is yielded once
+        :param start_urls: The URLs of the pages to start from
+        :return: An iterator over image URLs
+        """
+        start_urls = list(start_urls)
+        allowed_domains: List[str] = self.allowed_domains if self.allowed_domains is not None \
+            else [(urlsplit(url).hostname or '').lower() for url in start_urls]
+
+        hosts: Dict[str, HostState] = {}
+        seen_pages: Set[str] = set()
+        seen_images: Set[str] = set()
+        n_pages: int = 0
+
+        def enqueue(page_url: str, depth: int) -> None:
+            if page_url in seen_pages or not self.is_domain_allowed(page_url, allowed_domains):
+                return
+            seen_pages.add(page_url)
+            hosts.setdefault(self.get_host(page_url), HostState()).queue.append((page_url, depth))
+
+        for url in start_urls:
+            enqueue(url, 0)
+
+        # Declare all loop-variable types once in advance (for Cythonization)
+        now: float
+        host_state: HostState
+        page_url: str
+        depth: int
+        img_urls: List[str]
+        links: List[str]
+
+        in_flight: Dict[Future, Tuple[str, int]] = {}
+        with self.create_session() as session, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while in_flight or any(state.queue for state in hosts.values()):
+                # Start every request the politeness rules allow right now
+                now = time.monotonic()
+                next_start: Optional[float] = None
+                for host, host_state in hosts.items():
+                    while host_state.queue and len(in_flight) < self.max_workers and n_pages < self.max_pages \
+                            and host_state.in_flight < self.max_concurrency_per_host:
+                        if host_state.next_request_time > now:
+                            next_start = host_state.next_request_time if next_start is None \
+                                else min(next_start, host_state.next_request_time)
+                            break
+                        page_url, depth = host_state.queue.popleft()
+                        in_flight[executor.submit(self.fetch_page, session, page_url)] = (page_url, depth)
+                        host_state.in_flight += 1
+                        host_state.next_request_time = now + self.min_delay_per_host
+                        n_pages += 1
+
+                if not in_flight:
+                    if n_pages >= self.max_pages or next_start is None:
+                        break
+                    time.sleep(max(0.0, next_start - time.monotonic()))
+                    continue
+
+                done: Set[Future]
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED,
+                               timeout=None if next_start is None else max(0.0, next_start - time.monotonic()))
+                for future in done:
+                    page_url, depth = in_flight.pop(future)
+                    hosts[self.get_host(page_url)].in_flight -= 1
+                    try:
+                        img_urls, links = future.result()
+                    except Exception as e:
+                        print(f"Failed to crawl {page_url}: {e}")
+                        continue
+
+                    for link in links:
+                        if self.is_image_url(link):
+                            img_urls.append(link)
+                        elif depth < self.max_depth:
+                            enqueue(link, depth + 1)
+
+                    for img_url in img_urls:
+                        if img_url not in seen_images:
+                            seen_images.add(img_url)
+                            yield img_url
+
+    def crawl(self, start_urls: Iterable[str]) -> List[str]:
+        """
+        Crawls from the start URLs and returns all image URLs found
+        :param start_urls: The URLs of the pages to start from
+        :return: The image URLs, in discovery order
+        """
+        return list(self.iter_image_urls(start_urls))
+
+    def crawl_and_download(
+            self,
+            start_urls: Iterable[str],
+            downloader: ImageDownloader,
+            output_dir: str
+    ) -> List[DownloadResult]:
+        """
+        Crawls from the start URLs and downloads every image while the crawl is still running
+        :param start_urls: The URLs of the pages to start from
+        :param downloader: The downloader to download the images with
+        :param output_dir: The path to the desired output directory for saving the images
+        :return: A DownloadResult per image, in discovery order
+        """
+        return downloader.download_images_concurrently(self.iter_image_urls(start_urls), output_dir=output_dir)
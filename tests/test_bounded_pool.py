@@ -0,0 +1,65 @@
+# External Imports
+import threading
+import time
+import unittest
+
+# Internal Imports
+from utils.bounded_pool import BoundedPool
+
+
+def square(x: int) -> int:
+    return x * x
+
+
+class TestBoundedPool(unittest.TestCase):
+
+    def test_imap_processes_ordered(self):
+        pool = BoundedPool(max_workers=2, max_in_flight=3)
+        self.assertEqual(list(pool.imap(square, range(10))), [(x, x * x) for x in range(10)])
+
+    def test_imap_extra_args(self):
+        pool = BoundedPool(max_workers=2, use_processes=False)
+        self.assertEqual(list(pool.imap(pow, [1, 2, 3], 2)), [(1, 1), (2, 4), (3, 9)])
+
+    def test_imap_bounded_in_flight(self):
+        lock = threading.Lock()
+        state = {"consumed": 0, "max_ahead": 0}
+
+        def items():
+            for i in range(20):
+                with lock:
+                    state["max_ahead"] = max(state["max_ahead"], i - state["consumed"])
+                yield i
+
+        def slow_identity(x):
+            time.sleep(0.001)
+            return x
+
+        pool = BoundedPool(max_workers=2, max_in_flight=4, use_processes=False)
+        for item, result in pool.imap(slow_identity, items()):
+            self.assertEqual(item, result)
+            with lock:
+                state["consumed"] += 1
+
+        # Never more than max_in_flight items read ahead of the consumer
+        self.assertLessEqual(state["max_ahead"], 4)
+
+    def test_imap_exception(self):
+        def fail_on_three(x):
+            if x == 3:
+                raise ValueError("three")
+            return x
+
+        pool = BoundedPool(max_workers=2, use_processes=False)
+        with self.assertRaises(ValueError):
+            list(pool.imap(fail_on_three, range(10)))
+
+    def test_invalid_params(self):
+        with self.assertRaises(AssertionError):
+            BoundedPool(max_workers=0)
+        with self.assertRaises(AssertionError):
+            BoundedPool(max_workers=4, max_in_flight=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
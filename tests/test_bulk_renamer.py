@@ -0,0 +1,99 @@
+# External Imports
+import os
+import unittest
+import tempfile
+from unittest.mock import patch
+
+# Internal Imports
+from archive.bulk_renamer import BulkRenamer
+
+
+class TestBulkRenamer(unittest.TestCase):
+
+    def create_files(self, tmpdir, filenames):
+        for fname in filenames:
+            with open(os.path.join(tmpdir, fname), "w") as f:
+                f.write(fname)
+
+    def read_files(self, tmpdir):
+        contents = {}
+        for fname in os.listdir(tmpdir):
+            if fname != BulkRenamer.journal_filename:
+                with open(os.path.join(tmpdir, fname)) as f:
+                    contents[fname] = f.read()
+        return contents
+
+    def test_plan(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.create_files(tmpdir, ["a.png", "b.jpg", "c.jpg", "1.jpg", "2.jpg"])
+            renames = BulkRenamer.plan(tmpdir, {"a.png": "1", "b.jpg": "1", "c.jpg": None, "2.jpg": "2"})
+
+        # 1.jpg stays, so both images numbered 1 get suffixes, and 2.jpg keeps its name
+        self.assertEqual(renames, {"a.png": "1_2.jpg", "b.jpg": "1_3.jpg"})
+
+    def test_plan_duplicates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.create_files(tmpdir, ["1.jpg", "b.jpg"])
+            for fname, content in [("a.jpg", "1.jpg"), ("c.jpg", "other")]:
+                with open(os.path.join(tmpdir, fname), "w") as f:
+                    f.write(content)
+            duplicates = {}
+            renames = BulkRenamer.plan(tmpdir, {"a.jpg": "1", "b.jpg": "1", "c.jpg": "1"}, duplicates=duplicates)
+
+        # a.jpg has the content of 1.jpg and is dropped, the other images get suffixes
+        self.assertEqual(renames, {"b.jpg": "1_2.jpg", "c.jpg": "1_3.jpg"})
+        self.assertEqual(duplicates, {"a.jpg": "1.jpg"})
+
+    def test_apply_swap(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.create_files(tmpdir, ["1.jpg", "2.jpg"])
+            BulkRenamer.apply(tmpdir, {"1.jpg": "2.jpg", "2.jpg": "1.jpg"})
+            self.assertEqual(self.read_files(tmpdir), {"1.jpg": "2.jpg", "2.jpg": "1.jpg"})
+            self.assertEqual(BulkRenamer.load_journal(tmpdir)["state"], "done")
+
+            # A completed run can be rolled back
+            self.assertTrue(BulkRenamer.rollback(tmpdir))
+            self.assertEqual(self.read_files(tmpdir), {"1.jpg": "1.jpg", "2.jpg": "2.jpg"})
+            self.assertFalse(BulkRenamer.rollback(tmpdir))
+
+    def test_replay_and_rollback_interrupted(self):
+        renames = {"a.jpg": "b.jpg", "b.jpg": "c.jpg", "c.jpg": "a.jpg"}
+        original_move = BulkRenamer.move
+
+        for n_moves in range(6):
+            calls = []
+
+            def crashing_move(folder_path, filename, new_filename):
+                if len(calls) == n_moves:
+                    raise KeyboardInterrupt
+                calls.append(filename)
+                return original_move(folder_path, filename, new_filename)
+
+            for is_replayed in [True, False]:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    self.create_files(tmpdir, list(renames))
+                    calls.clear()
+                    with patch.object(BulkRenamer, "move", side_effect=crashing_move):
+                        with self.assertRaises(KeyboardInterrupt):
+                            BulkRenamer.apply(tmpdir, renames)
+                    with self.assertRaises(AssertionError):
+                        BulkRenamer.apply(tmpdir, {})
+
+                    if is_replayed:
+                        self.assertTrue(BulkRenamer.replay(tmpdir))
+                        expected = {new: old for old, new in renames.items()}
+                    else:
+                        self.assertTrue(BulkRenamer.rollback(tmpdir))
+                        expected = {name: name for name in renames}
+                    self.assertEqual(self.read_files(tmpdir), expected)
+
+    def test_move_never_overwrites(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.create_files(tmpdir, ["a.jpg", "b.jpg"])
+            with self.assertRaises(FileExistsError):
+                BulkRenamer.move(tmpdir, "a.jpg", "b.jpg")
+            self.assertFalse(BulkRenamer.move(tmpdir, "c.jpg", "a.jpg"))
+
+
+if __name__ == "__main__":
+    unittest.main()
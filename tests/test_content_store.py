@@ -0,0 +1,98 @@
+# External Imports
+import hashlib
+import os
+import unittest
+import tempfile
+
+# Internal Imports
+from archive.content_store import ContentStore
+
+
+class TestContentStore(unittest.TestCase):
+
+    @staticmethod
+    def create_file(folder: str, filename: str, data: bytes) -> str:
+        path = os.path.join(folder, filename)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_deduplicate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            store = ContentStore(os.path.join(tmpdir, "store"))
+
+            files = [
+                (self.create_file(images_dir, "image_001.jpg", b"artwork"), hashlib.sha256(b"artwork").hexdigest()),
+                (self.create_file(images_dir, "image_002.jpg", b"other"), hashlib.sha256(b"other").hexdigest()),
+                (self.create_file(images_dir, "image_003.jpg", b"artwork"), hashlib.sha256(b"artwork").hexdigest()),
+            ]
+            duplicates = store.deduplicate(images_dir, files)
+
+            self.assertEqual(duplicates, {"image_003.jpg": "image_001.jpg"})
+            self.assertEqual(ContentStore.load_duplicates(images_dir), duplicates)
+
+            # Both copies share the single stored body
+            object_path = store.get_object_path(hashlib.sha256(b"artwork").hexdigest(), ".jpg")
+            self.assertTrue(os.path.samefile(files[0][0], object_path))
+            self.assertTrue(os.path.samefile(files[2][0], object_path))
+            with open(files[2][0], "rb") as f:
+                self.assertEqual(f.read(), b"artwork")
+
+    def test_deduplicate_replaces_previous_entries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = ContentStore(os.path.join(tmpdir, "store"))
+            ContentStore.save_duplicates(tmpdir, {"image_002.jpg": "image_001.jpg", "old.jpg": "image_001.jpg"})
+
+            files = [
+                (self.create_file(tmpdir, "image_001.jpg", b"a"), hashlib.sha256(b"a").hexdigest()),
+                (self.create_file(tmpdir, "image_002.jpg", b"b"), hashlib.sha256(b"b").hexdigest()),
+            ]
+            store.deduplicate(tmpdir, files)
+
+            # image_002.jpg changed and is no longer a duplicate, entries of other files are kept
+            self.assertEqual(ContentStore.load_duplicates(tmpdir), {"old.jpg": "image_001.jpg"})
+
+    def test_deduplicate_known_content(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            store = ContentStore(os.path.join(tmpdir, "store"))
+            artwork_hash = hashlib.sha256(b"artwork").hexdigest()
+            other_hash = hashlib.sha256(b"other").hexdigest()
+
+            # An earlier run stored the artwork and renamed it to its index number
+            store.deduplicate(images_dir, [(self.create_file(images_dir, "image_001.jpg", b"artwork"), artwork_hash)])
+            os.rename(os.path.join(images_dir, "image_001.jpg"), os.path.join(images_dir, "123.jpg"))
+            self.create_file(images_dir, "456.jpg", b"other")
+
+            # Re-downloads of content already in the folder are duplicates of the copies already there,
+            # whether the copy is linked to the store or not, and whatever the order of the files
+            files = [
+                (self.create_file(images_dir, "image_001.jpg", b"artwork"), artwork_hash),
+                (self.create_file(images_dir, "image_002.jpg", b"other"), other_hash),
+                (os.path.join(images_dir, "123.jpg"), artwork_hash),
+            ]
+            self.assertEqual(store.deduplicate(images_dir, files),
+                             {"image_001.jpg": "123.jpg", "image_002.jpg": "456.jpg"})
+
+    def test_rename_canonical(self):
+        duplicates = {"image_003.jpg": "image_001.jpg", "image_004.jpg": "image_002.jpg"}
+        self.assertTrue(ContentStore.rename_canonical(duplicates, "image_001.jpg", "17.jpg"))
+        self.assertFalse(ContentStore.rename_canonical(duplicates, "image_005.jpg", "18.jpg"))
+        self.assertEqual(duplicates, {"image_003.jpg": "17.jpg", "image_004.jpg": "image_002.jpg"})
+
+    def test_load_duplicates_missing_manifest(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertEqual(ContentStore.load_duplicates(tmpdir), {})
+
+    def test_invalid_params(self):
+        with self.assertRaises(AssertionError):
+            ContentStore(None)
+        with self.assertRaises(AssertionError):
+            ContentStore("store").deduplicate("nonexistent_path", [])
+
+
+if __name__ == "__main__":
+    unittest.main()
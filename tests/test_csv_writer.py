@@ -1,13 +1,16 @@
 # External Imports
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 import os
 from PIL import Image as PILImage
 import tempfile
 import shutil
 import unittest
+from unittest.mock import patch
 
 # Internal Imports
+from archive.content_store import ContentStore
 from archive.csv_writer import CSVWriter
+from archive.thumbnail_cache import ThumbnailCache
 
 
 class TestCSVWriter(unittest.TestCase):
@@ -45,6 +48,126 @@ class TestCSVWriter(unittest.TestCase):
             self.assertEqual(ws.cell(row=2, column=1).value, "img1")
             shutil.rmtree(tmpdirname)
 
+    def test_create_sheet_from_images_skips_duplicates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fname in ["img1.jpg", "img1_copy.jpg"]:
+                PILImage.new('RGB', (100, 100), color='red').save(os.path.join(tmpdir, fname))
+            ContentStore.save_duplicates(tmpdir, {"img1_copy.jpg": "img1.jpg"})
+
+            output_file = os.path.join(tmpdir, "test_output.xlsx")
+            CSVWriter(output_file).create_sheet_from_images(tmpdir, title="Images")
+
+            ws = load_workbook(output_file)["Images"]
+            self.assertEqual(ws.cell(row=1, column=1).value, "img1")
+            self.assertIsNone(ws.cell(row=2, column=1).value)
+
+    def test_create_sheet_from_images_embeds_thumbnails(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            PILImage.new('RGB', (2000, 1000), color='red').save(os.path.join(tmpdir, "img1.jpg"))
+
+            output_file = os.path.join(tmpdir, "test_output.xlsx")
+            thumbnail_cache = ThumbnailCache(os.path.join(tmpdir, ".thumbs"))
+            CSVWriter(output_file, thumbnail_cache=thumbnail_cache).create_sheet_from_images(tmpdir, title="Images")
+
+            ws = load_workbook(output_file)["Images"]
+            self.assertEqual(len(ws._images), 1)
+            self.assertEqual((ws._images[0].width, ws._images[0].height), (150, 75))
+            self.assertEqual(len(os.listdir(os.path.join(tmpdir, ".thumbs"))), 1)
+
+    def test_create_sheet_from_images_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for i in range(5):
+                PILImage.new('RGB', (300 + 10 * i, 200), color='red').save(os.path.join(tmpdir, f"img{i}.jpg"))
+
+            serial_file = os.path.join(tmpdir, "serial.xlsx")
+            CSVWriter(serial_file).create_sheet_from_images(tmpdir, title="Images")
+            serial_ws = load_workbook(serial_file)["Images"]
+
+            for use_processes in [False, True]:
+                parallel_file = os.path.join(tmpdir, "parallel.xlsx")
+                CSVWriter(parallel_file).create_sheet_from_images_parallel(
+                    tmpdir, title="Images", max_workers=2, max_in_flight=2, use_processes=use_processes)
+
+                # The rows and thumbnails are the same as those of the serial sheet
+                parallel_ws = load_workbook(parallel_file)["Images"]
+                self.assertEqual([cell.value for cell in parallel_ws["A"]], [cell.value for cell in serial_ws["A"]])
+                self.assertEqual([(img.width, img.height) for img in parallel_ws._images],
+                                 [(img.width, img.height) for img in serial_ws._images])
+                self.assertEqual(len(parallel_ws._images), 5)
+
+    def test_create_sheets_from_images_streaming(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            for i in range(7):
+                PILImage.new('RGB', (300, 200), color='red').save(os.path.join(images_dir, f"img{i}.jpg"))
+            filenames = list(CSVWriter("unused.xlsx").get_image_filenames(images_dir))
+
+            output_file = os.path.join(tmpdir, "index.xlsx")
+            file_paths = CSVWriter(output_file).create_sheets_from_images_streaming(
+                images_dir, title="Images", max_rows_per_sheet=2, max_rows_per_file=5,
+                max_workers=2, use_processes=False)
+            self.assertEqual(file_paths, [output_file, os.path.join(tmpdir, "index_2.xlsx")])
+
+            # 7 rows go into sheets of 2 rows, in files of 5 rows
+            first_wb = load_workbook(file_paths[0])
+            second_wb = load_workbook(file_paths[1])
+            self.assertEqual(first_wb.sheetnames, ["Images", "Images_2", "Images_3"])
+            self.assertEqual(second_wb.sheetnames, ["Images_4"])
+            names = [ws.cell(row=row, column=1).value for wb in [first_wb, second_wb] for ws in wb.worksheets
+                     for row in range(1, ws.max_row + 1)]
+            self.assertEqual(names, [filename.split('.')[0] for filename in filenames])
+            self.assertEqual([len(ws._images) for ws in first_wb.worksheets + second_wb.worksheets], [2, 2, 1, 2])
+            self.assertEqual(first_wb["Images_3"]._images[0].anchor._from.row, 0)
+
+    def test_update_sheet_from_images(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            for fname, width in [("10.jpg", 300), ("2.jpg", 200), ("untitled.jpg", 100)]:
+                PILImage.new('RGB', (width, 100), color='red').save(os.path.join(images_dir, fname))
+            output_file = os.path.join(tmpdir, "index.xlsx")
+            thumbnail_cache = ThumbnailCache(os.path.join(tmpdir, ".thumbs"))
+
+            def get_rows():
+                ws = load_workbook(output_file)["Images"]
+                names = [ws.cell(row=row, column=1).value for row in range(1, ws.max_row + 1)]
+                widths = {img.anchor._from.row + 1: img.width for img in ws._images}
+                return names, [widths[row] for row in range(1, len(names) + 1)]
+
+            def update():
+                return CSVWriter(output_file, thumbnail_cache).update_sheet_from_images(images_dir, "Images",
+                                                                                        use_processes=False)
+
+            # The first run creates the sheet in index order, next to the sheets of an existing file
+            wb = Workbook()
+            wb.active.title = "Notes"
+            wb.save(output_file)
+            self.assertEqual(update(), 3)
+            self.assertEqual(get_rows(), (["2", "10", "untitled"], [150, 150, 100]))
+            self.assertEqual(load_workbook(output_file).sheetnames, ["Notes", "Images"])
+            self.assertEqual(CSVWriter(output_file).load_manifest()["rows"]["10.jpg"]["row"], 2)
+
+            # An unchanged folder is not written again
+            mtime = os.path.getmtime(output_file)
+            self.assertEqual(update(), 0)
+            self.assertEqual(os.path.getmtime(output_file), mtime)
+
+            # Only new and modified images are thumbnailed, renamed images reuse their cached thumbnail,
+            # and the other sheets of the workbook are kept
+            wb = load_workbook(output_file)
+            wb.create_sheet("Drafts")
+            wb.save(output_file)
+            os.rename(os.path.join(images_dir, "untitled.jpg"), os.path.join(images_dir, "7.jpg"))
+            os.remove(os.path.join(images_dir, "10.jpg"))
+            PILImage.new('RGB', (100, 200), color='red').save(os.path.join(images_dir, "2.jpg"))
+            PILImage.new('RGB', (200, 300), color='blue').save(os.path.join(images_dir, "2_2.jpg"))
+            with patch.object(ThumbnailCache, "make_thumbnail", side_effect=ThumbnailCache.make_thumbnail) as mock_make:
+                self.assertEqual(update(), 2)
+                self.assertEqual(mock_make.call_count, 2)
+            self.assertEqual(get_rows(), (["2", "2_2", "7"], [75, 100, 100]))
+            self.assertEqual(load_workbook(output_file).sheetnames, ["Notes", "Images", "Drafts"])
+
     def test_create_sheet_from_images_invalid_path(self):
         writer = CSVWriter("dummy.xlsx")
         with self.assertRaises(AssertionError):
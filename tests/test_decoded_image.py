@@ -0,0 +1,85 @@
+# External Imports
+import os
+import unittest
+import tempfile
+import cv2
+import numpy as np
+from unittest.mock import patch
+from PIL import Image
+
+# Internal Imports
+from classify.decoded_image import DecodedImage
+from classify.ocr_number_extractor import OCRNumberExtractor
+from classify.ocr_text_extractor import OCRTextExtractor
+
+
+class TestDecodedImage(unittest.TestCase):
+
+    def create_test_image(self, tmpdir: str, filename: str = "test.png") -> str:
+        img = np.full((100, 200, 3), 255, dtype=np.uint8)
+        img[:, :100] = (255, 0, 0)  # Blue in BGR
+        path = os.path.join(tmpdir, filename)
+        cv2.imwrite(path, img)
+        return path
+
+    def test_views_are_memoized(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image = DecodedImage(self.create_test_image(tmpdir))
+            with patch.object(DecodedImage, "read", autospec=True, side_effect=DecodedImage.read) as mock_read:
+                self.assertEqual(image.bgr.shape, (100, 200, 3))
+                self.assertIs(image.gray, image.gray)
+                self.assertIs(image.binary, image.binary)
+                self.assertEqual(image.hsv[0, 0, 0], 120)
+
+                # Reduced views are resized from the decoded pixels instead of decoding again
+                self.assertEqual(image.get_bgr(4).shape, (25, 50, 3))
+                self.assertEqual(mock_read.call_count, 1)
+
+            self.assertEqual(sorted(np.unique(image.binary)), [0, 255])
+            self.assertIs(DecodedImage.of(image), image)
+
+    def test_release(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image = DecodedImage(self.create_test_image(tmpdir))
+            reduced = image.get_bgr(4)
+            self.assertIsNotNone(image.binary)
+
+            # Keeping the reduced scales drops only the full resolution pixels and their views
+            image.release(is_reduced_kept=True)
+            self.assertEqual(list(image._bgr), [4])
+            self.assertIsNone(image._binary)
+            self.assertIs(image.get_bgr(4), reduced)
+
+            image.release()
+            self.assertEqual(image._bgr, {})
+            self.assertEqual(image.bgr.shape, (100, 200, 3))
+
+    def test_pil_fallback(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.gif")
+            Image.new("RGB", (40, 20), color=(0, 0, 255)).save(path)
+            image = DecodedImage(path)
+            self.assertEqual(image.bgr.shape, (20, 40, 3))
+            self.assertEqual(tuple(image.bgr[0, 0]), (255, 0, 0))
+            self.assertEqual(image.get_bgr(2).shape, (10, 20, 3))
+
+    def test_to_pil_shares_memory(self):
+        view = np.zeros((10, 20), dtype=np.uint8)
+        pil_img = DecodedImage.to_pil(view)
+        view[0, 0] = 255
+        self.assertEqual(pil_img.size, (20, 10))
+        self.assertEqual(pil_img.getpixel((0, 0)), 255)
+
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
+    def test_shared_by_extractors(self, mock_ocr):
+        mock_ocr.return_value = "12"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image = DecodedImage(self.create_test_image(tmpdir))
+            with patch.object(DecodedImage, "read", autospec=True, side_effect=DecodedImage.read) as mock_read:
+                self.assertEqual(OCRTextExtractor().extract_text_from_image(image), "12")
+                self.assertEqual(OCRNumberExtractor.extract_number_from_image(image), "12")
+                self.assertEqual(mock_read.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# External Imports
+import copy
+import os
+import unittest
+import tempfile
+import cv2
+import numpy as np
+
+# Internal Imports
+from classify.digit_template_recognizer import DigitTemplateRecognizer
+
+
+def render_box(number: str) -> np.ndarray:
+    """Renders a number in white on a dark box, like a grayscale crop of a blue index box."""
+    img = np.full((60, 30 * len(number) + 20), 80, dtype=np.uint8)
+    cv2.putText(img, number, (10, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 255, 2)
+    return img
+
+
+class TestDigitTemplateRecognizer(unittest.TestCase):
+
+    def test_segment(self):
+        digits = DigitTemplateRecognizer.segment(DigitTemplateRecognizer.binarize(render_box("907")))
+        self.assertEqual(len(digits), 3)
+
+    def test_learn_and_recognize(self):
+        recognizer = DigitTemplateRecognizer()
+        self.assertEqual(recognizer.recognize(render_box("12")), ("", 0.0))
+
+        self.assertTrue(recognizer.learn(render_box("0123456789"), "0123456789"))
+        self.assertFalse(recognizer.learn(render_box("12"), "123"))
+        self.assertEqual(len(recognizer), 10)
+
+        number, confidence = recognizer.recognize(render_box("4071"))
+        self.assertEqual(number, "4071")
+        self.assertTrue(recognizer.is_confident(confidence))
+
+    def test_save_and_load(self):
+        recognizer = DigitTemplateRecognizer(template_size=(12, 18))
+        recognizer.learn(render_box("0123456789"), "0123456789")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "digits.npz")
+            recognizer.save(path)
+            loaded = DigitTemplateRecognizer.load(path)
+
+        self.assertEqual(loaded.template_size, (12, 18))
+        self.assertEqual(len(loaded), 10)
+        self.assertEqual(loaded.recognize(render_box("58"))[0], "58")
+
+
+    def test_merge_learned_templates(self):
+        recognizer = DigitTemplateRecognizer()
+        recognizer.learn(render_box("01234"), "01234")
+
+        # A worker learns on a copy, and only its new templates are merged back
+        worker_recognizer = copy.copy(recognizer)
+        worker_recognizer.learn(render_box("56789"), "56789")
+        recognizer.add_vectors(*worker_recognizer.get_templates(len(recognizer)))
+
+        self.assertEqual(len(recognizer), 10)
+        self.assertEqual("".join(recognizer.labels), "0123456789")
+        self.assertEqual(recognizer.recognize(render_box("9051"))[0], "9051")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,22 @@
+# External Imports
+import hashlib
+import os
+import tempfile
+import unittest
+
+# Internal Imports
+from utils.file_hash import FileHash
+
+
+class TestFileHash(unittest.TestCase):
+
+    def test_get_sha256(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "data.bin")
+            with open(path, "wb") as f:
+                f.write(b"abc" * 1000)
+            self.assertEqual(FileHash.get_sha256(path, chunk_size=7), hashlib.sha256(b"abc" * 1000).hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
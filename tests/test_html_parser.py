@@ -1,7 +1,10 @@
 # External Imports
+import requests
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
-from scrape.html_parser import HTMLParser
+from scrape.html_parser import HTMLParser, lxml_etree
+from scrape.http_cache import HTTPMetadataCache
 
 
 class TestHTMLParser(unittest.TestCase):
@@ -18,6 +21,95 @@ class TestHTMLParser(unittest.TestCase):
         result = HTMLParser.extract_img_urls(html)
         self.assertEqual(result, expected)
 
+    def test_iter_img_urls_chunked(self):
+        html = """
+        <html><body>
+        <img src="image1.jpg" />
+        <p>text &amp; <IMG SRC="image2.png"></p>
+        <img />
+        <img src="image3.jpg?a=1&amp;b=2">
+        </body></html>
+        """
+        # Split the HTML mid-tag, the tokenizer must carry state between chunks
+        chunks = [html[i:i + 7] for i in range(0, len(html), 7)]
+        result = list(HTMLParser.iter_img_urls(chunks, backend='html.parser'))
+        self.assertEqual(result, ["image1.jpg", "image2.png", "image3.jpg?a=1&b=2"])
+        self.assertEqual(result, HTMLParser.extract_img_urls(html))
+
+    @unittest.skipIf(lxml_etree is None, "lxml is not installed")
+    def test_iter_img_urls_lxml(self):
+        html = '<html><body><img src="image1.jpg"/><img/><img src="image2.png"></body></html>'
+        chunks = [html[i:i + 5] for i in range(0, len(html), 5)]
+        self.assertEqual(list(HTMLParser.iter_img_urls(chunks, backend='lxml')), ["image1.jpg", "image2.png"])
+
+    def test_extract_img_renditions(self):
+        html = """
+        <html><body>
+        <img src="data:image/gif;base64,R0lGOD" data-src="/uploads/a-300x200.jpg"
+             data-srcset="/uploads/a-300x200.jpg 300w, /uploads/a-1024x683.jpg 1024w">
+        <picture><source srcset="/uploads/b-768x512.jpg 768w"><img src="/uploads/b.jpg"></picture>
+        <img src="http://www.example.com/uploads/a-1024x683.jpg">
+        </body></html>
+        """
+        result = HTMLParser.extract_img_renditions(html, base_url="http://www.example.com/gallery/")
+        self.assertEqual(result, ["http://www.example.com/uploads/a-1024x683.jpg",
+                                  "http://www.example.com/uploads/b.jpg"])
+
+    @patch("scrape.html_parser.HTMLParser.iter_html_chunks")
+    def test_get_all_image_urls_from_site_renditions(self, mock_iter_html_chunks):
+        mock_iter_html_chunks.return_value = iter(['<img src="img1-150x150.jpg" ', 'srcset="img1.jpg 1200w">'])
+        result = HTMLParser.get_all_image_urls_from_site("http://test.com/page", rendition_policy="largest")
+        self.assertEqual(result, ["http://test.com/img1.jpg"])
+
+    def test_extract_links(self):
+        html = """
+        <a href="page2.html#section">Page 2</a>
+        <a href="/page2.html">Page 2 again</a>
+        <a href="mailto:someone@example.com">Mail</a>
+        <a href="https://other.com/">Other</a>
+        <a>No link</a>
+        """
+        self.assertEqual(HTMLParser.extract_links(html, base_url="http://example.com/index.html"),
+                         ["http://example.com/page2.html", "https://other.com/"])
+
+    def test_iter_img_urls_invalid_backend(self):
+        with self.assertRaises(AssertionError):
+            list(HTMLParser.iter_img_urls(["<img src='a.jpg'>"], backend='html5lib'))
+
+    @patch("scrape.html_parser.requests.get")
+    def test_iter_img_urls_from_site(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.encoding = "utf-8"
+        body = '<html><body><img src="שלום.jpg"/><img src="image2.png"/></body></html>'.encode("utf-8")
+        # Split a multi-byte character across chunks
+        mock_response.iter_content.return_value = [body[:25], body[25:]]
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        result = list(HTMLParser.iter_img_urls_from_site("http://example.com", backend='html.parser'))
+        self.assertEqual(result, ["שלום.jpg", "image2.png"])
+
+    @patch("scrape.html_parser.HTMLParser.iter_img_urls")
+    @patch("scrape.html_parser.HTMLParser.iter_html_chunks")
+    @patch("scrape.html_parser.HTMLParser.get_html_content")
+    def test_get_all_image_urls_from_site_fallback(self, mock_get_html_content, mock_iter_html_chunks, mock_iter):
+        mock_get_html_content.return_value = '<img src="img1.jpg"/>'
+        mock_iter_html_chunks.return_value = (chunk for chunk in ['<img src="img1.jpg"/>'])
+        mock_iter.side_effect = ValueError("Tokenizer failed")
+        self.assertEqual(HTMLParser.get_all_image_urls_from_site("http://test.com"), ["img1.jpg"])
+
+    @patch("scrape.html_parser.HTMLParser.iter_img_urls")
+    @patch("scrape.html_parser.HTMLParser.iter_html_chunks")
+    @patch("scrape.html_parser.HTMLParser.get_html_content")
+    def test_get_all_image_urls_from_site_request_error(self, mock_get_html_content, mock_iter_html_chunks,
+                                                        mock_iter):
+        mock_iter_html_chunks.return_value = (chunk for chunk in [])
+        for error in [requests.HTTPError("404 Client Error"), requests.exceptions.InvalidURL("bad url")]:
+            mock_iter.side_effect = error
+            with self.assertRaises(type(error)):
+                HTMLParser.get_all_image_urls_from_site("http://test.com")
+        # A failed page is not fetched a second time
+        mock_get_html_content.assert_not_called()
+
     @patch("scrape.html_parser.requests.get")
     def test_get_html_content_success(self, mock_get):
         mock_response = MagicMock()
@@ -30,15 +122,61 @@ class TestHTMLParser(unittest.TestCase):
         self.assertEqual(result, "<html></html>")
         mock_get.assert_called_once_with(url, headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"})
 
-    @patch("scrape.html_parser.HTMLParser.get_html_content")
-    def test_get_all_image_urls_from_site(self, mock_get_html_content):
+    @patch("scrape.html_parser.requests.get")
+    def test_get_html_content_not_modified(self, mock_get):
+        first_response = MagicMock()
+        first_response.status_code = 200
+        first_response.text = "<html>cached</html>"
+        first_response.headers = {"ETag": '"v1"'}
+        not_modified_response = MagicMock()
+        not_modified_response.status_code = 304
+        not_modified_response.text = ""
+        mock_get.side_effect = [first_response, not_modified_response]
+
+        url = "http://example.com"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertEqual(HTMLParser.get_html_content(url, cache=HTTPMetadataCache(tmpdir)),
+                             "<html>cached</html>")
+
+            # A new run revalidates and reuses the cached HTML on a 304
+            self.assertEqual(HTMLParser.get_html_content(url, cache=HTTPMetadataCache(tmpdir)),
+                             "<html>cached</html>")
+            self.assertEqual(mock_get.call_args_list[1].kwargs["headers"]["If-None-Match"], '"v1"')
+            not_modified_response.raise_for_status.assert_not_called()
+
+    @patch("scrape.html_parser.requests.get")
+    def test_iter_html_chunks_cached(self, mock_get):
+        first_response = MagicMock()
+        first_response.status_code = 200
+        first_response.encoding = "iso-8859-8"
+        first_response.headers = {"ETag": '"v1"'}
+        first_response.iter_content.return_value = ['<img src="'.encode(), "שלום.jpg".encode("iso-8859-8"), b'"/>']
+        not_modified_response = MagicMock()
+        not_modified_response.status_code = 304
+        mock_get.return_value.__enter__.side_effect = [first_response, not_modified_response]
+
+        url = "http://example.com"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # The page is stored in the cache while it streams
+            self.assertEqual("".join(HTMLParser.iter_html_chunks(url, cache=HTTPMetadataCache(tmpdir))),
+                             '<img src="שלום.jpg"/>')
+
+            # A new run revalidates and streams the cached page on a 304
+            chunks = list(HTMLParser.iter_html_chunks(url, cache=HTTPMetadataCache(tmpdir), chunk_size=4))
+            self.assertEqual("".join(chunks), '<img src="שלום.jpg"/>')
+            self.assertGreater(len(chunks), 2)
+            self.assertEqual(mock_get.call_args_list[1].kwargs["headers"]["If-None-Match"], '"v1"')
+            not_modified_response.raise_for_status.assert_not_called()
+
+    @patch("scrape.html_parser.HTMLParser.iter_html_chunks")
+    def test_get_all_image_urls_from_site(self, mock_iter_html_chunks):
         sample_html = """
         <html><body>
         <img src="img1.jpg"/>
         <img src="img2.jpg"/>
         </body></html>
         """
-        mock_get_html_content.return_value = sample_html
+        mock_iter_html_chunks.return_value = iter([sample_html[:40], sample_html[40:]])
         url = "http://test.com"
         expected = ["img1.jpg", "img2.jpg"]
 
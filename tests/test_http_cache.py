@@ -0,0 +1,70 @@
+# External Imports
+import os
+import unittest
+import tempfile
+
+# Internal Imports
+from scrape.http_cache import HTTPMetadataCache
+
+
+class TestHTTPMetadataCache(unittest.TestCase):
+
+    def test_conditional_headers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HTTPMetadataCache(tmpdir)
+            self.assertEqual(cache.get_conditional_headers("http://example.com/a.jpg"), {})
+
+            cache.update("http://example.com/a.jpg",
+                         {"ETag": '"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+                         content_length=10)
+            self.assertEqual(cache.get_conditional_headers("http://example.com/a.jpg"), {
+                "If-None-Match": '"abc"',
+                "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT",
+            })
+
+    def test_save_and_reload(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HTTPMetadataCache(tmpdir)
+            cache.update("http://example.com/a.jpg", {"ETag": '"abc"'}, content_length=10, path="a.jpg")
+            cache.store_body("http://example.com/page", b"<html></html>")
+            cache.save()
+
+            reloaded = HTTPMetadataCache(tmpdir)
+            self.assertEqual(len(reloaded), 1)
+            entry = reloaded.get("http://example.com/a.jpg")
+            self.assertEqual(entry["etag"], '"abc"')
+            self.assertIsNone(entry["last_modified"])
+            self.assertEqual(entry["content_length"], 10)
+            self.assertEqual(entry["path"], "a.jpg")
+            self.assertEqual(reloaded.load_body("http://example.com/page"), b"<html></html>")
+            self.assertIsNone(reloaded.load_body("http://example.com/other"))
+
+            # No temporary files are left behind
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["bodies", "metadata.json"])
+
+    def test_get_urls_by_sha256(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HTTPMetadataCache(tmpdir)
+            cache.update("http://example.com/b.jpg", {}, content_length=10, path="1.jpg", sha256="aa")
+            cache.update("http://example.com/a.jpg", {}, content_length=10, path="2.jpg", sha256="aa")
+            cache.update("http://example.com/c.jpg", {}, content_length=10, path="3.jpg", sha256="bb")
+            cache.update("http://example.com/page", {}, content_length=13)
+            self.assertEqual(cache.get_urls_by_sha256(), {"aa": "http://example.com/a.jpg",
+                                                          "bb": "http://example.com/c.jpg"})
+
+    def test_remove(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HTTPMetadataCache(tmpdir)
+            cache.update("http://example.com/page", {"ETag": '"abc"'}, content_length=13)
+            cache.store_body("http://example.com/page", b"<html></html>")
+            cache.remove("http://example.com/page")
+            self.assertIsNone(cache.get("http://example.com/page"))
+            self.assertIsNone(cache.load_body("http://example.com/page"))
+
+    def test_invalid_params(self):
+        with self.assertRaises(AssertionError):
+            HTTPMetadataCache(123)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,13 @@
 # External Imports
+import hashlib
 import os
 import unittest
 import tempfile
 from unittest.mock import patch, MagicMock
 
 # Internal Imports
+from archive.content_store import ContentStore
+from scrape.http_cache import HTTPMetadataCache
 from scrape.image_downloader import ImageDownloader
 
 
@@ -51,6 +54,273 @@ class TestImageDownloader(unittest.TestCase):
             file_path = os.path.join(tmpdir, "image_001.jpg")
             self.assertFalse(os.path.exists(file_path))
 
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_success(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Length": "15"}
+        mock_response.iter_content.side_effect = lambda chunk_size: iter([b"fake_", b"image_", b"data"])
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        urls = [f"http://example.com/image{i}.jpg" for i in range(5)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = ImageDownloader(max_workers=3).download_images_concurrently(urls, output_dir=tmpdir)
+
+            # Results are returned in the same order as the URLs
+            self.assertEqual([result.url for result in results], urls)
+            for idx, result in enumerate(results):
+                self.assertTrue(result.ok)
+                self.assertEqual(result.status, 200)
+                self.assertEqual(result.bytes, len(b"fake_image_data"))
+                self.assertEqual(result.path, os.path.join(tmpdir, f"image_{idx+1:03d}.jpg"))
+                self.assertEqual(result.sha256, hashlib.sha256(b"fake_image_data").hexdigest())
+                with open(result.path, "rb") as f:
+                    self.assertEqual(f.read(), b"fake_image_data")
+
+            # Only the final files are left behind, no temporary files
+            self.assertEqual(len(os.listdir(tmpdir)), 5)
+            self.assertEqual(mock_get.call_count, 5)
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_failure(self, mock_get):
+        mock_get.side_effect = Exception("Download failed")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = ImageDownloader().download_images_concurrently(["http://example.com/broken.jpg"],
+                                                                     output_dir=tmpdir)
+
+            self.assertFalse(results[0].ok)
+            self.assertIsNone(results[0].path)
+            self.assertEqual(results[0].error, "Download failed")
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "image_001.jpg")))
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_not_modified(self, mock_get):
+        first_response = MagicMock()
+        first_response.status_code = 200
+        first_response.headers = {"ETag": '"v1"'}
+        first_response.iter_content.side_effect = lambda chunk_size: iter([b"fake_image_data"])
+        not_modified_response = MagicMock()
+        not_modified_response.status_code = 304
+        mock_get.return_value.__enter__.side_effect = [first_response, not_modified_response]
+
+        urls = ["http://example.com/image1.jpg"]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = os.path.join(tmpdir, "images")
+            cache_dir = os.path.join(tmpdir, "cache")
+            ImageDownloader(cache=HTTPMetadataCache(cache_dir)).download_images_concurrently(urls, output_dir)
+
+            # A new run sends a conditional request and keeps the existing file
+            results = ImageDownloader(cache=HTTPMetadataCache(cache_dir)).download_images_concurrently(urls,
+                                                                                                      output_dir)
+            self.assertTrue(results[0].ok)
+            self.assertTrue(results[0].not_modified)
+            self.assertEqual(results[0].status, 304)
+            self.assertEqual(results[0].sha256, hashlib.sha256(b"fake_image_data").hexdigest())
+            self.assertEqual(mock_get.call_args_list[0].kwargs["headers"], {})
+            self.assertEqual(mock_get.call_args_list[1].kwargs["headers"], {"If-None-Match": '"v1"'})
+            with open(os.path.join(output_dir, "image_001.jpg"), "rb") as f:
+                self.assertEqual(f.read(), b"fake_image_data")
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_renamed_file_revalidated(self, mock_get):
+        first_response = MagicMock()
+        first_response.status_code = 200
+        first_response.headers = {"ETag": '"v1"'}
+        first_response.iter_content.side_effect = lambda chunk_size: iter([b"fake_image_data"])
+        not_modified_response = MagicMock()
+        not_modified_response.status_code = 304
+        mock_get.return_value.__enter__.side_effect = [first_response, not_modified_response, not_modified_response]
+
+        urls = ["http://example.com/image1.jpg"]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = os.path.join(tmpdir, "images")
+            cache = HTTPMetadataCache(os.path.join(tmpdir, "cache"))
+            content_store = ContentStore(os.path.join(tmpdir, "store"))
+            ImageDownloader(cache=cache).download_images_concurrently(urls, output_dir)
+            os.rename(os.path.join(output_dir, "image_001.jpg"), os.path.join(output_dir, "123.jpg"))
+
+            # The image renamed to its index number is found by its content, with and without a content store
+            for downloader in [ImageDownloader(cache=cache), ImageDownloader(cache=cache, content_store=content_store)]:
+                results = downloader.download_images_concurrently(urls, output_dir)
+                self.assertTrue(results[0].not_modified)
+                self.assertEqual(results[0].path, os.path.join(output_dir, "123.jpg"))
+                self.assertEqual(mock_get.call_args_list[-1].kwargs["headers"], {"If-None-Match": '"v1"'})
+            self.assertEqual([f for f in os.listdir(output_dir) if not f.startswith(".")], ["123.jpg"])
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_missing_file_not_revalidated(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"ETag": '"v1"'}
+        mock_response.iter_content.side_effect = lambda chunk_size: iter([b"fake_image_data"])
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        urls = ["http://example.com/image1.jpg"]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HTTPMetadataCache(os.path.join(tmpdir, "cache"))
+            ImageDownloader(cache=cache).download_images_concurrently(urls, tmpdir)
+            os.remove(os.path.join(tmpdir, "image_001.jpg"))
+
+            # The file is gone, so the request must not be conditional
+            ImageDownloader(cache=cache).download_images_concurrently(urls, tmpdir)
+            self.assertEqual(mock_get.call_args_list[1].kwargs["headers"], {})
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "image_001.jpg")))
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_resume(self, mock_get):
+        def broken_stream(chunk_size):
+            yield b"fake_"
+            raise IOError("Connection reset")
+
+        interrupted_response = MagicMock()
+        interrupted_response.status_code = 200
+        interrupted_response.headers = {"Content-Length": "15", "ETag": '"v1"'}
+        interrupted_response.iter_content.side_effect = broken_stream
+        partial_response = MagicMock()
+        partial_response.status_code = 206
+        partial_response.headers = {"Content-Range": "bytes 5-14/15", "ETag": '"v1"'}
+        partial_response.iter_content.side_effect = lambda chunk_size: iter([b"image_", b"data"])
+        mock_get.return_value.__enter__.side_effect = [interrupted_response, partial_response]
+
+        urls = ["http://example.com/image1.jpg"]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = ImageDownloader().download_images_concurrently(urls, tmpdir)
+            self.assertFalse(results[0].ok)
+
+            # The partial file is kept instead of a truncated image
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "image_001.jpg")))
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "image_001.jpg.part")))
+
+            results = ImageDownloader().download_images_concurrently(urls, tmpdir)
+            self.assertTrue(results[0].ok)
+            self.assertEqual(results[0].resumed_from, 5)
+            self.assertEqual(results[0].bytes, 15)
+            self.assertEqual(results[0].sha256, hashlib.sha256(b"fake_image_data").hexdigest())
+            self.assertEqual(mock_get.call_args_list[1].kwargs["headers"],
+                             {"Range": "bytes=5-", "If-Range": '"v1"'})
+            self.assertEqual(os.listdir(tmpdir), ["image_001.jpg"])
+            with open(os.path.join(tmpdir, "image_001.jpg"), "rb") as f:
+                self.assertEqual(f.read(), b"fake_image_data")
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_resume_restarts_on_full_response(self, mock_get):
+        full_response = MagicMock()
+        full_response.status_code = 200
+        full_response.headers = {"Content-Length": "15"}
+        full_response.iter_content.side_effect = lambda chunk_size: iter([b"fake_image_data"])
+        mock_get.return_value.__enter__.return_value = full_response
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # A stale partial download the server does not honour the range for
+            filename = os.path.join(tmpdir, "image_001.jpg")
+            with open(f"{filename}.part", "wb") as f:
+                f.write(b"stale")
+            with open(f"{filename}.part.json", "w") as f:
+                f.write('{"url": "http://example.com/image1.jpg", "expected_length": 15}')
+
+            results = ImageDownloader().download_images_concurrently(["http://example.com/image1.jpg"], tmpdir)
+            self.assertTrue(results[0].ok)
+            self.assertEqual(results[0].resumed_from, 0)
+            with open(filename, "rb") as f:
+                self.assertEqual(f.read(), b"fake_image_data")
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_resume_restarts_on_range_not_satisfiable(self, mock_get):
+        not_satisfiable_response = MagicMock()
+        not_satisfiable_response.status_code = 416
+        not_satisfiable_response.headers = {"Content-Range": "bytes */15"}
+        full_response = MagicMock()
+        full_response.status_code = 200
+        full_response.headers = {"Content-Length": "15"}
+        full_response.iter_content.side_effect = lambda chunk_size: iter([b"fake_image_data"])
+        mock_get.return_value.__enter__.side_effect = [not_satisfiable_response, full_response]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # A stale partial download the server can no longer serve the range of
+            filename = os.path.join(tmpdir, "image_001.jpg")
+            with open(f"{filename}.part", "wb") as f:
+                f.write(b"stale_partial")
+            with open(f"{filename}.part.json", "w") as f:
+                f.write('{"url": "http://example.com/image1.jpg", "expected_length": 20, "etag": "\\"v1\\""}')
+
+            results = ImageDownloader().download_images_concurrently(["http://example.com/image1.jpg"], tmpdir)
+            self.assertTrue(results[0].ok)
+            self.assertEqual(results[0].resumed_from, 0)
+            self.assertEqual(mock_get.call_args_list[0].kwargs["headers"],
+                             {"Range": "bytes=13-", "If-Range": '"v1"'})
+            self.assertEqual(mock_get.call_args_list[1].kwargs["headers"], {})
+            self.assertEqual(os.listdir(tmpdir), ["image_001.jpg"])
+            with open(filename, "rb") as f:
+                self.assertEqual(f.read(), b"fake_image_data")
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_incomplete(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Length": "100"}
+        mock_response.iter_content.side_effect = lambda chunk_size: iter([b"fake_image_data"])
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = ImageDownloader().download_images_concurrently(["http://example.com/image1.jpg"], tmpdir)
+
+            # A body shorter than Content-Length is never promoted to the final name
+            self.assertFalse(results[0].ok)
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "image_001.jpg")))
+
+    @patch("scrape.image_downloader.requests.Session.get")
+    def test_download_images_concurrently_duplicates(self, mock_get):
+        bodies = {"http://example.com/a.jpg": b"artwork", "http://example.com/a-2.jpg": b"artwork",
+                  "http://example.com/b.jpg": b"other"}
+
+        def get(url, **kwargs):
+            mock_response = MagicMock()
+            mock_response.status_code = 200
+            mock_response.headers = {}
+            mock_response.iter_content.side_effect = lambda chunk_size: iter([bodies[url]])
+            mock_context = MagicMock()
+            mock_context.__enter__.return_value = mock_response
+            return mock_context
+        mock_get.side_effect = get
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = os.path.join(tmpdir, "images")
+            downloader = ImageDownloader(content_store=ContentStore(os.path.join(tmpdir, "store")))
+            results = downloader.download_images_concurrently(list(bodies), output_dir)
+
+            self.assertEqual([result.duplicate_of for result in results], [None, "image_001.jpg", None])
+            self.assertEqual(ContentStore.load_duplicates(output_dir), {"image_002.jpg": "image_001.jpg"})
+
+    def test_write_response_to_file_interrupted(self):
+        def broken_stream(chunk_size):
+            yield b"partial"
+            raise IOError("Connection reset")
+
+        mock_response = MagicMock()
+        mock_response.iter_content.side_effect = broken_stream
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "image_001.jpg")
+            with self.assertRaises(IOError):
+                ImageDownloader.write_response_to_file(mock_response, filename, chunk_size=4)
+
+            # Neither the final file nor the temporary file should exist
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_invalid_params(self):
+        with self.assertRaises(AssertionError):
+            ImageDownloader(max_workers=0)
+        with self.assertRaises(AssertionError):
+            ImageDownloader(max_connections_per_host="4")
+        with self.assertRaises(AssertionError):
+            ImageDownloader(chunk_size=0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,10 +2,17 @@
 import os
 import unittest
 import tempfile
-from unittest.mock import patch
+import numpy as np
+import cv2
+from unittest.mock import MagicMock, patch
 
 # Internal Imports
+from archive.content_store import ContentStore
 from archive.image_name_organizer import ImageNameOrganizer
+from classify.decoded_image import DecodedImage
+from classify.digit_template_recognizer import DigitTemplateRecognizer
+from classify.ocr_result_cache import OCRResultCache
+from classify.ocr_text_extractor import OCRTextExtractor
 
 
 class TestImageNameOrganizer(unittest.TestCase):
@@ -39,6 +46,226 @@ class TestImageNameOrganizer(unittest.TestCase):
             # Verify the number of OCR calls
             self.assertEqual(mock_extract.call_count, 3)
 
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_number_from_image")
+    def test_duplicates_skipped(self, mock_extract):
+        mock_extract.return_value = "123"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fname in ["image_001.jpg", "image_002.jpg"]:
+                with open(os.path.join(tmpdir, fname), "w") as f:
+                    f.write("fake image data")
+            ContentStore.save_duplicates(tmpdir, {"image_002.jpg": "image_001.jpg"})
+
+            ImageNameOrganizer.rename_images_in_folder(tmpdir)
+
+            # Only the canonical copy is OCRed and the manifest follows its new name
+            mock_extract.assert_called_once_with(os.path.join(tmpdir, "image_001.jpg"), digit_recognizer=None,
+                                                 confidences={})
+            self.assertIn("image_002.jpg", os.listdir(tmpdir))
+            self.assertEqual(ContentStore.load_duplicates(tmpdir), {"image_002.jpg": "123.jpg"})
+
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_number_from_image")
+    def test_near_duplicates_reuse_ocr(self, mock_extract):
+        mock_extract.return_value = "123"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rng = np.random.default_rng(0)
+            img = cv2.resize(rng.integers(0, 255, size=(6, 8, 3), dtype=np.uint8), (320, 240),
+                             interpolation=cv2.INTER_CUBIC)
+            cv2.imwrite(os.path.join(tmpdir, "a.png"), img)
+            cv2.imwrite(os.path.join(tmpdir, "b.jpg"), cv2.resize(img, (160, 120)))
+
+            cv2.imwrite(os.path.join(tmpdir, "c.png"), 255 - img)
+
+            for rename_images in [ImageNameOrganizer.rename_images_in_folder,
+                                  lambda folder_path, **kwargs: ImageNameOrganizer.rename_images_in_folder_parallel(
+                                      folder_path, max_workers=2, use_processes=False, **kwargs)]:
+                mock_extract.reset_mock()
+                for fname, new_fname in [("123.jpg", "a.png"), ("123_2.jpg", "b.jpg"), ("123_3.jpg", "c.png")]:
+                    if os.path.exists(os.path.join(tmpdir, fname)):
+                        os.rename(os.path.join(tmpdir, fname), os.path.join(tmpdir, new_fname))
+
+                rename_images(tmpdir, near_duplicate_max_distance=6)
+
+                # OCR ran once for the near-duplicates, which got the same number, and once for the other image
+                self.assertEqual(mock_extract.call_count, 2)
+                self.assertEqual(sorted(f for f in os.listdir(tmpdir) if not f.startswith(".")),
+                                 ["123.jpg", "123_2.jpg", "123_3.jpg"])
+                self.assertEqual(ContentStore.load_duplicates(tmpdir), {})
+
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_number_from_image")
+    def test_text_extractor_shares_decode(self, mock_extract):
+        numbers = {"a.png": "123", "b.png": None, "c.png": "123"}
+        # The number extractor reads the pixels the text extractor decoded
+        mock_extract.side_effect = lambda image, digit_recognizer=None, confidences=None: \
+            numbers[os.path.basename(image.image_path)] if image.get_gray(4) is not None else None
+        ocr_backend = MagicMock()
+        ocr_backend.image_to_string.return_value = "text"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for i, fname in enumerate(numbers):
+                cv2.imwrite(os.path.join(tmpdir, fname), np.full((40, 60, 3), 80 * i, dtype=np.uint8))
+
+            for rename_images in [ImageNameOrganizer.rename_images_in_folder,
+                                  lambda folder_path, **kwargs: ImageNameOrganizer.rename_images_in_folder_parallel(
+                                      folder_path, max_workers=2, use_processes=False, **kwargs)]:
+                for fname, new_fname in [("123.jpg", "a.png"), ("123_2.jpg", "c.png")]:
+                    if os.path.exists(os.path.join(tmpdir, fname)):
+                        os.rename(os.path.join(tmpdir, fname), os.path.join(tmpdir, new_fname))
+                        os.remove(os.path.join(tmpdir, os.path.splitext(fname)[0] + ".txt"))
+
+                with patch.object(DecodedImage, "read", autospec=True, side_effect=DecodedImage.read) as mock_read:
+                    rename_images(tmpdir, text_extractor=OCRTextExtractor(ocr_backend=ocr_backend))
+
+                    # Every image was decoded once, for both its text and its number
+                    self.assertEqual(mock_read.call_count, 3)
+                self.assertEqual(sorted(f for f in os.listdir(tmpdir) if not f.startswith(".")),
+                                 ["123.jpg", "123.txt", "123_2.jpg", "123_2.txt", "b.png", "b.txt"])
+                with open(os.path.join(tmpdir, "123_2.txt"), encoding="utf-8") as f:
+                    self.assertEqual(f.read(), "text")
+
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_number_from_image")
+    def test_rename_images_in_folder_parallel(self, mock_extract):
+        numbers = {"a.jpg": "123", "b.png": None, "c.jpeg": "456"}
+        mock_extract.side_effect = lambda file_path, digit_recognizer=None, confidences=None: \
+            numbers[os.path.basename(file_path)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fname in list(numbers) + ["document.txt"]:
+                with open(os.path.join(tmpdir, fname), "w") as f:
+                    f.write(fname)
+            ContentStore.save_duplicates(tmpdir, {"d.jpg": "a.jpg"})
+            with open(os.path.join(tmpdir, "d.jpg"), "w") as f:
+                f.write("a.jpg")
+
+            ImageNameOrganizer.rename_images_in_folder_parallel(tmpdir, max_workers=2, use_processes=False)
+
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             [".duplicates.json", ".numbers.json", ".rename_journal.json", "123.jpg", "456.jpg",
+                              "b.png", "d.jpg", "document.txt"])
+            with open(os.path.join(tmpdir, "456.jpg")) as f:
+                self.assertEqual(f.read(), "c.jpeg")
+            self.assertEqual(mock_extract.call_count, 3)
+            self.assertEqual(ContentStore.load_duplicates(tmpdir), {"d.jpg": "123.jpg"})
+
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_numbers_from_images")
+    def test_rename_images_in_folder_parallel_batched(self, mock_extract):
+        numbers = {"a.jpg": "123", "b.png": None, "c.jpeg": "456"}
+
+        batch_lengths = []
+
+        def extract(file_paths, digit_recognizer=None, confidences=None):
+            # The images arrive lazily, decoded one at a time
+            file_paths = list(file_paths)
+            batch_lengths.append(len(file_paths))
+
+            # Only the montage of a.jpg reports a confidence
+            confidences.update({file_path: 0.9 for file_path in file_paths if file_path.endswith("a.jpg")})
+            return {file_path: numbers[os.path.basename(file_path)] for file_path in file_paths}
+        mock_extract.side_effect = extract
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fname in numbers:
+                with open(os.path.join(tmpdir, fname), "w") as f:
+                    f.write(fname)
+
+            ImageNameOrganizer.rename_images_in_folder_parallel(tmpdir, max_workers=2, use_processes=False,
+                                                                batch_size=2)
+
+            # The images were OCRed two at a time
+            self.assertEqual(batch_lengths, [2, 1])
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             [".numbers.json", ".rename_journal.json", "123.jpg", "456.jpg", "b.png"])
+
+            # The numbers and their confidences are recorded under the new names
+            self.assertEqual(ImageNameOrganizer.load_numbers(tmpdir),
+                             {"123.jpg": {"number": "123", "confidence": 0.9},
+                              "456.jpg": {"number": "456", "confidence": None}})
+
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_number_from_image")
+    def test_digit_recognizer_learns_in_workers(self, mock_extract):
+        numbers = {"a.jpg": "1", "b.jpg": "2", "c.jpg": "3"}
+
+        def extract(file_path, digit_recognizer=None, confidences=None):
+            # Every worker learns the digit of its image
+            number = numbers[os.path.basename(file_path)]
+            digit_recognizer.add_vectors(np.ones((1, digit_recognizer.vectors.shape[1]), dtype=np.float32),
+                                         np.array([number]))
+            return number
+        mock_extract.side_effect = extract
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fname in numbers:
+                with open(os.path.join(tmpdir, fname), "w") as f:
+                    f.write(fname)
+
+            digit_recognizer = DigitTemplateRecognizer()
+            ImageNameOrganizer.rename_images_in_folder_parallel(tmpdir, max_workers=2, use_processes=False,
+                                                                digit_recognizer=digit_recognizer)
+
+            # The templates learned by the workers were merged into the caller's bank, once each
+            self.assertEqual(sorted(digit_recognizer.labels), ["1", "2", "3"])
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             [".numbers.json", ".rename_journal.json", "1.jpg", "2.jpg", "3.jpg"])
+
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_number_from_image")
+    def test_ocr_cache(self, mock_extract):
+        numbers = {"a.jpg": "123", "b.png": None}
+
+        def extract(file_path, digit_recognizer=None, confidences=None):
+            confidences[file_path] = 0.95
+            return numbers[os.path.basename(file_path)]
+        mock_extract.side_effect = extract
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            with OCRResultCache(os.path.join(tmpdir, "ocr.sqlite")) as cache:
+                for fname in numbers:
+                    with open(os.path.join(images_dir, fname), "w") as f:
+                        f.write(fname)
+                ImageNameOrganizer.rename_images_in_folder_parallel(images_dir, max_workers=1,
+                                                                    use_processes=False, ocr_cache=cache)
+
+                # The same images arrive again in a refreshed archive
+                os.rename(os.path.join(images_dir, "123.jpg"), os.path.join(images_dir, "a.jpg"))
+                ImageNameOrganizer.rename_images_in_folder(images_dir, ocr_cache=cache)
+
+                # The second run got both results (including "no number") from the cache
+                self.assertEqual(sorted(os.listdir(images_dir)),
+                                 [".numbers.json", ".rename_journal.json", "123.jpg", "b.png"])
+                self.assertEqual(mock_extract.call_count, 2)
+                self.assertEqual(cache.get_stats()["hits"], 2)
+
+                # The cached number keeps the confidence recorded by the first run
+                self.assertEqual(ImageNameOrganizer.load_numbers(images_dir),
+                                 {"123.jpg": {"number": "123", "confidence": 0.95}})
+
+    @patch("classify.ocr_number_extractor.OCRNumberExtractor.extract_number_from_image")
+    def test_rename_collisions(self, mock_extract):
+        numbers = {"a.jpg": "7", "b.jpg": "7", "c.png": "8", "d.jpg": None}
+        mock_extract.side_effect = lambda file_path, digit_recognizer=None, confidences=None: \
+            numbers[os.path.basename(file_path)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fname in list(numbers) + ["8.jpg"]:
+                with open(os.path.join(tmpdir, fname), "w") as f:
+                    f.write(fname)
+            numbers["8.jpg"] = "9"
+            ContentStore.save_duplicates(tmpdir, {"e.jpg": "b.jpg"})
+
+            ImageNameOrganizer.rename_images_in_folder(tmpdir)
+
+            # Images with the same number are never overwritten, the names are resolved in sorted order
+            contents = {}
+            for fname in os.listdir(tmpdir):
+                with open(os.path.join(tmpdir, fname)) as f:
+                    contents[fname] = f.read()
+            self.assertEqual({name: content for name, content in contents.items() if not name.startswith(".")},
+                             {"7.jpg": "a.jpg", "7_2.jpg": "b.jpg", "8.jpg": "c.png", "9.jpg": "8.jpg",
+                              "d.jpg": "d.jpg"})
+            self.assertEqual(ContentStore.load_duplicates(tmpdir), {"e.jpg": "7_2.jpg"})
+
     def test_invalid_file_type_skipped(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             with open(os.path.join(tmpdir, "document.txt"), "w") as f:
@@ -0,0 +1,68 @@
+# External Imports
+import unittest
+
+# Internal Imports
+from scrape.image_url_normalizer import ImageURLNormalizer
+
+
+class TestImageURLNormalizer(unittest.TestCase):
+
+    def test_parse_srcset(self):
+        self.assertEqual(ImageURLNormalizer.parse_srcset("a-300x200.jpg 300w, a.jpg 1024w"),
+                         [("a-300x200.jpg", 300), ("a.jpg", 1024)])
+        self.assertEqual(ImageURLNormalizer.parse_srcset("a.jpg 1x, a@2.jpg 2x"), [("a.jpg", None), ("a@2.jpg", None)])
+        self.assertEqual(ImageURLNormalizer.parse_srcset("a,b.jpg 300w, c.jpg"), [("a,b.jpg", 300), ("c.jpg", None)])
+        self.assertEqual(ImageURLNormalizer.parse_srcset("  "), [])
+
+        # Commas need no whitespace after them
+        self.assertEqual(ImageURLNormalizer.parse_srcset("a-300x200.jpg 300w,a-1024x683.jpg 1024w"),
+                         [("a-300x200.jpg", 300), ("a-1024x683.jpg", 1024)])
+        self.assertEqual(ImageURLNormalizer.parse_srcset("a.jpg, b.jpg 2x,c.jpg"),
+                         [("a.jpg", None), ("b.jpg", None), ("c.jpg", None)])
+
+    def test_normalize_url(self):
+        normalizer = ImageURLNormalizer(base_url="https://www.example.com/gallery/page/")
+        self.assertEqual(normalizer.normalize_url("../img/a.jpg#top"), "https://www.example.com/gallery/img/a.jpg")
+        self.assertEqual(normalizer.normalize_url("//cdn.example.com/a.jpg"), "https://cdn.example.com/a.jpg")
+        self.assertEqual(normalizer.normalize_url("HTTP://WWW.Example.com/A.jpg"), "http://www.example.com/A.jpg")
+        self.assertIsNone(normalizer.normalize_url("data:image/gif;base64,R0lGOD"))
+        self.assertIsNone(normalizer.normalize_url("javascript:void(0)"))
+        self.assertEqual(ImageURLNormalizer(force_scheme="https").normalize_url("http://example.com/a.jpg"),
+                         "https://example.com/a.jpg")
+
+    def test_artwork_key_and_width(self):
+        key = ImageURLNormalizer.get_artwork_key("https://www.example.com/uploads/a-300x200.jpg")
+        self.assertEqual(key, ImageURLNormalizer.get_artwork_key("http://example.com/uploads/a.jpg"))
+        self.assertNotEqual(key, ImageURLNormalizer.get_artwork_key("http://example.com/uploads/a-2.jpg"))
+        self.assertEqual(ImageURLNormalizer.get_width_from_url("http://example.com/a-300x200.jpg"), 300)
+        self.assertIsNone(ImageURLNormalizer.get_width_from_url("http://example.com/a.jpg"))
+
+    def test_select_renditions_largest(self):
+        tags = [
+            {"src": "data:image/gif;base64,R0lGOD", "data-src": "http://example.com/a-300x200.jpg",
+             "data-srcset": "http://example.com/a-300x200.jpg 300w, http://example.com/a-1024x683.jpg 1024w"},
+            {"src": "http://example.com/b-150x150.jpg"},
+            {"src": "https://www.example.com/a.jpg"},
+        ]
+        self.assertEqual(ImageURLNormalizer().select_renditions(tags),
+                         ["https://www.example.com/a.jpg", "http://example.com/b-150x150.jpg"])
+
+    def test_select_renditions_closest(self):
+        tags = [{"src": "http://example.com/a.jpg",
+                 "srcset": "http://example.com/a-300x200.jpg 300w, http://example.com/a-1024x683.jpg 1024w"}]
+        normalizer = ImageURLNormalizer(policy="closest", target_width=800)
+        self.assertEqual(normalizer.select_renditions(tags), ["http://example.com/a-1024x683.jpg"])
+        normalizer = ImageURLNormalizer(policy="closest", target_width=5000)
+        self.assertEqual(normalizer.select_renditions(tags), ["http://example.com/a.jpg"])
+
+    def test_invalid_params(self):
+        with self.assertRaises(AssertionError):
+            ImageURLNormalizer(policy="smallest")
+        with self.assertRaises(AssertionError):
+            ImageURLNormalizer(policy="closest")
+        with self.assertRaises(AssertionError):
+            ImageURLNormalizer(force_scheme="ftp")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# External Imports
+import csv
+import os
+import sqlite3
+import tempfile
+import unittest
+from PIL import Image
+
+# Internal Imports
+from archive.content_store import ContentStore
+from archive.index_exporter import IndexExporter, IndexRecord, ParquetIndexExporter, SQLiteIndexExporter
+from utils.file_hash import FileHash
+
+
+class TestIndexExporter(unittest.TestCase):
+
+    def create_images(self, tmpdir):
+        for fname, size in [("12.jpg", (40, 30)), ("3.png", (20, 10)), ("3_2.jpg", (10, 20)),
+                            ("untitled.jpg", (5, 5)), ("copy.jpg", (5, 5))]:
+            Image.new("RGB", size, color="red").save(os.path.join(tmpdir, fname))
+        ContentStore.save_duplicates(tmpdir, {"copy.jpg": "untitled.jpg"})
+
+    def test_iter_records(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.create_images(tmpdir)
+            sha256 = FileHash.get_sha256(os.path.join(tmpdir, "12.jpg"))
+
+            records = list(IndexExporter.iter_records(tmpdir, urls_by_sha256={sha256: "https://example.com/a.jpg"}))
+            self.assertEqual([record.filename for record in records], ["3.png", "3_2.jpg", "12.jpg", "untitled.jpg"])
+            self.assertEqual([record.index_number for record in records], [3, 3, 12, None])
+            self.assertEqual(records[2], IndexRecord(12, "12.jpg", os.path.join(tmpdir, "12.jpg"), sha256, 40, 30,
+                                                     url="https://example.com/a.jpg"))
+
+            # With the numbers manifest of the renames, only the images named after a number get one,
+            # with its confidence
+            numbers = {"3.png": {"number": "3", "confidence": 0.9}, "12.jpg": {"number": "12", "confidence": None}}
+            records = list(IndexExporter.iter_records(tmpdir, numbers=numbers))
+            self.assertEqual([(record.index_number, record.ocr_confidence) for record in records],
+                             [(3, 0.9), (None, None), (12, None), (None, None)])
+
+    def test_get_exporter_class(self):
+        self.assertIs(IndexExporter.get_exporter_class("index.db"), SQLiteIndexExporter)
+        self.assertIs(IndexExporter.get_exporter_class("index.PARQUET"), ParquetIndexExporter)
+        with self.assertRaises(ValueError):
+            IndexExporter.get_exporter_class("index.xlsx")
+
+    def test_exporter_is_abstract(self):
+        with self.assertRaises(TypeError):
+            IndexExporter("index.csv")
+
+    def test_export_csv_and_sqlite(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            self.create_images(images_dir)
+
+            csv_path = os.path.join(tmpdir, "index.csv")
+            self.assertEqual(IndexExporter.export_folder(images_dir, csv_path), 4)
+            with open(csv_path, encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(list(rows[0]), IndexRecord.get_column_names())
+            self.assertEqual([(row["index_number"], row["width"], row["url"]) for row in rows],
+                             [("3", "20", ""), ("3", "10", ""), ("12", "40", ""), ("", "5", "")])
+
+            # Exporting again replaces the previous index
+            db_path = os.path.join(tmpdir, "index.sqlite")
+            for _ in range(2):
+                IndexExporter.export_folder(images_dir, db_path)
+            with sqlite3.connect(db_path) as connection:
+                self.assertEqual(connection.execute("SELECT filename FROM images WHERE index_number = 3 "
+                                                    "ORDER BY filename").fetchall(), [("3.png",), ("3_2.jpg",)])
+                self.assertEqual(connection.execute("SELECT COUNT(*) FROM images").fetchone()[0], 4)
+                indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+                self.assertEqual(indexes, {"images_index_number", "images_sha256"})
+
+    @unittest.skipIf(not ParquetIndexExporter.is_available(), "pyarrow is not installed")
+    def test_export_parquet(self):
+        import pyarrow.parquet
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            self.create_images(images_dir)
+
+            parquet_path = os.path.join(tmpdir, "index.parquet")
+            IndexExporter.export_folder(images_dir, parquet_path)
+            table = pyarrow.parquet.read_table(parquet_path)
+            self.assertEqual(table.column_names, IndexRecord.get_column_names())
+            self.assertEqual(table.column("index_number").to_pylist(), [3, 3, 12, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
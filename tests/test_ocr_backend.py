@@ -0,0 +1,94 @@
+# External Imports
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from PIL import Image
+
+# Internal Imports
+from classify.ocr_backend import OCRBackend, PytesseractBackend, TesserocrBackend
+
+
+class TestOCRBackend(unittest.TestCase):
+
+    def tearDown(self):
+        OCRBackend._default = None
+        OCRBackend._default_pid = None
+
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
+    def test_pytesseract_backend(self, mock_ocr):
+        mock_ocr.return_value = "123"
+        img = Image.new("L", (10, 10))
+        backend = PytesseractBackend()
+
+        self.assertEqual(backend.image_to_string(img), "123")
+        mock_ocr.assert_called_with(img)
+        backend.image_to_string(img, lang="heb", config="--psm 6")
+        mock_ocr.assert_called_with(img, lang="heb", config="--psm 6")
+
+    @patch("classify.ocr_backend.tesserocr", None)
+    def test_get_default_without_tesserocr(self):
+        backend = OCRBackend.get_default()
+        self.assertIsInstance(backend, PytesseractBackend)
+        self.assertIs(OCRBackend.get_default(), backend)
+
+        # A forked worker process creates its own backend
+        with patch("classify.ocr_backend.os.getpid", return_value=-1):
+            self.assertIsNot(OCRBackend.get_default(), backend)
+
+    def test_parse_config(self):
+        self.assertEqual(TesserocrBackend.parse_config(""), (None, {}))
+        self.assertEqual(TesserocrBackend.parse_config("--psm 7 -c tessedit_char_whitelist=0123456789"),
+                         (7, {"tessedit_char_whitelist": "0123456789"}))
+
+    @patch("classify.ocr_backend.tesserocr")
+    def test_tesserocr_backend_reuses_engine(self, mock_tesserocr):
+        api = MagicMock()
+        api.GetUTF8Text.return_value = "456"
+        mock_tesserocr.PyTessBaseAPI.return_value = api
+        img = Image.new("L", (10, 10))
+
+        backend = TesserocrBackend()
+        for _ in range(3):
+            self.assertEqual(backend.image_to_string(img, lang="eng", config="--psm 7"), "456")
+
+        # The model is loaded once and reused for every call
+        mock_tesserocr.PyTessBaseAPI.assert_called_once_with(lang="eng", psm=7)
+        self.assertEqual(api.SetImage.call_count, 3)
+
+        backend.close()
+        api.End.assert_called_once()
+
+    @patch("classify.ocr_backend.tesserocr")
+    def test_tesserocr_backend_close_all_threads(self, mock_tesserocr):
+        apis = [MagicMock(), MagicMock(), MagicMock()]
+        mock_tesserocr.PyTessBaseAPI.side_effect = apis
+        img = Image.new("L", (10, 10))
+
+        backend = TesserocrBackend()
+        threads = [threading.Thread(target=backend.image_to_string, args=(img,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # The engines of the worker threads are ended by the closing thread as well
+        backend.close()
+        apis[0].End.assert_called_once()
+        apis[1].End.assert_called_once()
+
+        # A closed backend creates a new engine when it is used again
+        backend.image_to_string(img)
+        self.assertEqual(mock_tesserocr.PyTessBaseAPI.call_count, 3)
+
+    def test_backend_is_abstract(self):
+        with self.assertRaises(TypeError):
+            OCRBackend()
+
+    @patch("classify.ocr_backend.tesserocr", None)
+    def test_tesserocr_backend_missing(self):
+        with self.assertRaises(AssertionError):
+            TesserocrBackend()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# External Imports
+import unittest
+from unittest.mock import MagicMock
+from PIL import Image
+
+# Internal Imports
+from classify.ocr_montage import OCRMontage
+
+
+class TestOCRMontage(unittest.TestCase):
+
+    def test_build_layout(self):
+        montage = OCRMontage(padding=5, max_canvas_width=100)
+        crops = [Image.new("L", (20, 10)), Image.new("L", (10, 20)), Image.new("L", (30, 10))]
+        canvas, boxes, layout = montage.build(crops)
+
+        # Cells are 40x30, so two fit in a row of at most 100 pixels
+        self.assertEqual(layout, (40, 30, 2))
+        self.assertEqual(canvas.size, (80, 60))
+        self.assertEqual(boxes, [(5, 5, 20, 10), (45, 5, 10, 20), (5, 35, 30, 10)])
+
+    def test_assign_words(self):
+        data = {
+            "text": ["12", "", "7", "34", "99"],
+            "left": [5, 0, 5, 45, 500],
+            "top": [5, 0, 40, 5, 5],
+            "width": [10, 0, 10, 10, 10],
+            "height": [10, 0, 10, 10, 10],
+        }
+        texts = OCRMontage.assign_words(data, n_crops=3, layout=(40, 30, 2))
+        self.assertEqual(texts, ["12", "34", "7"])
+
+    def test_assign_confidences(self):
+        data = {
+            "text": ["12", "", "7", "34", "8"],
+            "left": [5, 0, 5, 45, 20],
+            "top": [5, 0, 40, 5, 5],
+            "width": [10, 0, 10, 10, 10],
+            "height": [10, 0, 10, 10, 10],
+            "conf": [96, -1, 80.5, -1, 90],
+        }
+        confidences = OCRMontage.assign_confidences(data, n_crops=3, layout=(40, 30, 2))
+        self.assertEqual(confidences, [0.9, None, 0.805])
+        del data["conf"]
+        self.assertEqual(OCRMontage.assign_confidences(data, n_crops=3, layout=(40, 30, 2)), [None, None, None])
+
+    def test_recognize(self):
+        backend = MagicMock()
+        backend.image_to_data.return_value = {
+            "text": ["5"], "left": [50], "top": [25], "width": [10], "height": [10]
+        }
+        montage = OCRMontage(ocr_backend=backend, padding=20)
+        texts = montage.recognize([Image.new("L", (10, 10)), Image.new("L", (10, 10))])
+
+        self.assertEqual(texts, ["", "5"])
+        backend.image_to_data.assert_called_once()
+        self.assertEqual(montage.recognize([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
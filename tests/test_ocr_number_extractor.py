@@ -7,7 +7,9 @@ from unittest.mock import patch
 import cv2
 
 # Internal Imports
-from classify.ocr_number_extractor import OCRNumberExtractor
+from classify.decoded_image import DecodedImage
+from classify.digit_template_recognizer import DigitTemplateRecognizer
+from classify.ocr_number_extractor import ContourCandidate, OCRNumberExtractor
 
 
 class TestOCRNumberExtractor(unittest.TestCase):
@@ -20,7 +22,7 @@ class TestOCRNumberExtractor(unittest.TestCase):
         cv2.imwrite(path, img)
         return path
 
-    @patch("classify.ocr_number_extractor.pytesseract.image_to_string")
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
     def test_extract_number_full_image_success(self, mock_ocr):
         mock_ocr.return_value = "index 123"
 
@@ -29,7 +31,7 @@ class TestOCRNumberExtractor(unittest.TestCase):
             number = OCRNumberExtractor.extract_number_from_image(img_path)
             self.assertEqual(number, "123")
 
-    @patch("classify.ocr_number_extractor.pytesseract.image_to_string")
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
     def test_extract_number_with_crop_success(self, mock_ocr):
         mock_ocr.return_value = "id: 456"
 
@@ -39,7 +41,7 @@ class TestOCRNumberExtractor(unittest.TestCase):
             number = OCRNumberExtractor.extract_number_from_image(img_path, crop_rects=crop_rect)
             self.assertEqual(number, "456")
 
-    @patch("classify.ocr_number_extractor.pytesseract.image_to_string")
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
     def test_no_number_found(self, mock_ocr):
         mock_ocr.return_value = "no digits here"
 
@@ -48,6 +50,156 @@ class TestOCRNumberExtractor(unittest.TestCase):
             result = OCRNumberExtractor.extract_number_from_image(img_path)
             self.assertIsNone(result)
 
+    @patch("classify.ocr_backend.pytesseract.image_to_data")
+    def test_extract_numbers_from_images(self, mock_ocr):
+        # Every blue test image is a single box of 200x100, OCRed at half scale in cells of 140x90
+        mock_ocr.return_value = {
+            "text": ["11", "no", "22"],
+            "left": [30, 170, 170],
+            "top": [30, 20, 50],
+            "width": [20, 20, 20],
+            "height": [20, 20, 20],
+            "conf": [90, 80, 70],
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [self.create_test_image(tmpdir, f"{i}.jpg") for i in range(3)]
+            broken_path = os.path.join(tmpdir, "broken.jpg")
+            with open(broken_path, "w") as f:
+                f.write("not an image")
+            with patch.object(OCRNumberExtractor, "get_masks", wraps=OCRNumberExtractor.get_masks) as mock_masks, \
+                    patch.object(DecodedImage, "release", autospec=True,
+                                 side_effect=DecodedImage.release) as mock_release:
+                confidences = {}
+                numbers = OCRNumberExtractor.extract_numbers_from_images(paths + [broken_path],
+                                                                         confidences=confidences)
+
+            # The boxes of all images were searched in one masking pass,
+            # and every image was released before the montage was OCRed
+            mock_masks.assert_called_once()
+            self.assertEqual(mock_release.call_count, 4)
+
+        self.assertEqual(mock_ocr.call_count, 1)
+        self.assertEqual(numbers, {paths[0]: "11", paths[1]: "22", paths[2]: None, broken_path: None})
+
+        # A cell gets the lowest confidence of its words
+        self.assertEqual(confidences, {paths[0]: 0.9, paths[1]: 0.7})
+
+    def test_rank_contours(self):
+        img = np.zeros((200, 400, 3), dtype=np.uint8)
+        cv2.rectangle(img, (10, 10), (110, 50), (255, 0, 0), -1)    # A small box
+        cv2.rectangle(img, (200, 100), (380, 180), (255, 0, 0), -1)  # The index box
+        cv2.rectangle(img, (10, 150), (12, 152), (255, 0, 0), -1)    # Noise
+        cv2.rectangle(img, (150, 10), (155, 190), (255, 0, 0), -1)   # A thin line
+        cv2.circle(img, (60, 120), 15, (255, 0, 0), -1)              # Not rectangular enough
+
+        candidates = OCRNumberExtractor.get_contour_candidates(img, [None], [90, 50, 50], [130, 255, 255])
+        self.assertTrue(all(isinstance(c, ContourCandidate) for c in candidates))
+        accepted = [c for c in candidates if c.accepted]
+        rejected = [c for c in candidates if not c.accepted]
+
+        self.assertEqual([c.bbox for c in accepted], [(200, 100, 181, 81), (10, 10, 101, 41)])
+        self.assertEqual(len(rejected), 3)
+        reasons = " ".join(c.rejection_reason for c in rejected)
+        self.assertIn("area", reasons)
+        self.assertIn("aspect ratio", reasons)
+        self.assertIn("rectangularity", reasons)
+
+    def test_iter_batch_contour_candidates(self):
+        rois = np.zeros((3, 80, 120, 3), dtype=np.uint8)
+        cv2.rectangle(rois[0], (10, 10), (89, 49), (255, 0, 0), -1)
+        cv2.rectangle(rois[2], (0, 0), (119, 79), (255, 0, 0), -1)
+        other_size = np.zeros((50, 60, 3), dtype=np.uint8)
+        cv2.rectangle(other_size, (5, 5), (54, 34), (255, 0, 0), -1)
+
+        masks = OCRNumberExtractor.get_masks(rois, [90, 50, 50], [130, 255, 255])
+        self.assertEqual(masks.shape, (3, 80, 120))
+        for roi, mask in zip(rois, masks):
+            expected = cv2.inRange(cv2.cvtColor(roi, cv2.COLOR_BGR2HSV), np.array([90, 50, 50]),
+                                   np.array([130, 255, 255]))
+            self.assertTrue(np.array_equal(mask, expected))
+
+        def accepted_bboxes(results):
+            return [[c.bbox for c in candidates if c.accepted] for candidates in results]
+
+        results = OCRNumberExtractor.iter_batch_contour_candidates(rois, batch_size=2)
+        self.assertEqual(accepted_bboxes(results), [[(10, 10, 80, 40)], [], [(0, 0, 120, 80)]])
+
+        # An iterator of ROIs of mixed sizes is split into same-size batches
+        results = OCRNumberExtractor.iter_batch_contour_candidates(iter([rois[0], rois[1], other_size, rois[2]]))
+        self.assertEqual(accepted_bboxes(results),
+                         [[(10, 10, 80, 40)], [], [(5, 5, 50, 30)], [(0, 0, 120, 80)]])
+
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
+    def test_max_ocr_attempts(self, mock_ocr):
+        mock_ocr.return_value = "no digits here"
+        img = np.zeros((100, 1000, 3), dtype=np.uint8)
+        for i in range(6):
+            cv2.rectangle(img, (10 + i * 150, 10), (110 + i * 150, 60), (255, 0, 0), -1)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            img_path = os.path.join(tmpdir, "boxes.png")
+            cv2.imwrite(img_path, img)
+            self.assertIsNone(OCRNumberExtractor.extract_number_from_image(img_path))
+
+        self.assertEqual(mock_ocr.call_count, OCRNumberExtractor.max_ocr_attempts)
+
+    def test_iter_number_crops_from_file_reduced(self):
+        img = np.full((1200, 1600, 3), 255, dtype=np.uint8)
+        cv2.rectangle(img, (40, 40), (439, 199), (255, 0, 0), -1)  # A 400x160 box in the top-left corner
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            img_path = os.path.join(tmpdir, "scan.png")
+            cv2.imwrite(img_path, img)
+            with patch.object(DecodedImage, "read", autospec=True, side_effect=DecodedImage.read) as mock_read:
+                crops = list(OCRNumberExtractor.iter_number_crops_from_file(
+                    img_path, [(0, 0, 600, 800)], [90, 50, 50], [130, 255, 255], detection_reduction=8
+                ))
+
+        # Found at 1/8 scale, OCRed at 1/2 scale (the coarsest keeping the box 48+ pixels high)
+        self.assertEqual([call.args[1] for call in mock_read.call_args_list], [8, 2])
+        self.assertEqual(len(crops), 1)
+        self.assertEqual(crops[0][0], (0, 0, 600, 800))
+        self.assertEqual(crops[0][1].size, (200, 80))
+        self.assertEqual(OCRNumberExtractor.get_ocr_reduction(40), 1)
+
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
+    def test_digit_recognizer_with_tesseract_fallback(self, mock_ocr):
+        mock_ocr.return_value = "index 4071"
+        img = np.full((200, 400, 3), 255, dtype=np.uint8)
+        cv2.rectangle(img, (20, 20), (219, 99), (200, 60, 0), -1)
+        cv2.putText(img, "4071", (45, 78), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (255, 255, 255), 3)
+        recognizer = DigitTemplateRecognizer()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            img_path = os.path.join(tmpdir, "scan.png")
+            cv2.imwrite(img_path, img)
+
+            # The empty bank is not confident, so tesseract reads the box and the recognizer learns it
+            confidences = {}
+            self.assertEqual(OCRNumberExtractor.extract_number_from_image(
+                img_path, detection_reduction=1, digit_recognizer=recognizer, confidences=confidences), "4071")
+            self.assertEqual(mock_ocr.call_count, 1)
+            self.assertEqual(len(recognizer), 4)
+            self.assertEqual(confidences, {})
+
+            # The next time the templates are enough, and their score is the confidence
+            self.assertEqual(OCRNumberExtractor.extract_number_from_image(
+                img_path, detection_reduction=1, digit_recognizer=recognizer, confidences=confidences), "4071")
+            self.assertEqual(mock_ocr.call_count, 1)
+            self.assertGreaterEqual(confidences[img_path], recognizer.min_confidence)
+
+    def test_cache_key_covers_digit_recognizer(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            img_path = self.create_test_image(tmpdir, "scan.jpg")
+            keys = [OCRNumberExtractor.get_cache_key(img_path, "5.0", digit_recognizer=digit_recognizer)
+                    for digit_recognizer in [None, DigitTemplateRecognizer(), DigitTemplateRecognizer(),
+                                             DigitTemplateRecognizer(min_confidence=0.95)]]
+
+        # A number the templates may have recognized is only reused with the same recognizer configuration
+        self.assertEqual(len({keys[0], keys[1], keys[3]}), 3)
+        self.assertEqual(keys[1], keys[2])
+
     def test_invalid_file_path(self):
         with self.assertRaises(AssertionError):
             OCRNumberExtractor.extract_number_from_image("nonexistent.jpg")
@@ -0,0 +1,79 @@
+# External Imports
+import os
+import unittest
+import tempfile
+from unittest.mock import patch
+
+# Internal Imports
+from classify.ocr_result_cache import OCRResultCache
+
+
+class TestOCRResultCache(unittest.TestCase):
+
+    def test_get_and_put(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "cache", "ocr.sqlite")
+            with OCRResultCache(db_path) as cache:
+                self.assertEqual(cache.get("a"), (False, None))
+                cache.put("a", "123")
+                cache.put("b", None)
+                self.assertEqual(cache.get("a"), (True, "123"))
+                self.assertEqual(cache.get("b"), (True, None))
+                self.assertEqual(cache.get_stats(), {"hits": 2, "misses": 1, "hit_rate": 2 / 3, "entries": 2})
+
+            # The results persist across runs
+            with OCRResultCache(db_path) as cache:
+                self.assertEqual(cache.get("a"), (True, "123"))
+
+    def test_make_key(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, "a.jpg")
+            with open(image_path, "wb") as f:
+                f.write(b"image bytes")
+            content_hash = OCRResultCache.get_content_hash(image_path)
+
+        key = OCRResultCache.make_key(content_hash, {"lang": "heb", "config": "--psm 6"}, "tesserocr-5.3.0")
+        self.assertEqual(key, OCRResultCache.make_key(content_hash, {"config": "--psm 6", "lang": "heb"},
+                                                      "tesserocr-5.3.0"))
+        self.assertNotEqual(key, OCRResultCache.make_key(content_hash, {"lang": "eng", "config": "--psm 6"},
+                                                         "tesserocr-5.3.0"))
+        self.assertNotEqual(key, OCRResultCache.make_key(content_hash, {"lang": "heb", "config": "--psm 6"},
+                                                         "pytesseract-5.3.0"))
+
+    def test_evict_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with OCRResultCache(os.path.join(tmpdir, "ocr.sqlite"), max_entries=2) as cache:
+                with patch("classify.ocr_result_cache.time.time", side_effect=[1.0, 2.0, 3.0, 4.0]):
+                    cache.put("a", "1")
+                    cache.put("b", "2")
+                    cache.get("a")
+                    cache.put("c", "3")
+                self.assertEqual(cache.evict(), 1)
+                self.assertEqual(cache.get("b"), (False, None))
+                self.assertEqual(cache.get("a"), (True, "1"))
+
+    def test_evict_during_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with OCRResultCache(os.path.join(tmpdir, "ocr.sqlite"), max_entries=2, evict_interval=3) as cache:
+                for i in range(7):
+                    cache.put(str(i), i)
+                    self.assertLessEqual(len(cache), 2 + cache.n_puts_since_eviction)
+
+                # Evicted after the 3rd and 6th inserts
+                self.assertEqual(len(cache), 3)
+
+    def test_evict_old_entries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with OCRResultCache(os.path.join(tmpdir, "ocr.sqlite"), max_age=60) as cache:
+                with patch("classify.ocr_result_cache.time.time", return_value=0.0):
+                    cache.put("a", "1")
+                cache.put("b", "2")
+
+                # Expired entries are misses even before they are evicted
+                self.assertEqual(cache.get("a"), (False, None))
+                self.assertEqual(cache.evict(), 1)
+                self.assertEqual(len(cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
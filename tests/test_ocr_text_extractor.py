@@ -11,7 +11,7 @@ from classify.ocr_text_extractor import OCRTextExtractor
 
 class TestOCRPipeline(unittest.TestCase):
 
-    @patch("classify.ocr_text_extractor.pytesseract.image_to_string")
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
     def test_save_text_files_in_folder(self, mock_ocr):
         mock_ocr.return_value = "שלום עולם"  # Fake Hebrew OCR result
 
@@ -44,6 +44,31 @@ class TestOCRPipeline(unittest.TestCase):
 
             # Clean archive_images from
 
+    @patch("classify.ocr_backend.pytesseract.image_to_string")
+    def test_save_text_files_incrementally(self, mock_ocr):
+        mock_ocr.side_effect = lambda img, lang=None, config='': f"text {img.size[0]}"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for i, fname in enumerate(["image1.jpg", "image2.png", "image3.png"]):
+                Image.new("RGB", (100 + i, 100), color='white').save(os.path.join(tmpdir, fname))
+
+            OCRTextExtractor().save_text_files_in_folder_parallel(tmpdir, max_workers=2, use_processes=False)
+            self.assertEqual(mock_ocr.call_count, 3)
+            with open(os.path.join(tmpdir, "image3.txt"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), "text 102")
+
+            # Only the image modified after its text file was written is OCRed again
+            image2_mtime = os.path.getmtime(os.path.join(tmpdir, "image2.png"))
+            os.utime(os.path.join(tmpdir, "image2.txt"), (image2_mtime - 10, image2_mtime - 10))
+            OCRTextExtractor().save_text_files_in_folder(tmpdir)
+            self.assertEqual(mock_ocr.call_count, 4)
+            self.assertEqual(OCRTextExtractor.get_images_to_process(tmpdir), [])
+
+            # Unless all text files are rewritten
+            OCRTextExtractor().save_text_files_in_folder_parallel(tmpdir, max_workers=2, use_processes=False,
+                                                                  force=True)
+            self.assertEqual(mock_ocr.call_count, 7)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,83 @@
+# External Imports
+import os
+import unittest
+import tempfile
+import numpy as np
+import cv2
+
+# Internal Imports
+from archive.perceptual_hash_index import BKTree, PerceptualHashIndex
+
+
+class TestBKTree(unittest.TestCase):
+
+    def test_search_matches_linear_scan(self):
+        rng = np.random.default_rng(0)
+        hashes = [int(h) for h in rng.integers(0, 2 ** 63, size=500)]
+        tree = BKTree()
+        for i, h in enumerate(hashes):
+            tree.add(h, i)
+        self.assertEqual(len(tree), 500)
+
+        query = hashes[42] ^ 0b1011  # 3 bits away from item 42
+        expected = sorted((BKTree.hamming_distance(query, h), i) for i, h in enumerate(hashes)
+                          if BKTree.hamming_distance(query, h) <= 10)
+        self.assertEqual(sorted(tree.search(query, 10)), expected)
+        self.assertEqual(tree.search(query, 3)[0], (3, 42))
+
+    def test_empty_tree(self):
+        self.assertEqual(BKTree().search(123, 5), [])
+
+
+class TestPerceptualHashIndex(unittest.TestCase):
+
+    @staticmethod
+    def create_test_image(seed: int, size=(240, 320)) -> np.ndarray:
+        """Creates a smooth random image, so that resizing keeps its structure."""
+        rng = np.random.default_rng(seed)
+        small = rng.integers(0, 255, size=(6, 8, 3), dtype=np.uint8)
+        return cv2.resize(small, (size[1], size[0]), interpolation=cv2.INTER_CUBIC)
+
+    def test_near_duplicates_found(self):
+        for hash_method in PerceptualHashIndex.get_hash_methods():
+            with tempfile.TemporaryDirectory() as tmpdir:
+                original = self.create_test_image(seed=1)
+                cv2.imwrite(os.path.join(tmpdir, "original.png"), original)
+                # A resized and re-encoded copy
+                cv2.imwrite(os.path.join(tmpdir, "copy.jpg"), cv2.resize(original, (160, 120)),
+                            [cv2.IMWRITE_JPEG_QUALITY, 60])
+                cv2.imwrite(os.path.join(tmpdir, "other.png"), self.create_test_image(seed=2))
+
+                index = PerceptualHashIndex(hash_method=hash_method)
+                self.assertEqual(index.add_folder(tmpdir), 3)
+
+                query = index.hash_image(os.path.join(tmpdir, "copy.jpg"))
+                self.assertEqual(PerceptualHashIndex.hash_image_with_params(os.path.join(tmpdir, "copy.jpg"),
+                                                                            hash_method, 8), query)
+                self.assertEqual(index.find_nearest(query, max_distance=6), "copy.jpg")
+                near = [item for _, item in index.find_near_duplicates(query, max_distance=6)]
+                self.assertIn("original.png", near)
+                self.assertNotIn("other.png", near)
+                self.assertEqual(index.group_near_duplicates(max_distance=6), [["copy.jpg", "original.png"]])
+
+    def test_hash_invalid_image(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "broken.jpg")
+            with open(path, "w") as f:
+                f.write("not an image")
+            self.assertIsNone(PerceptualHashIndex().hash_image(path))
+
+    def test_hash_bits(self):
+        gray = self.create_test_image(seed=3)[:, :, 0]
+        self.assertLess(PerceptualHashIndex.dhash(gray), 2 ** 64)
+        self.assertLess(PerceptualHashIndex.phash(gray, hash_size=4), 2 ** 16)
+
+    def test_invalid_params(self):
+        with self.assertRaises(AssertionError):
+            PerceptualHashIndex(hash_method="ahash")
+        with self.assertRaises(AssertionError):
+            PerceptualHashIndex(hash_size=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
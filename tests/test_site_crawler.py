@@ -0,0 +1,97 @@
+# External Imports
+import functools
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Internal Imports
+from scrape.image_downloader import ImageDownloader
+from scrape.site_crawler import SiteCrawler
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSiteCrawler(unittest.TestCase):
+
+    def setUp(self):
+        # A small local site standing in for a portfolio site
+        self.site_dir = tempfile.TemporaryDirectory()
+        pages = {
+            "index.html": '<a href="gallery.html">Gallery</a> <a href="https://external.example.com/">Out</a>'
+                          '<a href="full/a.jpg">Full</a> <img src="full/a-150x150.jpg" srcset="full/a.jpg 1200w">',
+            "gallery.html": '<a href="deep.html">Deeper</a> <a href="index.html#top">Home</a>'
+                            '<img src="/full/b.jpg"> <img src="full/a.jpg">',
+            "deep.html": '<img src="full/c.jpg">',
+        }
+        for filename, body in pages.items():
+            with open(os.path.join(self.site_dir.name, filename), "w") as f:
+                f.write(f"<html><body>{body}</body></html>")
+        os.makedirs(os.path.join(self.site_dir.name, "full"))
+        for filename in ["a.jpg", "b.jpg", "c.jpg"]:
+            with open(os.path.join(self.site_dir.name, "full", filename), "wb") as f:
+                f.write(f"image {filename}".encode())
+
+        handler = functools.partial(QuietHandler, directory=self.site_dir.name)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.site_dir.cleanup()
+
+    def test_crawl(self):
+        crawler = SiteCrawler(max_depth=1, min_delay_per_host=0.0)
+        image_urls = crawler.crawl([f"{self.base_url}/index.html"])
+
+        # The image linked and listed in srcset is found once, the deep page is beyond max_depth
+        self.assertEqual(sorted(image_urls), [f"{self.base_url}/full/a.jpg", f"{self.base_url}/full/b.jpg"])
+
+    def test_crawl_max_pages(self):
+        crawler = SiteCrawler(max_depth=5, max_pages=1, min_delay_per_host=0.0)
+        self.assertEqual(crawler.crawl([f"{self.base_url}/index.html"]), [f"{self.base_url}/full/a.jpg"])
+
+    def test_crawl_politeness_delay(self):
+        crawler = SiteCrawler(max_depth=2, min_delay_per_host=0.2)
+        start = time.monotonic()
+        image_urls = crawler.crawl([f"{self.base_url}/index.html"])
+        self.assertEqual(len(image_urls), 3)
+
+        # Three pages on a single host, so at least two delays
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+
+    def test_crawl_and_download(self):
+        crawler = SiteCrawler(max_depth=2, min_delay_per_host=0.0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = crawler.crawl_and_download([f"{self.base_url}/index.html"], ImageDownloader(), tmpdir)
+
+            self.assertEqual(len(results), 3)
+            self.assertTrue(all(result.ok for result in results))
+            downloaded = set()
+            for result in results:
+                with open(result.path, "rb") as f:
+                    downloaded.add(f.read())
+            self.assertEqual(downloaded, {b"image a.jpg", b"image b.jpg", b"image c.jpg"})
+
+    def test_is_domain_allowed(self):
+        self.assertTrue(SiteCrawler.is_domain_allowed("https://www.example.com/a", ["example.com"]))
+        self.assertTrue(SiteCrawler.is_domain_allowed("https://example.com:8080/a", ["example.com"]))
+        self.assertFalse(SiteCrawler.is_domain_allowed("https://notexample.com/a", ["example.com"]))
+
+    def test_invalid_params(self):
+        with self.assertRaises(AssertionError):
+            SiteCrawler(max_depth=-1)
+        with self.assertRaises(AssertionError):
+            SiteCrawler(max_concurrency_per_host=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
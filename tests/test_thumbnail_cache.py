@@ -0,0 +1,59 @@
+# External Imports
+from io import BytesIO
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+
+# Internal Imports
+from archive.thumbnail_cache import ThumbnailCache
+from utils.file_hash import FileHash
+
+
+class TestThumbnailCache(unittest.TestCase):
+
+    def test_make_thumbnail(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, "img.jpg")
+            Image.new("RGB", (1200, 600), color="red").save(image_path, quality=95)
+            png_path = os.path.join(tmpdir, "img.png")
+            Image.new("RGBA", (300, 300), color=(0, 0, 0, 0)).save(png_path)
+
+            thumbnail = Image.open(BytesIO(ThumbnailCache.make_thumbnail(image_path, (150, 150), 75)))
+            self.assertEqual(thumbnail.format, "JPEG")
+            self.assertEqual(thumbnail.size, (150, 75))
+
+            # Transparent pixels are flattened on white
+            thumbnail = Image.open(BytesIO(ThumbnailCache.make_thumbnail(png_path, (150, 150), 75)))
+            self.assertEqual(thumbnail.size, (150, 150))
+            self.assertGreater(min(thumbnail.getpixel((75, 75))), 240)
+
+    def test_get_cached(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, "img.jpg")
+            Image.new("RGB", (400, 400), color="blue").save(image_path)
+            cache = ThumbnailCache(os.path.join(tmpdir, "thumbs"), size=(100, 100), quality=60)
+
+            with patch.object(ThumbnailCache, "make_thumbnail", side_effect=ThumbnailCache.make_thumbnail) as mock_make:
+                data = cache.get(image_path)
+                self.assertEqual(cache.get(image_path), data)
+                self.assertEqual(mock_make.call_count, 1)
+
+                # The thumbnail can be looked up by the content hash alone, if there is a cache_dir
+                self.assertEqual(cache.get_cached(FileHash.get_sha256(image_path)), data)
+                self.assertIsNone(cache.get_cached("0" * 64))
+                self.assertIsNone(ThumbnailCache().get_cached(FileHash.get_sha256(image_path)))
+
+                # Other thumbnail parameters are cached separately
+                ThumbnailCache(cache.cache_dir, size=(50, 50)).get(image_path)
+                self.assertEqual(mock_make.call_count, 2)
+
+                # An image with new content is resized again
+                Image.new("RGB", (400, 400), color="green").save(image_path)
+                self.assertNotEqual(cache.get(image_path), data)
+                self.assertEqual(mock_make.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
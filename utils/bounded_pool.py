@@ -0,0 +1,88 @@
+# External Imports
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Iterable, Iterator, Optional, Tuple
+
+
+class BoundedPool(object):
+    """
+    A worker pool mapping a function over items with a bounded number of items in flight.
+    Results are yielded in the order of the items, so callers can apply them deterministically,
+    and memory stays flat no matter how many items there are
+    """
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                 use_processes: bool = True):
+        """
+        Initialize the BoundedPool class
+        :param max_workers: The number of workers. If None, the number of cores available to this process
+        :param max_in_flight: The maximal number of submitted items whose results were not yielded yet.
+                              If None, twice the number of workers
+        :param use_processes: Indicates if the workers are processes (for CPU bound work) or threads
+                              (for work that releases the GIL, e.g. waiting on a subprocess)
+        """
+        if max_workers is None:
+            max_workers = self.get_cpu_count()
+        if max_in_flight is None:
+            max_in_flight = 2 * max_workers
+        assert type(max_workers) is int and max_workers > 0, \
+            f'max_workers must be a positive int, got {max_workers}'
+        assert type(max_in_flight) is int and max_in_flight >= max_workers, \
+            f'max_in_flight must be an int >= max_workers, got {max_in_flight}'
+        self.max_workers: int = max_workers
+        self.max_in_flight: int = max_in_flight
+        self.use_processes: bool = use_processes
+
+    @staticmethod
+    def get_cpu_count() -> int:
+        """
+        Returns the number of cores this process may run on
+        :return: The number of usable cores
+        """
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
+    def create_executor(self) -> Executor:
+        """
+        Creates the underlying executor
+        :return: A process or thread pool executor with max_workers workers
+        """
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def imap(self, fn: Callable[..., Any], items: Iterable[Any], *args: Any) -> Iterator[Tuple[Any, Any]]:
+        """
+        Applies fn to every item in the pool, yielding the results in the order of the items.
+        Items are only read from the iterable as results are consumed, so at most max_in_flight are pending.
+        An exception raised by fn is raised when its result is reached
+        :param fn: The function to apply, must be picklable when use_processes is True
+        :param items: The items to apply fn to
+        :param args: Extra positional arguments passed to fn after the item
+        :return: An iterator over (item, fn(item, *args))
+        """
+        exhausted: object = object()
+        pending: Deque[Tuple[Any, Future]] = deque()
+        iterator: Iterator[Any] = iter(items)
+        with self.create_executor() as executor:
+            try:
+                for item in iterator:
+                    pending.append((item, executor.submit(fn, item, *args)))
+                    if len(pending) >= self.max_in_flight:
+                        break
+
+                while pending:
+                    item, future = pending.popleft()
+                    result: Any = future.result()
+
+                    # Refill the window before handing the result over
+                    next_item: Any = next(iterator, exhausted)
+                    if next_item is not exhausted:
+                        pending.append((next_item, executor.submit(fn, next_item, *args)))
+
+                    yield item, result
+            finally:
+                # Do not run the rest of the window if the caller stopped early or an item failed
+                for _, future in pending:
+                    future.cancel()
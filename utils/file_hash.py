@@ -0,0 +1,21 @@
+# External Imports
+import hashlib
+
+
+class FileHash(object):
+    """
+    Content hashes of files, read in chunks so files of any size are hashed in constant memory
+    """
+    @staticmethod
+    def get_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Hashes the bytes of a file
+        :param path: The path of the file
+        :param chunk_size: The number of bytes read at once
+        :return: The hex SHA-256 digest of the file
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()